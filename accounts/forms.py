@@ -8,13 +8,16 @@ from django.contrib.auth import (
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, HTML, Field, Fieldset, Div
 
+from .identity_map import get_identity_map
 from .models import (
     StaffProfile,
     StudentProfile,
     Stream,
+    FORMS,
 )
 
 from exam_module.models import Subject
+from exam_module.reference_data import ReferenceChoiceField, ReferenceMultipleChoiceField
 from exam_module.utils import get_objects_as_choices
 
 User = get_user_model()
@@ -216,12 +219,12 @@ class RegisterStudentForm(forms.Form):
     student_middle_name = forms.CharField(label='Middle Name', required=False)
     student_last_name = forms.CharField(label='Sir Name')
     student_form = forms.IntegerField(label='Form/ Class', min_value=1)
-    student_stream_name = forms.ModelChoiceField(label='Stream', widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    student_stream_name = ReferenceChoiceField(label='Stream', widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
     student_house = forms.CharField(label='Domitory/ House', required=False)
     student_kcpe_marks = forms.IntegerField(label='KCPE Marks', min_value=0, required=False)
     student_date_registered = forms.DateField(label='Date Registered', widget=DateInput, initial=datetime.date.today())
     # the subjects done by the student
-    student_subjects_done_by_student = forms.ModelMultipleChoiceField(label='Select Subjects', widget=forms.CheckboxSelectMultiple, queryset=Subject.objects, to_field_name='name')
+    student_subjects_done_by_student = ReferenceMultipleChoiceField(label='Select Subjects', widget=forms.CheckboxSelectMultiple, queryset=Subject.objects, to_field_name='name')
 
     guardian_first_name = forms.CharField(label='First Name', required=False)
     guardian_middle_name = forms.CharField(label='Middle Name', required=False)
@@ -245,7 +248,7 @@ class GenerateClassListForm(forms.Form):
     '''
 
     form = forms.IntegerField(label='Form/ Class')
-    stream_name = forms.ModelChoiceField(label='Stream', widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    stream_name = ReferenceChoiceField(label='Stream', widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
     file_type = forms.ChoiceField(label='Choose File Type', widget=forms.RadioSelect, choices=(('0', 'PDF'), ('1', 'EXCEL')))
 
     def clean_stream_name(self):
@@ -262,9 +265,8 @@ class GenerateClassListForm(forms.Form):
         form = self.cleaned_data.get('form', '')
         stream_name = self.cleaned_data.get('stream_name', '')
         if form and stream_name:
-            query_set = StudentProfile.objects.filter(stream__name=stream_name)
-            students_list = [s for s in query_set if s.get_form() == form]
-            if not students_list:
+            query_set = StudentProfile.objects.filter(stream__name=stream_name).in_form(form)
+            if not query_set.exists():
                 raise forms.ValidationError('No students found in form %s %s.' %(form, stream_name))
 
     def __init__(self, *args, **kwargs):
@@ -318,8 +320,118 @@ class FilterStudentForm(forms.Form):
     def clean_reg_no(self):
         reg_no = self.cleaned_data.get('reg_no')
         try:
-            StudentProfile.objects.get(reg_no=reg_no)
+            get_identity_map().get(StudentProfile, reg_no=reg_no)
         except StudentProfile.DoesNotExist:
             raise forms.ValidationError('A student with this registration number is not found.')
         return reg_no
-    
\ No newline at end of file
+    
+class StudentSearchForm(forms.Form):
+    '''
+    Query of the students search, optionally within a form.
+    '''
+    q = forms.CharField(max_length=100)
+    form = forms.TypedChoiceField(choices=[('', 'All Forms')] + [(str(form), 'Form %d' % form) for form in FORMS], coerce=int, empty_value=None, required=False)
+
+class ImportStudentsForm(forms.Form):
+    '''
+    Upload a csv or xlsx file of students to register.
+    '''
+    file = forms.FileField(label='CSV/ XLSX File', help_text='Columns: reg_no, first_name, middle_name, last_name, form, stream, house, kcpe_marks, date_registered, subjects (separated by ;), guardian_first_name, guardian_middle_name, guardian_last_name, guardian_phone_number, guardian_email.')
+    date_registered = forms.DateField(label='Date Registered', widget=DateInput, initial=datetime.date.today(), help_text='Used for rows without a date_registered.')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.form_action = 'accounts:import_students'
+        self.helper.form_id = 'import-students-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Import Students',
+                HTML(
+                    '''
+                    {% include '_messages.html' %}
+                    '''
+                ),
+                Field('file'),
+                Field('date_registered'),
+                Submit('submit', 'Import', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
+
+    def clean_file(self):
+        f = self.cleaned_data.get('file')
+        if not f.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Upload a .csv or .xlsx file.')
+        return f
+
+class ListStudentsFilterForm(forms.Form):
+    '''
+    Filter and sort the students list. Without a form only the
+    students in school are listed.
+    '''
+    SORT_CHOICES = [
+        ('reg_no', 'Registration Number'),
+        ('name', 'Name'),
+        ('form', 'Form'),
+    ]
+
+    form = forms.ChoiceField(choices=[('', 'All Forms')] + [(str(form), 'Form %d' % form) for form in FORMS] + [('alumni', 'Alumni')], required=False)
+    stream = ReferenceChoiceField(queryset=Stream.objects.exclude(name='All'), to_field_name='name', empty_label='All Streams', required=False)
+    house = forms.CharField(max_length=20, required=False)
+    name = forms.CharField(label='Name Starts With', max_length=50, required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'get'
+        self.helper.form_action = 'accounts:list_students'
+        self.helper.form_id = 'list-students-filter-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Filter Tags',
+                Div(
+                    Field('form', wrapper_class='col'),
+                    Field('stream', wrapper_class='col'),
+                    Field('house', wrapper_class='col'),
+                    Field('name', wrapper_class='col'),
+                    Field('sort', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Submit('submit', 'Filter', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
+
+class ListStaffFilterForm(forms.Form):
+    '''
+    Filter and sort the staff list.
+    '''
+    SORT_CHOICES = [
+        ('username', 'Username'),
+        ('name', 'Name'),
+    ]
+
+    name = forms.CharField(label='Name Starts With', max_length=50, required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'get'
+        self.helper.form_action = 'accounts:list_staff'
+        self.helper.form_id = 'list-staff-filter-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Filter Tags',
+                Div(
+                    Field('name', wrapper_class='col'),
+                    Field('sort', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Submit('submit', 'Filter', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
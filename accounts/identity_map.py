@@ -0,0 +1,54 @@
+import threading
+
+_local = threading.local()
+
+class IdentityMap:
+    '''
+    The objects looked up while handling one request, by model and
+    field value. The forms validating a request fill it and the view
+    reuses the same objects instead of fetching them again.
+    '''
+
+    def __init__(self):
+        self.objects = {}
+
+    def add(self, obj, field='pk'):
+        self.objects[(type(obj), field, getattr(obj, field))] = obj
+        self.objects[(type(obj), 'pk', obj.pk)] = obj
+        return obj
+
+    def get(self, model, **lookup):
+        '''
+        The object of model with the one field=value of lookup, from
+        the map or the database. Raises model.DoesNotExist like
+        model.objects.get.
+        '''
+        (field, value), = lookup.items()
+        obj = self.objects.get((model, field, value))
+        if obj is None:
+            obj = self.add(model.objects.get(**lookup), field)
+        return obj
+
+def get_identity_map():
+    '''
+    The identity map of the current request. Outside of a request
+    (e.g. in management commands) a new, empty map is returned so
+    that nothing is shared.
+    '''
+    identity_map = getattr(_local, 'identity_map', None)
+    return identity_map if identity_map is not None else IdentityMap()
+
+class IdentityMapMiddleware:
+    '''
+    Give each request its own identity map, dropped with the response.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.identity_map = IdentityMap()
+        try:
+            return self.get_response(request)
+        finally:
+            _local.identity_map = None
@@ -0,0 +1,196 @@
+import datetime
+
+from django import forms
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from exam_module.importers import chunks, get_names_map
+from exam_module.models import SubjectsDoneByStudent, Subject
+from exam_module.report_cache import bump_data_version
+
+from .models import (
+    Stream,
+    StudentProfile,
+    GuardianProfile,
+)
+from .search import index_students
+
+User = get_user_model()
+
+STUDENTS_COLUMNS = ['reg_no', 'first_name', 'last_name', 'form', 'stream']
+
+def get_text(row, column):
+    '''
+    The stripped text of a cell of row, '' if it is missing or None
+    (an empty spreadsheet cell or a json null).
+    '''
+    value = row.get(column)
+    return '' if value is None else str(value).strip()
+
+def clean_student_row(row, streams, subjects, date_registered):
+    '''
+    Validate one admission row. Returns a dict of cleaned values,
+    raises forms.ValidationError with a message for the row otherwise.
+    Subjects are listed in one cell separated by ';' or ','.
+    '''
+    missing = [c for c in STUDENTS_COLUMNS if get_text(row, c) == '']
+    if missing:
+        raise forms.ValidationError('Missing %s.' % ', '.join(missing))
+
+    max_length = StudentProfile._meta.get_field('reg_no').max_length
+    if len(get_text(row, 'reg_no')) > max_length:
+        raise forms.ValidationError('Registration number is longer than %d characters.' % max_length)
+
+    # the names and house must fit their columns
+    for model, column in ((User, 'first_name'), (User, 'middle_name'), (User, 'last_name'), (StudentProfile, 'house')):
+        max_length = model._meta.get_field(column).max_length
+        if len(get_text(row, column)) > max_length:
+            raise forms.ValidationError('%s is longer than %d characters.' % (column.replace('_', ' ').capitalize(), max_length))
+
+    stream = streams.get(get_text(row, 'stream').lower())
+    if stream is None:
+        raise forms.ValidationError('Unknown stream %s.' % row['stream'])
+
+    subject_names = [s.strip().lower() for s in get_text(row, 'subjects').replace(',', ';').split(';') if s.strip()]
+    unknown = [s for s in subject_names if s not in subjects]
+    if unknown:
+        raise forms.ValidationError('Unknown subjects %s.' % ', '.join(unknown))
+
+    return {
+        'reg_no': get_text(row, 'reg_no'),
+        'first_name': get_text(row, 'first_name'),
+        'middle_name': get_text(row, 'middle_name'),
+        'last_name': get_text(row, 'last_name'),
+        'form': forms.IntegerField(min_value=1).clean(row['form']),
+        'stream': stream,
+        'house': get_text(row, 'house'),
+        'kcpe_marks': forms.IntegerField(min_value=0, required=False).clean(row.get('kcpe_marks')),
+        'date_registered': forms.DateField(required=False).clean(row.get('date_registered')) or date_registered,
+        'subjects': [subjects[s] for s in dict.fromkeys(subject_names)],
+        'guardian_first_name': get_text(row, 'guardian_first_name'),
+        'guardian_middle_name': get_text(row, 'guardian_middle_name'),
+        'guardian_last_name': get_text(row, 'guardian_last_name'),
+        'guardian_phone_number': get_text(row, 'guardian_phone_number'),
+        'guardian_email': get_text(row, 'guardian_email'),
+    }
+
+def bulk_create_students(students):
+    '''
+    Create the student users, profiles, guardian users, guardian
+    profiles, subjects done and search entries for a list of cleaned
+    admission rows in one transaction, one bulk insert per table.
+    Usernames follow get_student_and_guardian_forms.
+    '''
+    with transaction.atomic():
+        # signals are not sent by bulk_create
+        bump_data_version()
+        transaction.on_commit(bump_data_version)
+        User.objects.bulk_create([
+            User(
+                username='student_%s' % s['reg_no'],
+                first_name=s['first_name'],
+                middle_name=s['middle_name'],
+                last_name=s['last_name'],
+                is_student=True,
+                password='*',
+            ) for s in students
+        ])
+        User.objects.bulk_create([
+            User(
+                username='guardian_to_student_%s' % s['reg_no'],
+                first_name=s['guardian_first_name'],
+                middle_name=s['guardian_middle_name'],
+                last_name=s['guardian_last_name'],
+                phone_number=s['guardian_phone_number'],
+                email=s['guardian_email'],
+                is_guardian=True,
+                password='*',
+            ) for s in students
+        ])
+        # bulk_create only sets primary keys on postgresql, read them back.
+        user_ids = dict(User.objects.filter(
+            username__in=['student_%s' % s['reg_no'] for s in students] +
+                ['guardian_to_student_%s' % s['reg_no'] for s in students],
+        ).values_list('username', 'pk'))
+
+        profiles = []
+        for s in students:
+            profile = StudentProfile(
+                user_id=user_ids['student_%s' % s['reg_no']],
+                reg_no=s['reg_no'],
+                form=s['form'],
+                stream=s['stream'],
+                house=s['house'],
+                kcpe_marks=s['kcpe_marks'],
+                date_registered=s['date_registered'],
+            )
+            # bulk_create does not call save()
+            profile.cohort_year = profile.get_cohort_year()
+            profiles.append(profile)
+        StudentProfile.objects.bulk_create(profiles)
+        profile_ids = dict(StudentProfile.objects.filter(
+            reg_no__in=[s['reg_no'] for s in students],
+        ).values_list('reg_no', 'pk'))
+
+        GuardianProfile.objects.bulk_create([
+            GuardianProfile(
+                user_id=user_ids['guardian_to_student_%s' % s['reg_no']],
+                student_id=profile_ids[s['reg_no']],
+            ) for s in students
+        ])
+        SubjectsDoneByStudent.objects.bulk_create([
+            SubjectsDoneByStudent(student_id=profile_ids[s['reg_no']], subject=subject)
+            for s in students for subject in s['subjects']
+        ])
+        index_students(list(profile_ids.values()))
+
+def import_students(rows, date_registered=None, chunk_size=500):
+    '''
+    Register students and their guardians from rows, (row_number, dict)
+    pairs as from exam_module.importers.read_rows with the keys in
+    STUDENTS_COLUMNS and optionally middle_name, house, kcpe_marks,
+    date_registered, subjects and guardian_* columns. Rows are saved
+    in chunks of chunk_size, streams and subjects are looked up once.
+    Returns a dict with the number of students 'created' and a list
+    of (row_number, reg_no, message) 'errors'. Rows with errors are
+    skipped, the rest are saved.
+    '''
+    date_registered = date_registered or datetime.date.today()
+    streams = get_names_map(Stream)
+    subjects = get_names_map(Subject)
+
+    report = {'created': 0, 'errors': []}
+    seen = set()
+    for chunk in chunks(rows, chunk_size):
+        students = []
+        for row_number, row in chunk:
+            try:
+                student = clean_student_row(row, streams, subjects, date_registered)
+            except forms.ValidationError as e:
+                report['errors'].append((row_number, str(row.get('reg_no', '')).strip(), ' '.join(e.messages)))
+                continue
+            if student['reg_no'] in seen:
+                report['errors'].append((row_number, student['reg_no'], 'Duplicate registration number in the file.'))
+                continue
+            seen.add(student['reg_no'])
+            student['row_number'] = row_number
+            students.append(student)
+
+        # reg_nos or usernames already in the database
+        reg_nos = [s['reg_no'] for s in students]
+        taken = set(StudentProfile.objects.filter(reg_no__in=reg_nos).values_list('reg_no', flat=True))
+        usernames = User.objects.filter(
+            username__in=['student_%s' % r for r in reg_nos] + ['guardian_to_student_%s' % r for r in reg_nos],
+        ).values_list('username', flat=True)
+        taken.update(u[len('guardian_to_student_'):] if u.startswith('guardian_') else u[len('student_'):] for u in usernames)
+        for s in students:
+            if s['reg_no'] in taken:
+                report['errors'].append((s['row_number'], s['reg_no'], 'This registration number is already taken.'))
+        students = [s for s in students if s['reg_no'] not in taken]
+
+        if students:
+            bulk_create_students(students)
+            report['created'] += len(students)
+
+    report['errors'].sort()
+    return report
@@ -0,0 +1,37 @@
+from django import forms
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importers import import_students
+from exam_module.importers import read_rows
+
+
+class Command(BaseCommand):
+    '''
+    Register students and their guardians from a csv or xlsx file.
+    '''
+    help = 'Import students from a csv or xlsx file with the columns reg_no, first_name, last_name, form, stream and optionally middle_name, house, kcpe_marks, date_registered, subjects and guardian_* columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the csv or xlsx file.')
+        parser.add_argument('--date-registered', help='Date (YYYY-MM-DD) for rows without a date_registered, defaults to today.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of rows saved at a time.')
+
+    def handle(self, *args, **options):
+        date_registered = None
+        if options['date_registered']:
+            try:
+                date_registered = forms.DateField().clean(options['date_registered'])
+            except forms.ValidationError:
+                raise CommandError('Invalid --date-registered %s.' % options['date_registered'])
+
+        try:
+            with open(options['path'], 'rb') as f:
+                report = import_students(read_rows(f, options['path']), date_registered, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for row_number, reg_no, message in report['errors']:
+            self.stderr.write('Row %d (%s): %s' % (row_number, reg_no, message))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported students: %d registered, %d rows with errors.' % (report['created'], len(report['errors']))
+        ))
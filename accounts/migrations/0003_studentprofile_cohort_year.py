@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def populate_cohort_year(apps, schema_editor):
+    '''
+    cohort_year is the year in which the student was in form 1.
+    '''
+    StudentProfile = apps.get_model('accounts', 'StudentProfile')
+    for student in StudentProfile.objects.all():
+        student.cohort_year = student.date_registered.year - student.form + 1
+        student.save(update_fields=['cohort_year'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_auto_20200315_1545'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='cohort_year',
+            field=models.IntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_cohort_year, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='cohort_year',
+            field=models.IntegerField(db_index=True, editable=False),
+        ),
+    ]
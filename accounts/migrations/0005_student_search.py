@@ -0,0 +1,79 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# the full-text index of each database over the search entries
+CREATE_INDEX = {
+    'sqlite': [
+        """CREATE VIRTUAL TABLE accounts_studentsearch_fts USING fts5(
+            reg_no, names, content='accounts_studentsearchentry', content_rowid='student_id',
+            tokenize='unicode61', prefix='2 3'
+        )""",
+        # external content tables are kept in sync by triggers
+        """CREATE TRIGGER accounts_studentsearch_ai AFTER INSERT ON accounts_studentsearchentry BEGIN
+            INSERT INTO accounts_studentsearch_fts (rowid, reg_no, names) VALUES (new.student_id, new.reg_no, new.names);
+        END""",
+        """CREATE TRIGGER accounts_studentsearch_ad AFTER DELETE ON accounts_studentsearchentry BEGIN
+            INSERT INTO accounts_studentsearch_fts (accounts_studentsearch_fts, rowid, reg_no, names) VALUES ('delete', old.student_id, old.reg_no, old.names);
+        END""",
+        """CREATE TRIGGER accounts_studentsearch_au AFTER UPDATE ON accounts_studentsearchentry BEGIN
+            INSERT INTO accounts_studentsearch_fts (accounts_studentsearch_fts, rowid, reg_no, names) VALUES ('delete', old.student_id, old.reg_no, old.names);
+            INSERT INTO accounts_studentsearch_fts (rowid, reg_no, names) VALUES (new.student_id, new.reg_no, new.names);
+        END""",
+    ],
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX accounts_studentsearch_trgm ON accounts_studentsearchentry USING gin (names gin_trgm_ops)',
+    ],
+    'mysql': [
+        'CREATE FULLTEXT INDEX accounts_studentsearch_ft ON accounts_studentsearchentry (reg_no, names)',
+    ],
+}
+
+DROP_INDEX = {
+    'sqlite': [
+        'DROP TRIGGER accounts_studentsearch_ai',
+        'DROP TRIGGER accounts_studentsearch_ad',
+        'DROP TRIGGER accounts_studentsearch_au',
+        'DROP TABLE accounts_studentsearch_fts',
+    ],
+    'postgresql': ['DROP INDEX accounts_studentsearch_trgm'],
+    'mysql': ['DROP INDEX accounts_studentsearch_ft ON accounts_studentsearchentry'],
+}
+
+def create_index(apps, schema_editor):
+    for sql in CREATE_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+def drop_index(apps, schema_editor):
+    for sql in DROP_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+def index_students(apps, schema_editor):
+    StudentProfile = apps.get_model('accounts', 'StudentProfile')
+    StudentSearchEntry = apps.get_model('accounts', 'StudentSearchEntry')
+    rows = StudentProfile.objects.values_list('pk', 'reg_no', 'user__first_name', 'user__middle_name', 'user__last_name')
+    StudentSearchEntry.objects.bulk_create([
+        StudentSearchEntry(student_id=pk, reg_no=reg_no, names=' '.join(name for name in names if name))
+        for pk, reg_no, *names in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchEntry',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='accounts.StudentProfile')),
+                ('reg_no', models.CharField(max_length=20)),
+                ('names', models.CharField(max_length=160)),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_students, migrations.RunPython.noop),
+    ]
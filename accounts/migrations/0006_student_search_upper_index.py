@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# on postgresql istartswith and icontains compile to
+# UPPER("names"::text) LIKE UPPER(%s), the trigram indexes are over
+# the same expressions so that the planner can use them
+CREATE_INDEX = {
+    'postgresql': [
+        'DROP INDEX accounts_studentsearch_trgm',
+        'CREATE INDEX accounts_studentsearch_names_trgm ON accounts_studentsearchentry USING gin (UPPER(names::text) gin_trgm_ops)',
+        'CREATE INDEX accounts_studentsearch_reg_no_trgm ON accounts_studentsearchentry USING gin (UPPER(reg_no::text) gin_trgm_ops)',
+    ],
+}
+
+DROP_INDEX = {
+    'postgresql': [
+        'DROP INDEX accounts_studentsearch_reg_no_trgm',
+        'DROP INDEX accounts_studentsearch_names_trgm',
+        'CREATE INDEX accounts_studentsearch_trgm ON accounts_studentsearchentry USING gin (names gin_trgm_ops)',
+    ],
+}
+
+def create_index(apps, schema_editor):
+    for sql in CREATE_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+def drop_index(apps, schema_editor):
+    for sql in DROP_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_student_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
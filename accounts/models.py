@@ -3,6 +3,9 @@ import datetime
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+# the forms/classes of the school, students past the last one are alumni
+FORMS = range(1, 5)
+
 class User(AbstractUser):
     '''
     Extends the default auth model.
@@ -13,6 +16,12 @@ class User(AbstractUser):
     is_student = models.BooleanField(default=False)
     is_guardian = models.BooleanField(default=False)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # listings are sorted by name
+            models.Index(fields=['last_name', 'first_name'], name='user_name_idx'),
+        ]
+
 class Stream(models.Model):
     '''
     A list of the streams in the institution.
@@ -33,6 +42,16 @@ class StaffProfile(models.Model):
     def __str__(self):
         return '%s\'s Profile' % self.user.first_name
 
+class StudentProfileQuerySet(models.QuerySet):
+
+    def in_form(self, form, year=None):
+        '''
+        Students in the given form/class in the given year. If year
+        is None, use the current year.
+        '''
+        year = year or datetime.date.today().year
+        return self.filter(cohort_year=year - int(form) + 1)
+
 class StudentProfile(models.Model):
     '''
     Contains attributes specific to a student.
@@ -44,9 +63,30 @@ class StudentProfile(models.Model):
     kcpe_marks = models.IntegerField(default=0, null=True, blank=True)
     house = models.CharField(max_length=20, blank=True)
     date_registered = models.DateField()
+    # the year the student was (or would have been) in form 1,
+    # derived from form and date_registered on save.
+    cohort_year = models.IntegerField(db_index=True, editable=False)
+
+    objects = StudentProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the students list is sorted by form
+            models.Index(fields=['cohort_year', 'reg_no'], name='student_cohort_reg_no_idx'),
+        ]
     
     def __str__(self):
         return '%s\'s Profile' % self.user.first_name
+
+    def save(self, *args, **kwargs):
+        self.cohort_year = self.get_cohort_year()
+        super().save(*args, **kwargs)
+
+    def get_cohort_year(self):
+        '''
+        The year in which get_form returns 1.
+        '''
+        return self.date_registered.year - int(self.form) + 1
     
     def get_form(self, year_since_registration=None):
         '''
@@ -78,3 +118,12 @@ class GuardianProfile(models.Model):
     def __str__(self):
         return '%s\'s Profile' % self.user.first_name
 
+class StudentSearchEntry(models.Model):
+    '''
+    The text a student is searched by, kept in sync with the student
+    and user by accounts.search. The full-text index of the database
+    is built over this table by the migrations.
+    '''
+    student = models.OneToOneField(StudentProfile, on_delete=models.CASCADE, primary_key=True, related_name='search_entry')
+    reg_no = models.CharField(max_length=20)
+    names = models.CharField(max_length=160)
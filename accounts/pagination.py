@@ -0,0 +1,113 @@
+import base64
+import binascii
+import functools
+import json
+
+from django.db.models import Q
+
+# rows shown per page of the listings
+PAGE_SIZE = 25
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, length):
+    '''
+    The list of values in cursor, None if it is not a valid cursor
+    of an ordering with length fields.
+    '''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+def get_value(obj, field):
+    return functools.reduce(getattr, field.lstrip('-').split('__'), obj)
+
+def keyset_filter(ordering, values, forward=True):
+    '''
+    A Q object of the rows after (or before, if not forward) the row
+    with values in ordering i.e. (a, b) > (x, y) is written as
+    a > x OR (a = x AND b > y).
+    '''
+    q = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') == forward else 'gt'
+        condition = Q(**{'%s__%s' % (name, lookup): values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            condition &= Q(**{previous.lstrip('-'): value})
+        q |= condition
+    return q
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+class KeysetPage:
+    '''
+    A page of a queryset read with keyset pagination. The rows after
+    or before a cursor are found by the index on the ordering instead
+    of skipping rows with OFFSET, so every page costs the same.
+    The last field of ordering must be unique.
+    '''
+
+    def __init__(self, queryset, ordering, after=None, before=None, size=PAGE_SIZE):
+        self.ordering = ordering
+        after = decode_cursor(after, len(ordering)) if after else None
+        before = decode_cursor(before, len(ordering)) if before else None
+
+        # one more row to know if there is another page
+        if before is not None:
+            rows = list(queryset.filter(keyset_filter(ordering, before, forward=False)).order_by(*reverse_ordering(ordering))[:size + 1])
+            self.has_previous = len(rows) > size
+            self.has_next = True
+            self.object_list = rows[:size][::-1]
+        else:
+            if after is not None:
+                queryset = queryset.filter(keyset_filter(ordering, after))
+            rows = list(queryset.order_by(*ordering)[:size + 1])
+            self.has_previous = after is not None
+            self.has_next = len(rows) > size
+            self.object_list = rows[:size]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def get_cursor(self, obj):
+        return encode_cursor([get_value(obj, field) for field in self.ordering])
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.get_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.get_cursor(self.object_list[0])
+        return None
+
+def get_page_urls(request, page):
+    '''
+    Query strings of the first, previous and next pages of page,
+    keeping the other query parameters (the filters).
+    '''
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    urls = {'first_url': '?%s' % params.urlencode(), 'previous_url': None, 'next_url': None}
+    if page.previous_cursor:
+        params['before'] = page.previous_cursor
+        urls['previous_url'] = '?%s' % params.urlencode()
+        params.pop('before')
+    if page.next_cursor:
+        params['after'] = page.next_cursor
+        urls['next_url'] = '?%s' % params.urlencode()
+    return urls
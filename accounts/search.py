@@ -0,0 +1,90 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import StudentProfile, StudentSearchEntry
+
+# the sqlite full-text table over accounts_studentsearchentry,
+# created by migration 0005
+FTS_TABLE = 'accounts_studentsearch_fts'
+
+# most students returned by a search
+SEARCH_LIMIT = 10
+
+def get_names(first_name, middle_name, last_name):
+    return ' '.join(name for name in (first_name, middle_name, last_name) if name)
+
+def index_students(student_ids):
+    '''
+    Write the search entries of the students with student_ids from
+    their current reg_no and names.
+    '''
+    rows = StudentProfile.objects.filter(pk__in=student_ids).values_list(
+        'pk', 'reg_no', 'user__first_name', 'user__middle_name', 'user__last_name',
+    )
+    entries = [
+        StudentSearchEntry(student_id=pk, reg_no=reg_no, names=get_names(first_name, middle_name, last_name))
+        for pk, reg_no, first_name, middle_name, last_name in rows
+    ]
+    with transaction.atomic():
+        StudentSearchEntry.objects.filter(student_id__in=student_ids).delete()
+        StudentSearchEntry.objects.bulk_create(entries)
+
+def get_terms(query):
+    '''
+    The words of query, lower case. Punctuation is dropped so that
+    the terms are safe to put in a full-text query.
+    '''
+    return re.findall(r'\w+', query.lower())
+
+def sqlite_match(queryset, terms):
+    # "term"* is a prefix query, the index keeps prefixes of 2 and 3
+    # characters so short prefixes are looked up too.
+    match = ' '.join('"%s"*' % term for term in terms)
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT rowid FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), [match],
+    ))
+
+def mysql_match(queryset, terms):
+    match = ' '.join('+%s*' % term for term in terms)
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT student_id FROM accounts_studentsearchentry WHERE MATCH (reg_no, names) AGAINST (%s IN BOOLEAN MODE)', [match],
+    ))
+
+def prefix_match(queryset, terms):
+    # a name starts the names or follows a space. On postgresql these
+    # compile to UPPER(column::text) LIKE UPPER(%s), served by the
+    # trigram indexes over UPPER(names) and UPPER(reg_no) of migration
+    # 0006.
+    for term in terms:
+        queryset = queryset.filter(
+            Q(search_entry__names__istartswith=term)
+            | Q(search_entry__names__icontains=' ' + term)
+            | Q(search_entry__reg_no__istartswith=term)
+        )
+    return queryset
+
+MATCHERS = {
+    'sqlite': sqlite_match,
+    'mysql': mysql_match,
+    'postgresql': prefix_match,
+}
+
+def search_students(query, queryset=None, limit=SEARCH_LIMIT):
+    '''
+    Students whose reg_no or names start with every word of query,
+    e.g. 'wanj' or 'kamau wanj' or '1023', searched in the full-text
+    index of the database. queryset, if given, limits the students.
+    Returns at most limit students sorted by name.
+    '''
+    terms = get_terms(query)
+    if not terms:
+        return []
+    if queryset is None:
+        queryset = StudentProfile.objects.all()
+    match = MATCHERS.get(connection.vendor, prefix_match)
+    return list(match(queryset, terms).select_related('user', 'stream').order_by(
+        'user__last_name', 'user__first_name', 'reg_no',
+    )[:limit])
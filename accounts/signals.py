@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User, StudentProfile
+from .search import index_students
+
+
+@receiver(post_save, sender=StudentProfile)
+def index_student(sender, instance, **kwargs):
+    '''
+    Keep the search entry in sync with the reg_no. Entries of
+    deleted students are deleted with them.
+    '''
+    index_students([instance.pk])
+
+@receiver(post_save, sender=User)
+def index_student_user(sender, instance, **kwargs):
+    '''
+    Keep the search entry in sync with the names.
+    '''
+    student_ids = list(StudentProfile.objects.filter(user=instance).values_list('pk', flat=True))
+    if student_ids:
+        index_students(student_ids)
@@ -1,6 +1,9 @@
 import datetime
+import io
 
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import (
     get_user_model,
 )
@@ -18,7 +21,11 @@ from .forms import (
     GenerateClassListForm,
     FilterStudentForm,
 )
+from .pagination import KeysetPage
+from .search import search_students, prefix_match
+from .identity_map import IdentityMap, get_identity_map
 
+from .importers import import_students
 from .models import (
     StaffProfile,
     StudentProfile,
@@ -492,7 +499,13 @@ class StaffLoginView(WebTest):
         self.page = self.page.form.submit()
         self.assertRedirects(self.page, reverse('accounts:dashboard'))
 
-class StaffListViewTests(TestCase):
+class StaffListViewTests(WebTest):
+
+    def setUp(self):
+        self.url = reverse('accounts:list_staff')
+        for i in range(30):
+            create_user('staff_%02d' % i, PASSWORD, is_staff=True)
+        User.objects.filter(username='staff_07').update(first_name='Jane', last_name='Wanjiru')
 
     def test_requires_login(self):
         '''
@@ -504,6 +517,26 @@ class StaffListViewTests(TestCase):
             reverse('accounts:login')+'?next='+reverse('accounts:list_staff')
         )
 
+    def get_usernames(self, page):
+        return [row.select('td')[0].text for row in page.html.select('#staff-list tbody tr')]
+
+    def test_pages(self):
+        '''
+        Staff are listed a page at a time, the pages link each other.
+        '''
+        page = self.app.get(self.url, user='staff_00')
+        first = self.get_usernames(page)
+        self.assertEqual(first, ['staff_%02d' % i for i in range(25)])
+        page = page.click(linkid='next-page')
+        self.assertEqual(self.get_usernames(page), ['staff_%02d' % i for i in range(25, 30)])
+        self.assertIn('disabled', page.html.find(id='next-page').parent['class'])
+        page = page.click(linkid='previous-page')
+        self.assertEqual(self.get_usernames(page), first)
+
+    def test_filter_by_name(self):
+        page = self.app.get(self.url, {'name': 'wanj', 'sort': 'name'}, user='staff_00')
+        self.assertEqual(self.get_usernames(page), ['staff_07'])
+
 class RegisterStudentViewTests(WebTest):
 
     fixtures = ['streams', 'subjects']
@@ -710,6 +743,31 @@ class StudentProfileModelTests(TestCase):
         )
         self.assertEqual(student_profile.set_form(4, 2017), 1)
         self.assertEqual(student_profile.get_form(), 4)
+
+    def test_in_form(self):
+        '''
+        in_form filters students by form/class in a given year
+        using the stored cohort_year.
+        '''
+        student_user = create_user('student', 'pass', is_student=True)
+        student_profile = create_profile(
+            is_student=True,
+            user=student_user,
+            reg_no='8989',
+            form=2,
+            stream=Stream.objects.create(name='east'),
+            date_registered=datetime.date(2018, 1, 10),
+        )
+        self.assertEqual(student_profile.cohort_year, 2017)
+        for year in range(2017, 2022):
+            form = student_profile.get_form(year)
+            self.assertEqual(list(StudentProfile.objects.in_form(form, year)), [student_profile])
+            self.assertFalse(StudentProfile.objects.in_form(form + 1, year).exists())
+
+        # changing the form moves the student to another cohort
+        student_profile.form = 3
+        student_profile.save()
+        self.assertTrue(StudentProfile.objects.in_form(4, 2019).exists())
     
 class StudentsHomeViewTests(WebTest):
 
@@ -1005,3 +1063,235 @@ class UpdateStudentViewTests(WebTest):
         self.assertEqual(page.form['guardian_last_name'].value, 'new_g-last')
         self.assertEqual(page.form['guardian_phone_number'].value, '07')
         self.assertEqual(page.form['guardian_email'].value, 'new_g@mail.com')
+
+class ImportStudentsTests(WebTest):
+
+    fixtures = ['streams', 'subjects']
+
+    header = 'Reg No,First Name,Last Name,Form,Stream,Date Registered,Subjects,Guardian First Name,Guardian Phone Number\n'
+
+    def rows(self, data):
+        from exam_module.importers import read_rows
+        return read_rows(io.BytesIO((self.header + data).encode()), 'students.csv')
+
+    def test_import_students(self):
+        '''
+        Students, guardians and subjects done are created, bad rows
+        are reported by row number.
+        '''
+        report = import_students(self.rows(
+            '100,first,last,2,North,2020-01-10,Python;mathematics,g-first,07\n'
+            '101,first,last,1,south,2020-01-10,,g-first,07\n'
+            '100,first,last,1,south,2020-01-10,,g-first,07\n'
+            '102,first,last,1,nowhere,2020-01-10,,g-first,07\n'
+            '103,first,last,1,south,2020-01-10,History,g-first,07\n'
+            '104,first,,1,south,2020-01-10,,g-first,07\n'
+        ), chunk_size=2)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([(row, reg_no) for row, reg_no, message in report['errors']], [(4, '100'), (5, '102'), (6, '103'), (7, '104')])
+
+        student = StudentProfile.objects.get(reg_no='100')
+        self.assertEqual(student.user.username, 'student_100')
+        self.assertTrue(student.user.is_student)
+        self.assertEqual(student.stream.name, 'north')
+        self.assertEqual(student.get_form(2020), 2)
+        self.assertIn(student, StudentProfile.objects.in_form(2, 2020))
+        self.assertEqual(student.guardian.user.username, 'guardian_to_student_100')
+        self.assertEqual(student.guardian.user.phone_number, '07')
+        self.assertEqual(
+            sorted(student.subjectsdonebystudent_set.values_list('subject__name', flat=True)),
+            ['Mathematics', 'Python'],
+        )
+
+        # registered students are not imported again
+        report = import_students(self.rows('101,first,last,1,south,2020-01-10,,g-first,07\n'))
+        self.assertEqual(report['created'], 0)
+        self.assertEqual(report['errors'], [(2, '101', 'This registration number is already taken.')])
+
+    def test_constant_queries(self):
+        '''
+        The number of queries does not grow with the number of rows.
+        '''
+        with CaptureQueriesContext(connection) as one_student:
+            import_students(self.rows('200,first,last,1,south,,Python,g,07\n'))
+        with CaptureQueriesContext(connection) as three_students:
+            import_students(self.rows(''.join(
+                '%d,first,last,1,south,,Python,g,07\n' % reg_no for reg_no in (201, 202, 203)
+            )))
+        self.assertEqual(len(three_students), len(one_student))
+
+    def test_import_students_view(self):
+        page = self.app.get(reverse('accounts:import_students'), user='staff')
+        page.form['file'] = ('students.csv', (self.header + '300,first,last,1,south,,Python,g,07\n').encode())
+        page = page.form.submit()
+        self.assertContains(page, '1 students successfully registered.')
+        self.assertTrue(StudentProfile.objects.filter(reg_no='300').exists())
+
+
+class ListStudentsViewTests(WebTest):
+
+    fixtures = ['users', 'student_profiles', 'streams']
+
+    def setUp(self):
+        self.url = reverse('accounts:list_students')
+        # an alumnus, left school in 2018
+        create_profile(
+            is_student=True,
+            user=create_user('student_old', PASSWORD, is_student=True),
+            reg_no='100',
+            form=4,
+            stream=Stream.objects.get(name='north'),
+            date_registered=datetime.date(2018, 1, 1),
+        )
+
+    def get_reg_nos(self, page):
+        return [row.select('td')[0].text for row in page.html.select('#students-list tbody tr')]
+
+    def test_lists_students_in_school(self):
+        page = self.app.get(self.url, user='staff')
+        self.assertEqual(self.get_reg_nos(page), ['1', '2', '3', '4', '5', '6', '7'])
+
+    def test_filters(self):
+        page = self.app.get(self.url, {'stream': 'north'}, user='staff')
+        self.assertEqual(self.get_reg_nos(page), ['4', '5'])
+        page = self.app.get(self.url, {'form': '4', 'sort': 'form'}, user='staff')
+        self.assertEqual(self.get_reg_nos(page), ['4', '5', '6'])
+        page = self.app.get(self.url, {'form': 'alumni'}, user='staff')
+        self.assertEqual(self.get_reg_nos(page), ['100'])
+
+    def test_keyset_page(self):
+        '''
+        Pages of a sort with ties don't skip or repeat students, in
+        both directions.
+        '''
+        queryset = StudentProfile.objects.all()
+        ordering = ['-cohort_year', 'reg_no']
+        expected = list(queryset.order_by(*ordering))
+        page = KeysetPage(queryset, ordering, size=3)
+        pages = [list(page)]
+        while page.next_cursor:
+            page = KeysetPage(queryset, ordering, after=page.next_cursor, size=3)
+            pages.append(list(page))
+        self.assertEqual(sum(pages, []), expected)
+        page = KeysetPage(queryset, ordering, before=page.previous_cursor, size=3)
+        self.assertEqual(list(page), pages[-2])
+        # a tampered cursor starts from the first page
+        self.assertEqual(list(KeysetPage(queryset, ordering, after='not a cursor', size=3)), pages[0])
+
+    def test_runs_constant_queries(self):
+        '''
+        A later page costs the same as the first.
+        '''
+        def get_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                self.app.get(self.url, params, user='staff')
+            # leave out the session and login of the test user
+            return [q for q in queries if not q['sql'].startswith(('SELECT "django_session"', 'SELECT "accounts_user"'))]
+
+        self.app.get(self.url, user='staff')
+        first = get_queries({'sort': 'name'})
+        page = KeysetPage(StudentProfile.objects.all(), ['user__last_name', 'user__first_name', 'reg_no'], size=2)
+        later = get_queries({'sort': 'name', 'after': page.next_cursor})
+        self.assertEqual(len(later), len(first))
+
+
+class StudentSearchTests(WebTest):
+
+    fixtures = ['users', 'student_profiles', 'streams']
+
+    def setUp(self):
+        self.url = reverse('accounts:search_students')
+        user = create_user('student_1023', PASSWORD, is_student=True)
+        user.first_name = 'Wanjiru'
+        user.last_name = 'Kamau'
+        user.save()
+        self.student = create_profile(
+            is_student=True,
+            user=user,
+            reg_no='1023',
+            form=3,
+            stream=Stream.objects.get(name='east'),
+            date_registered=datetime.date(2020, 1, 1),
+        )
+
+    def search(self, query, **kwargs):
+        return [student.reg_no for student in search_students(query, **kwargs)]
+
+    def test_search_by_prefix(self):
+        self.assertEqual(self.search('wanj'), ['1023'])
+        self.assertEqual(self.search('Kamau wa'), ['1023'])
+        self.assertEqual(self.search('102'), ['1023'])
+        self.assertEqual(self.search('wanj otieno'), [])
+        self.assertEqual(self.search('"*()'), [])
+        # the fixture students are indexed as they are loaded
+        self.assertEqual(self.search('user'), ['4', '5', '6'])
+
+    def test_prefix_match(self):
+        '''
+        The matcher of postgresql and other databases matches the
+        start of a name like the full-text indexes do.
+        '''
+        def search(*terms):
+            return sorted(student.reg_no for student in prefix_match(StudentProfile.objects.all(), terms))
+        self.assertEqual(search('wanj'), ['1023'])
+        self.assertEqual(search('kamau', 'wa'), ['1023'])
+        self.assertEqual(search('102'), ['1023'])
+        self.assertEqual(search('anjiru'), [])
+        self.assertEqual(search('amau'), [])
+        self.assertEqual(search('mid'), ['5', '6', '7'])
+        self.assertEqual(search('id'), [])
+
+    def test_kept_in_sync(self):
+        self.student.user.last_name = 'Otieno'
+        self.student.user.save()
+        self.assertEqual(self.search('kamau'), [])
+        self.assertEqual(self.search('otieno'), ['1023'])
+        self.student.reg_no = '2023'
+        self.student.save()
+        self.assertEqual(self.search('1023'), [])
+        self.assertEqual(self.search('2023'), ['2023'])
+        self.student.delete()
+        self.assertEqual(self.search('otieno'), [])
+
+    def test_imported_students_are_indexed(self):
+        from exam_module.importers import read_rows
+        data = 'reg_no,first_name,last_name,form,stream\n300,Achieng,Odhiambo,1,east\n'
+        import_students(read_rows(io.BytesIO(data.encode()), 'students.csv'))
+        self.assertEqual(self.search('achi'), ['300'])
+
+    def test_view(self):
+        page = self.app.get(self.url, {'q': 'wanj'}, user='staff')
+        self.assertEqual(page.json['results'], [{
+            'reg_no': '1023',
+            'name': 'Wanjiru Kamau',
+            'form': 3,
+            'stream': 'east',
+            'url': reverse('accounts:update_student', args=('1023',)),
+        }])
+        page = self.app.get(self.url, {'q': 'wanj', 'form': '2'}, user='staff')
+        self.assertEqual(page.json['results'], [])
+        page = self.app.get(self.url, user='staff', status=400)
+        self.assertIn('q', page.json['errors'])
+
+    def test_requires_login(self):
+        page = self.app.get(self.url, {'q': 'wanj'})
+        self.assertEqual(page.status_code, 302)
+
+
+class IdentityMapTests(TestCase):
+
+    fixtures = ['users', 'student_profiles', 'streams']
+
+    def test_get(self):
+        identity_map = IdentityMap()
+        with self.assertNumQueries(1):
+            student = identity_map.get(StudentProfile, reg_no='2')
+            self.assertIs(identity_map.get(StudentProfile, reg_no='2'), student)
+            self.assertIs(identity_map.get(StudentProfile, pk=student.pk), student)
+        with self.assertRaises(StudentProfile.DoesNotExist):
+            identity_map.get(StudentProfile, reg_no='unknown')
+
+    def test_not_shared_outside_requests(self):
+        get_identity_map().get(StudentProfile, reg_no='2')
+        with self.assertNumQueries(1):
+            get_identity_map().get(StudentProfile, reg_no='2')
@@ -13,6 +13,9 @@ urlpatterns = [
     path('accounts/register/staff/', accounts_views.register_staff, name='register_staff'),
     path('accounts/staff/', accounts_views.ListStaffView.as_view(), name='list_staff'),
     path('accounts/register/student/', accounts_views.RegisterStudentView.as_view(), name='register_student'),
+    path('accounts/import/students/', accounts_views.ImportStudentsView.as_view(), name='import_students'),
+    path('accounts/students/list/', accounts_views.ListStudentsView.as_view(), name='list_students'),
+    path('accounts/students/search/', accounts_views.StudentSearchView.as_view(), name='search_students'),
     path('accounts/filter_student/', accounts_views.FilterStudentView.as_view(), name='filter_student'),
     path('accounts/update/student/<reg_no>/', accounts_views.UpdateStudentView.as_view(), name='update_student'),
     path('accounts/students/', accounts_views.StudentsHomeView.as_view(), name='students_home'),
@@ -1,11 +1,12 @@
 import csv
+import datetime
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.urls import reverse
 from django.views import View
-from django.views.generic import ListView, TemplateView
+from django.views.generic import TemplateView
 from django.contrib.auth import (
     get_user_model,
     authenticate,
@@ -16,7 +17,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django import forms
 from django.utils.translation import gettext as _
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.db.models import Q
 from django.template.loader import get_template, render_to_string
 
 from fpdf import FPDF, HTMLMixin
@@ -35,19 +37,29 @@ from .forms import (
     StudentProfileForm,
     GenerateClassListForm,
     FilterStudentForm,
+    ImportStudentsForm,
+    ListStudentsFilterForm,
+    ListStaffFilterForm,
+    StudentSearchForm,
 )
 from .models import (
     GuardianProfile,
     Stream,
     StudentProfile,
+    FORMS,
 )
+from .pagination import KeysetPage, get_page_urls
+from .search import search_students, get_names
 
 from.helpers import (
     get_student_and_guardian_forms,
     add_subject_done_by_student
 )
 
+from .importers import import_students
+
 from exam_module.models import SubjectsDoneByStudent
+from exam_module.importers import read_rows
 
 User = get_user_model()
 
@@ -85,15 +97,32 @@ def register_staff(request):
         'staff_profile_form': staff_profile_form
     })
 
-class ListStaffView(LoginRequiredMixin, ListView):
+class ListStaffView(LoginRequiredMixin, View):
     '''
-    A list of all the staff members.
+    A page of the staff members, filtered and sorted.
     '''
+    form_class = ListStaffFilterForm
     template_name = 'accounts/list_staff.html'
-    context_object_name = 'staff_list'
+    # keyset orderings, the last field is unique
+    orderings = {
+        'username': ['username'],
+        'name': ['last_name', 'first_name', 'pk'],
+    }
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET or None)
+        queryset = User.objects.filter(is_staff=True).select_related('staff_profile')
+        sort = 'username'
+        if form.is_valid():
+            name = form.cleaned_data.get('name')
+            if name:
+                queryset = queryset.filter(Q(first_name__istartswith=name) | Q(last_name__istartswith=name))
+            sort = form.cleaned_data.get('sort') or sort
 
-    def get_queryset(self):
-        return User.objects.filter(is_staff=True)
+        page = KeysetPage(queryset, self.orderings[sort], request.GET.get('after'), request.GET.get('before'))
+        context = {'form': form, 'staff_list': page}
+        context.update(get_page_urls(request, page))
+        return render(request, self.template_name, context)
 
 class StaffLoginView(View):
     '''
@@ -202,6 +231,33 @@ class RegisterStudentView(LoginRequiredMixin, View):
 
         return render(request, self.template_name, {'form': form})
 
+class ImportStudentsView(LoginRequiredMixin, View):
+    '''
+    Register many students and their guardians from an uploaded
+    csv or xlsx file.
+    '''
+    form_class = ImportStudentsForm
+    template_name = 'accounts/import_students.html'
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class()
+        return render(request, self.template_name, {'form': form})
+
+    def post(self, request, *args, **kwargs):
+        form = self.form_class(request.POST, request.FILES)
+        if form.is_valid():
+            f = form.cleaned_data.get('file')
+            date_registered = form.cleaned_data.get('date_registered')
+
+            report = import_students(read_rows(f, f.name), date_registered)
+            if report['created']:
+                messages.success(request, '%d students successfully registered.' % report['created'])
+            if report['errors']:
+                messages.error(request, '%d rows have errors and were not saved.' % len(report['errors']))
+            return render(request, self.template_name, {'form': self.form_class(), 'report': report})
+
+        return render(request, self.template_name, {'form': form})
+
 class StudentsHomeView(LoginRequiredMixin, View):
     '''
     Quick links to get and manage students.
@@ -231,8 +287,7 @@ class GenerateClassListView(LoginRequiredMixin, View):
             file_type = form.cleaned_data.get('file_type')
 
             # get students
-            query_set = StudentProfile.objects.filter(stream__name=stream_name)
-            students_list = [s for s in query_set if s.get_form() == f]
+            students_list = StudentProfile.objects.filter(stream__name=stream_name).in_form(f).select_related('user')
 
             if file_type == '0':
                 pdf = HtmlPdf()
@@ -299,6 +354,49 @@ class GenerateClassListView(LoginRequiredMixin, View):
 
         return render(request, self.template_name, {'generate_class_list_form': form})
 
+class ListStudentsView(LoginRequiredMixin, View):
+    '''
+    A page of the students, filtered and sorted.
+    '''
+    form_class = ListStudentsFilterForm
+    template_name = 'accounts/list_students.html'
+    # keyset orderings, the last field is unique
+    orderings = {
+        'reg_no': ['reg_no'],
+        'name': ['user__last_name', 'user__first_name', 'reg_no'],
+        'form': ['-cohort_year', 'reg_no'],
+    }
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET or None)
+        year = datetime.date.today().year
+        queryset = StudentProfile.objects.select_related('user', 'stream')
+        form_filter, sort = '', 'reg_no'
+        if form.is_valid():
+            form_filter = form.cleaned_data.get('form')
+            stream = form.cleaned_data.get('stream')
+            house = form.cleaned_data.get('house')
+            name = form.cleaned_data.get('name')
+            if stream:
+                queryset = queryset.filter(stream=stream)
+            if house:
+                queryset = queryset.filter(house__iexact=house)
+            if name:
+                queryset = queryset.filter(Q(user__first_name__istartswith=name) | Q(user__last_name__istartswith=name))
+            sort = form.cleaned_data.get('sort') or sort
+
+        if form_filter == 'alumni':
+            queryset = queryset.filter(cohort_year__lt=year - max(FORMS) + 1)
+        elif form_filter:
+            queryset = queryset.in_form(form_filter, year)
+        else: # students in school
+            queryset = queryset.filter(cohort_year__range=(year - max(FORMS) + 1, year - min(FORMS) + 1))
+
+        page = KeysetPage(queryset, self.orderings[sort], request.GET.get('after'), request.GET.get('before'))
+        context = {'form': form, 'students_list': page}
+        context.update(get_page_urls(request, page))
+        return render(request, self.template_name, context)
+
 class FilterStudentView(LoginRequiredMixin, View):
     '''
     Filter students.
@@ -317,6 +415,31 @@ class FilterStudentView(LoginRequiredMixin, View):
             return redirect('accounts:update_student', reg_no=reg_no)
         return render(request, self.template_name, {'form': form})
 
+class StudentSearchView(LoginRequiredMixin, View):
+    '''
+    Students matching a typed name or reg_no, as json for the
+    typeahead of the filter student page.
+    '''
+    form_class = StudentSearchForm
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        queryset = StudentProfile.objects.all()
+        if form.cleaned_data['form']:
+            queryset = queryset.in_form(form.cleaned_data['form'])
+        students = search_students(form.cleaned_data['q'], queryset)
+        return JsonResponse({'results': [
+            {
+                'reg_no': student.reg_no,
+                'name': get_names(student.user.first_name, student.user.middle_name, student.user.last_name),
+                'form': student.get_form(),
+                'stream': student.stream.name,
+                'url': reverse('accounts:update_student', args=(student.reg_no,)),
+            } for student in students
+        ]})
+
 # common layout
 from .forms import register_update_student_common_layout
 class UpdateStudentView(LoginRequiredMixin, View):
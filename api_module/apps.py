@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+
+class ApiModuleConfig(AppConfig):
+    name = 'api_module'
@@ -0,0 +1,327 @@
+import datetime
+
+from django import forms
+from django.db import transaction
+
+from accounts.models import Stream, StudentProfile
+from accounts.importers import clean_student_row, bulk_create_students
+from exam_module.importers import get_names_map, import_marks
+from exam_module.models import (
+    Subject,
+    ExamType,
+    Term,
+    Exam,
+    GradingSystem,
+    SubjectsDoneByStudent,
+)
+from settings_module.forms import (
+    AddSubjectForm,
+    AddGradingSystemForm,
+    AddExamTypeForm,
+    AddTermForm,
+    AddStreamForm,
+)
+
+class ApiError(Exception):
+    '''
+    Raised by resources to respond with status and the errors as json.
+    '''
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+class ApiField:
+    '''
+    A field of a resource. get reads the value from an object, the
+    relations it follows are listed in select_related and
+    prefetch_related so that querysets join only what the requested
+    fields need.
+    '''
+    def __init__(self, get, select_related=(), prefetch_related=()):
+        self.get = get
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+def attribute(name):
+    return ApiField(lambda obj: getattr(obj, name))
+
+def check_object(data):
+    if not isinstance(data, dict):
+        raise ApiError({'detail': ['Expected an object.']})
+    return data
+
+class Resource:
+    '''
+    A model exposed by the api. Lists are ordered and paged by
+    cursor, a unique indexed column, objects are looked up by it too.
+    filters maps query parameters to lookups. Resources that can be
+    written implement create, update and delete.
+    '''
+    name = None
+    model = None
+    cursor = 'pk'
+    fields = {}
+    filters = {}
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def plan(self, queryset, fields):
+        '''
+        Join the relations read by fields.
+        '''
+        select_related = [r for f in fields for r in self.fields[f].select_related]
+        prefetch_related = [r for f in fields for r in self.fields[f].prefetch_related]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def filter(self, queryset, params):
+        for param, lookup in self.filters.items():
+            value = params.get(param)
+            if value is not None:
+                queryset = lookup(queryset, value) if callable(lookup) else queryset.filter(**{lookup: value})
+        return queryset
+
+    def to_cursor(self, value):
+        '''
+        Parse a cursor from a query parameter.
+        '''
+        if self.cursor == 'pk':
+            try:
+                return int(value)
+            except ValueError:
+                raise ApiError({'after': ['Enter a whole number.']})
+        return value
+
+    def get_cursor(self, obj):
+        return getattr(obj, self.cursor)
+
+    def serialize(self, obj, fields):
+        return {f: self.fields[f].get(obj) for f in fields}
+
+    def create(self, data):
+        '''
+        Returns the response of the created object(s).
+        '''
+        raise ApiError({'detail': ['Method not allowed.']}, status=405)
+
+    def update(self, obj, data):
+        raise ApiError({'detail': ['Method not allowed.']}, status=405)
+
+    def delete(self, obj):
+        raise ApiError({'detail': ['Method not allowed.']}, status=405)
+
+class StudentResource(Resource):
+    name = 'students'
+    model = StudentProfile
+    cursor = 'reg_no'
+    fields = {
+        'reg_no': attribute('reg_no'),
+        'first_name': ApiField(lambda s: s.user.first_name, select_related=['user']),
+        'middle_name': ApiField(lambda s: s.user.middle_name, select_related=['user']),
+        'last_name': ApiField(lambda s: s.user.last_name, select_related=['user']),
+        'form': ApiField(lambda s: s.get_form()),
+        'stream': ApiField(lambda s: s.stream.name, select_related=['stream']),
+        'house': attribute('house'),
+        'kcpe_marks': attribute('kcpe_marks'),
+        'date_registered': attribute('date_registered'),
+        'subjects': ApiField(
+            lambda s: [sd.subject.name for sd in s.subjectsdonebystudent_set.all()],
+            prefetch_related=['subjectsdonebystudent_set__subject'],
+        ),
+        'guardian_phone_number': ApiField(
+            lambda s: s.guardian.user.phone_number if hasattr(s, 'guardian') else '',
+            select_related=['guardian__user'],
+        ),
+    }
+    filters = {
+        'form': lambda queryset, form: queryset.in_form(form) if form.isdigit() else queryset.none(),
+        'stream': 'stream__name',
+        'house': 'house',
+    }
+    # user names are saved on the user
+    user_fields = ['first_name', 'middle_name', 'last_name']
+
+    def create(self, data):
+        '''
+        Register a student and guardian from the columns of an
+        accounts.importers admission row.
+        '''
+        check_object(data)
+        try:
+            student = clean_student_row(data, get_names_map(Stream), get_names_map(Subject), datetime.date.today())
+        except forms.ValidationError as e:
+            raise ApiError({'detail': e.messages})
+        if StudentProfile.objects.filter(reg_no=student['reg_no']).exists():
+            raise ApiError({'reg_no': ['This registration number is already taken.']})
+        bulk_create_students([student])
+        obj = self.plan(self.get_queryset(), self.fields).get(reg_no=student['reg_no'])
+        return self.serialize(obj, self.fields)
+
+    def update(self, obj, data):
+        '''
+        Change the names, stream, house or kcpe_marks of a student,
+        validated like an admission row of the current values with
+        the changes applied.
+        '''
+        check_object(data)
+        unknown = set(data) - set(self.user_fields) - {'stream', 'house', 'kcpe_marks'}
+        if unknown:
+            raise ApiError({f: ['This field can not be updated.'] for f in unknown})
+        row = {
+            'reg_no': obj.reg_no,
+            'first_name': obj.user.first_name,
+            'middle_name': obj.user.middle_name,
+            'last_name': obj.user.last_name,
+            'form': obj.get_form(),
+            'stream': obj.stream.name,
+            'house': obj.house,
+            'kcpe_marks': obj.kcpe_marks,
+        }
+        row.update(data)
+        try:
+            student = clean_student_row(row, get_names_map(Stream), {}, obj.date_registered)
+        except forms.ValidationError as e:
+            raise ApiError({'detail': e.messages})
+        with transaction.atomic():
+            for f in self.user_fields:
+                setattr(obj.user, f, student[f])
+            obj.user.save()
+            obj.stream = student['stream']
+            obj.house = student['house']
+            obj.kcpe_marks = student['kcpe_marks']
+            obj.save()
+        return obj
+
+class ExamResource(Resource):
+    name = 'exams'
+    model = Exam
+    fields = {
+        'id': attribute('pk'),
+        'reg_no': attribute('student_id'),
+        'subject': ApiField(lambda e: e.subject.name, select_related=['subject']),
+        'exam_type': ApiField(lambda e: e.exam_type.name, select_related=['exam_type']),
+        'term': ApiField(lambda e: e.term.name, select_related=['term']),
+        'date_done': attribute('date_done'),
+        'marks': attribute('marks'),
+    }
+    filters = {
+        'reg_no': 'student_id',
+        'subject': 'subject__name',
+        'exam_type': 'exam_type__name',
+        'term': 'term__name',
+    }
+
+    def create(self, data):
+        '''
+        Save the marks of a list of entries with the columns of
+        exam_module.importers.import_marks. Entries with errors are
+        reported and skipped, the rest are saved.
+        '''
+        entries = data if isinstance(data, list) else [data]
+        if not all(isinstance(entry, dict) for entry in entries):
+            raise ApiError({'detail': ['Expected an object or a list of objects.']})
+        return import_marks([(i + 1, entry) for i, entry in enumerate(entries)])
+
+    def delete(self, obj):
+        # the term results are rebuilt by exam_module.signals
+        obj.delete()
+
+class SubjectsDoneByStudentResource(Resource):
+    name = 'subjects_done'
+    model = SubjectsDoneByStudent
+    fields = {
+        'id': attribute('pk'),
+        'reg_no': ApiField(lambda sd: sd.student.reg_no, select_related=['student']),
+        'subject': ApiField(lambda sd: sd.subject.name, select_related=['subject']),
+    }
+    filters = {
+        'reg_no': 'student__reg_no',
+        'subject': 'subject__name',
+    }
+
+    def create(self, data):
+        check_object(data)
+        errors = {}
+        try:
+            student = StudentProfile.objects.get(reg_no=data.get('reg_no'))
+        except StudentProfile.DoesNotExist:
+            errors['reg_no'] = ['No student with this registration number is found.']
+        try:
+            subject = Subject.objects.get(name=data.get('subject'))
+        except Subject.DoesNotExist:
+            errors['subject'] = ['This subject is not found.']
+        if errors:
+            raise ApiError(errors)
+        sd, created = SubjectsDoneByStudent.objects.get_or_create(student=student, subject=subject)
+        return self.serialize(sd, self.fields)
+
+    def delete(self, obj):
+        obj.delete()
+
+class ReferenceResource(Resource):
+    '''
+    The settings models, written with the settings_module forms.
+    '''
+    form_class = None
+
+    def create(self, data):
+        form = self.form_class(check_object(data))
+        if not form.is_valid():
+            raise ApiError(form.errors)
+        return self.serialize(form.save(), self.fields)
+
+    def delete(self, obj):
+        obj.delete()
+
+class SubjectResource(ReferenceResource):
+    name = 'subjects'
+    model = Subject
+    form_class = AddSubjectForm
+    fields = {'id': attribute('pk'), 'name': attribute('name')}
+
+class ExamTypeResource(ReferenceResource):
+    name = 'exam_types'
+    model = ExamType
+    form_class = AddExamTypeForm
+    fields = {'id': attribute('pk'), 'name': attribute('name')}
+
+class TermResource(ReferenceResource):
+    name = 'terms'
+    model = Term
+    form_class = AddTermForm
+    fields = {'id': attribute('pk'), 'name': attribute('name')}
+
+class StreamResource(ReferenceResource):
+    name = 'streams'
+    model = Stream
+    form_class = AddStreamForm
+    fields = {'id': attribute('pk'), 'name': attribute('name')}
+
+class GradingSystemResource(ReferenceResource):
+    name = 'grading_system'
+    model = GradingSystem
+    form_class = AddGradingSystemForm
+    fields = {
+        'id': attribute('pk'),
+        'grade': attribute('grade'),
+        'greatest_lower_bound': attribute('greatest_lower_bound'),
+    }
+
+RESOURCES = {
+    resource.name: resource()
+    for resource in [
+        StudentResource,
+        ExamResource,
+        SubjectsDoneByStudentResource,
+        SubjectResource,
+        ExamTypeResource,
+        TermResource,
+        StreamResource,
+        GradingSystemResource,
+    ]
+}
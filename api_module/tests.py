@@ -0,0 +1,160 @@
+import base64
+import datetime
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.tests import create_user
+from exam_module.tests import run_on_commit_callbacks
+from accounts.models import StudentProfile
+from exam_module.models import (
+    Subject,
+    ExamType,
+    Term,
+    Exam,
+    StudentTermResult,
+)
+
+
+def basic_auth(username, password):
+    credentials = base64.b64encode(('%s:%s' % (username, password)).encode()).decode()
+    return {'HTTP_AUTHORIZATION': 'Basic %s' % credentials}
+
+class ApiTests(TestCase):
+
+    fixtures = ['users','student_profiles', 'subjects', 'terms', 'exam_types', 'streams', 'subjects_done_by_student']
+
+    def setUp(self):
+        create_user('api', 'secret', is_staff=True)
+        self.auth = basic_auth('api', 'secret')
+
+    def url(self, resource, key=None):
+        if key is None:
+            return reverse('api_module:resource_list', args=[resource])
+        return reverse('api_module:resource_detail', args=[resource, key])
+
+    def get(self, url, params=None, status=200):
+        response = self.client.get(url, params or {}, **self.auth)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def send(self, method, url, data, status):
+        response = getattr(self.client, method)(url, json.dumps(data), content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json() if response.content else None
+
+    def create_exam(self, reg_no, marks, exam_type='CAT 1'):
+        return Exam.objects.create(
+            student=StudentProfile.objects.get(reg_no=reg_no),
+            subject=Subject.objects.get(name='Kiswahili'),
+            exam_type=ExamType.objects.get(name=exam_type),
+            term=Term.objects.get(name='1'),
+            date_done=datetime.date.today(),
+            marks=marks,
+        )
+
+    def test_authentication(self):
+        response = self.client.get(self.url('students'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Basic realm="api"')
+        response = self.client.get(self.url('students'), **basic_auth('api', 'wrong'))
+        self.assertEqual(response.status_code, 401)
+        create_user('not_staff', 'secret')
+        response = self.client.get(self.url('students'), **basic_auth('not_staff', 'secret'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_session_writes_need_csrf_token(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.login(username='api', password='secret')
+        self.assertEqual(self.client.get(self.url('subjects')).status_code, 200)
+        response = self.client.post(self.url('subjects'), json.dumps({'name': 'physics'}), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_keyset_pagination(self):
+        '''
+        Pages follow each other by reg_no without gaps or repeats.
+        '''
+        url, reg_nos = self.url('students'), []
+        params = {'limit': 3, 'fields': 'reg_no'}
+        while url:
+            page = self.get(url, params)
+            self.assertLessEqual(len(page['results']), 3)
+            reg_nos += [student['reg_no'] for student in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(reg_nos, sorted(StudentProfile.objects.values_list('reg_no', flat=True)))
+        self.assertEqual(self.get(self.url('students'), {'after': reg_nos[-1]})['results'], [])
+
+    def test_field_selection(self):
+        page = self.get(self.url('students'), {'fields': 'reg_no,stream', 'stream': 'north'})
+        self.assertEqual(page['results'], [{'reg_no': '4', 'stream': 'north'}, {'reg_no': '5', 'stream': 'north'}])
+        self.get(self.url('students'), {'fields': 'password'}, status=400)
+
+    def test_page_runs_constant_queries(self):
+        '''
+        Relations of the selected fields are joined or prefetched.
+        '''
+        with CaptureQueriesContext(connection) as small:
+            self.get(self.url('students'), {'limit': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.get(self.url('students'), {'limit': 100})
+        self.assertEqual(len(small), len(large))
+
+    def test_exams(self):
+        exam = self.create_exam('4', 80)
+        self.create_exam('5', 60)
+        page = self.get(self.url('exams'), {'reg_no': '4'})
+        self.assertEqual(page['results'], [{
+            'id': exam.pk, 'reg_no': '4', 'subject': 'Kiswahili', 'exam_type': 'CAT 1',
+            'term': '1', 'date_done': str(datetime.date.today()), 'marks': '80.00',
+        }])
+        self.assertIsNone(page['next'])
+
+    def test_write_exams(self):
+        report = self.send('post', self.url('exams'), [
+            {'reg_no': '4', 'subject': 'Kiswahili', 'exam_type': 'CAT 1', 'term': '1', 'marks': 70},
+            {'reg_no': '404', 'subject': 'Kiswahili', 'exam_type': 'CAT 1', 'term': '1', 'marks': 70},
+        ], status=201)
+        self.assertEqual((report['inserted'], len(report['errors'])), (1, 1))
+        exam = Exam.objects.get()
+        self.assertEqual(StudentTermResult.objects.get(student='4').total, 70)
+
+        self.send('delete', self.url('exams', exam.pk), None, status=204)
+        run_on_commit_callbacks()
+        self.assertFalse(Exam.objects.exists())
+        self.assertFalse(StudentTermResult.objects.filter(student='4', total__gt=0).exists())
+
+    def test_write_students(self):
+        student = self.send('post', self.url('students'), {
+            'reg_no': '100', 'first_name': 'jane', 'last_name': 'doe', 'form': 1,
+            'stream': 'north', 'subjects': 'Kiswahili; English',
+        }, status=201)
+        self.assertEqual((student['stream'], sorted(student['subjects'])), ('north', ['English', 'Kiswahili']))
+        self.send('post', self.url('students'), {'reg_no': '100'}, status=400)
+
+        student = self.send('patch', self.url('students', '100'), {'house': 'blue', 'first_name': 'joan'}, status=200)
+        self.assertEqual((student['house'], student['first_name']), ('blue', 'joan'))
+        self.send('patch', self.url('students', '100'), {'reg_no': '101'}, status=400)
+        # updates are validated like admissions
+        self.send('patch', self.url('students', '100'), {'first_name': ''}, status=400)
+        self.send('patch', self.url('students', '100'), {'last_name': 'x' * 200}, status=400)
+        self.send('patch', self.url('students', '100'), {'stream': 'nowhere'}, status=400)
+        self.send('patch', self.url('students', '100'), {'kcpe_marks': -1}, status=400)
+        student = self.send('patch', self.url('students', '100'), {'stream': 'East '}, status=200)
+        self.assertEqual((student['stream'], student['first_name']), ('east', 'joan'))
+        # null clears a field rather than saving 'None'
+        student = self.send('patch', self.url('students', '100'), {'house': None, 'middle_name': None, 'kcpe_marks': None}, status=200)
+        self.assertEqual((student['house'], student['middle_name'], student['kcpe_marks']), ('', '', None))
+        self.send('patch', self.url('students', '100'), {'first_name': None}, status=400)
+        self.send('delete', self.url('students', '100'), None, status=405)
+
+    def test_reference_data(self):
+        subject = self.send('post', self.url('subjects'), {'name': 'physics'}, status=201)
+        self.assertEqual(subject['name'], 'Physics')
+        self.send('post', self.url('subjects'), {'name': 'physics'}, status=400)
+        self.send('delete', self.url('subjects', subject['id']), None, status=204)
+        self.assertFalse(Subject.objects.filter(name='Physics').exists())
+        self.get(self.url('subjects', 'x'), status=400)
+        self.get(self.url('nothing'), status=404)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api_module'
+urlpatterns = [
+    path('<str:resource>/', views.ResourceListView.as_view(), name='resource_list'),
+    path('<str:resource>/<str:key>/', views.ResourceDetailView.as_view(), name='resource_detail'),
+]
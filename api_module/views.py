@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+
+from django.contrib.auth import authenticate
+from django.http import JsonResponse, HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .resources import RESOURCES, ApiError
+
+# objects per page, a page can ask for up to MAX_PAGE_SIZE
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ApiView(View):
+    '''
+    Base of the api views. Other systems authenticate with HTTP Basic
+    auth, browsers with the session (and a csrf token to write). Only
+    staff may use the api. Errors are returned as json.
+    '''
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.authenticate(request)
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            response = JsonResponse({'errors': e.errors}, status=e.status)
+            if e.status == 401:
+                response['WWW-Authenticate'] = 'Basic realm="api"'
+            return response
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Basic '):
+            try:
+                username, password = base64.b64decode(header[len('Basic '):]).decode().split(':', 1)
+            except (binascii.Error, UnicodeDecodeError, ValueError):
+                raise ApiError({'detail': ['Invalid basic authorization header.']}, status=401)
+            user = authenticate(request, username=username, password=password)
+            if user is None:
+                raise ApiError({'detail': ['Invalid username or password.']}, status=401)
+            request.user = user
+        else:
+            if not request.user.is_authenticated:
+                raise ApiError({'detail': ['Authentication credentials were not provided.']}, status=401)
+            # the view is csrf exempt for basic auth, check session writes here
+            if request.method not in SAFE_METHODS and CsrfViewMiddleware().process_view(request, None, (), {}):
+                raise ApiError({'detail': ['CSRF verification failed.']}, status=403)
+        if not request.user.is_staff:
+            raise ApiError({'detail': ['Only staff may use the api.']}, status=403)
+
+    def get_resource(self, name):
+        try:
+            return RESOURCES[name]
+        except KeyError:
+            raise ApiError({'detail': ['Not found.']}, status=404)
+
+    def get_fields(self, resource):
+        '''
+        The fields selected with ?fields=a,b or all of them.
+        '''
+        fields = [f for f in self.request.GET.get('fields', '').split(',') if f]
+        unknown = [f for f in fields if f not in resource.fields]
+        if unknown:
+            raise ApiError({'fields': ['Unknown fields %s.' % ', '.join(unknown)]})
+        return fields or list(resource.fields)
+
+    def get_data(self):
+        try:
+            return json.loads(self.request.body or b'null')
+        except ValueError:
+            raise ApiError({'detail': ['Invalid json.']})
+
+class ResourceListView(ApiView):
+    '''
+    A page of the objects of a resource, in cursor order, after the
+    cursor ?after= if given. The response links the next page. Pages
+    are found by the index on the cursor, not by OFFSET.
+    '''
+
+    def get(self, request, resource, *args, **kwargs):
+        resource = self.get_resource(resource)
+        fields = self.get_fields(resource)
+        try:
+            limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError({'limit': ['Enter a whole number.']})
+
+        queryset = resource.filter(resource.get_queryset(), request.GET)
+        after = request.GET.get('after')
+        if after is not None:
+            queryset = queryset.filter(**{'%s__gt' % resource.cursor: resource.to_cursor(after)})
+        # one more to know if there is a next page
+        page = list(resource.plan(queryset, fields).order_by(resource.cursor)[:limit + 1])
+
+        next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            params = request.GET.copy()
+            params['after'] = resource.get_cursor(page[-1])
+            next_url = '%s?%s' % (request.path, params.urlencode())
+        return JsonResponse({
+            'results': [resource.serialize(obj, fields) for obj in page],
+            'next': next_url,
+        })
+
+    def post(self, request, resource, *args, **kwargs):
+        resource = self.get_resource(resource)
+        return JsonResponse(resource.create(self.get_data()), status=201)
+
+class ResourceDetailView(ApiView):
+    '''
+    One object of a resource, looked up by its cursor column.
+    '''
+
+    def get_object(self, resource, key, fields):
+        queryset = resource.plan(resource.get_queryset(), fields)
+        obj = queryset.filter(**{resource.cursor: resource.to_cursor(key)}).first()
+        if obj is None:
+            raise ApiError({'detail': ['Not found.']}, status=404)
+        return obj
+
+    def get(self, request, resource, key, *args, **kwargs):
+        resource = self.get_resource(resource)
+        fields = self.get_fields(resource)
+        return JsonResponse(resource.serialize(self.get_object(resource, key, fields), fields))
+
+    def patch(self, request, resource, key, *args, **kwargs):
+        resource = self.get_resource(resource)
+        data = self.get_data()
+        if not isinstance(data, dict):
+            raise ApiError({'detail': ['Expected an object.']})
+        obj = resource.update(self.get_object(resource, key, []), data)
+        fields = list(resource.fields)
+        return JsonResponse(resource.serialize(self.get_object(resource, resource.get_cursor(obj), fields), fields))
+
+    def delete(self, request, resource, key, *args, **kwargs):
+        resource = self.get_resource(resource)
+        resource.delete(self.get_object(resource, key, []))
+        return HttpResponse(status=204)
@@ -30,6 +30,8 @@ INSTALLED_APPS = [
     'accounts',
     'exam_module',
     'settings_module',
+    'jobs_module',
+    'api_module',
 
     'crispy_forms',
 ]
@@ -40,6 +42,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.identity_map.IdentityMapMiddleware',
+    'exam_module.report_cache.VersionScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -136,6 +140,52 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'staticfiles'),
 ]
 
+# Caches
+# generated reports and results slips are kept on disk, shared by
+# the web server and job workers. The version tokens that invalidate
+# them are kept apart, a cache that only holds a few keys is never
+# culled so a token is never lost.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'reports'),
+        'TIMEOUT': 7 * 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'versions'),
+        'TIMEOUT': None,
+    },
+}
+
+# the tests run with in-memory caches (see djschool.test_runner)
+TEST_RUNNER = 'djschool.test_runner.TestRunner'
+
+# Uploaded and generated files i.e. results of background jobs
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Background jobs
+# number of worker threads started by server.pyw, other deployments
+# run `python manage.py run_jobs` instead.
+JOBS_LOCAL_WORKERS = 2
+
+# seconds a running job may go without a heartbeat (progress) before
+# its worker is taken to have stopped and the job is failed.
+JOBS_HEARTBEAT_TIMEOUT = 15 * 60
+
+# days finished jobs and their result files are kept.
+JOBS_RETENTION_DAYS = 7
+
+# worker processes used to render results slips, None for one per cpu.
+RESULTS_SLIPS_PROCESSES = None
+
 # extend the default User attributes/behaviour
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -0,0 +1 @@
+default_app_config = 'exam_module.apps.ExamModuleConfig'
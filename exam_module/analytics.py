@@ -0,0 +1,124 @@
+import datetime
+import math
+
+from django.db import connection
+from django.db.models import F, Sum
+
+from accounts.models import Stream
+
+from .models import Exam, Subject
+from .utils import grade_resolver
+
+def get_grade_bands():
+    '''
+    Returns a list of (grade, lower, upper) from the grading system,
+    best grade first. upper is None for the best grade and lower is
+    None for '**', the marks below every grade.
+    '''
+    bounds, grades = grade_resolver.get_table()
+    bands = [('**', None, bounds[0] if bounds else None)]
+    for i, (bound, grade) in enumerate(zip(bounds, grades)):
+        bands.append((grade, bound, bounds[i+1] if i + 1 < len(bounds) else None))
+    bands.reverse()
+    return bands
+
+def get_scores(terms, exam_types, forms=None, streams=None):
+    '''
+    Values queryset of the marks of every student in every subject
+    done and term, summed over exam_types. Selects the columns
+    student_id, subject_id, term_id, stream_id and total.
+    forms and streams, if given, limit the students.
+    '''
+    exams = Exam.objects.filter(
+        term__in=terms,
+        exam_type__in=exam_types,
+        subject__subjectsdonebystudent__student__reg_no=F('student'),
+    )
+    if forms:
+        year = datetime.datetime.now().year
+        exams = exams.filter(student__cohort_year__in=[year - int(form) + 1 for form in forms])
+    if streams:
+        exams = exams.filter(student__stream__in=streams)
+    return exams.values('student', 'subject', 'term', 'student__stream').annotate(total=Sum('marks')).order_by()
+
+def aggregate_scores(scores, tet, bands, by_stream):
+    '''
+    Aggregate the scores (see get_scores) of subjects, and streams
+    if by_stream, in one GROUP BY query. A student's score is the
+    average over the tet exam types. The median is picked by a
+    window function, grades are counted per band of bands.
+    '''
+    group_by = 'subject_id, stream_id' if by_stream else 'subject_id'
+    grades = []
+    grades_params = []
+    for grade, lower, upper in bands:
+        conditions = []
+        if lower is not None:
+            conditions.append('score >= %s')
+            grades_params.append(lower)
+        if upper is not None:
+            conditions.append('score < %s')
+            grades_params.append(upper)
+        grades.append('SUM(CASE WHEN %s THEN 1 ELSE 0 END)' % (' AND '.join(conditions) or '1 = 1'))
+
+    scores_sql, scores_params = scores.query.sql_with_params()
+    sql = '''
+        SELECT {group_by}, COUNT(*), AVG(score), MIN(score), MAX(score), SUM(score * score),
+            AVG(CASE WHEN 2 * rn IN (cnt, cnt + 1, cnt + 2) THEN score END),
+            {grades}
+        FROM (
+            SELECT subject_id, stream_id, ROUND(total * 1.0 / %s, 2) AS score,
+                ROW_NUMBER() OVER (PARTITION BY {group_by} ORDER BY total) AS rn,
+                COUNT(*) OVER (PARTITION BY {group_by}) AS cnt
+            FROM ({scores}) totals
+        ) ranked
+        GROUP BY {group_by}
+    '''.format(group_by=group_by, grades=', '.join(grades), scores=scores_sql)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, grades_params + [tet] + list(scores_params))
+        rows = cursor.fetchall()
+
+    for row in rows:
+        if not by_stream:
+            row = (row[0], None) + tuple(row[1:])
+        subject_id, stream_id, count, mean, minimum, maximum, squares, median = row[:8]
+        mean = float(mean)
+        variance = max(float(squares) / count - mean * mean, 0.0)
+        yield {
+            'subject_id': subject_id,
+            'stream_id': stream_id,
+            'count': count,
+            'mean': round(mean, 2),
+            'median': round(float(median), 2),
+            'std_dev': round(math.sqrt(variance), 2),
+            'min': round(float(minimum), 2),
+            'max': round(float(maximum), 2),
+            'grades': [(grade, int(n)) for (grade, lower, upper), n in zip(bands, row[8:])],
+        }
+
+def get_subject_statistics(terms, exam_types, forms=None, streams=None):
+    '''
+    Mean, median, standard deviation, min, max and grade
+    distribution of the students' scores per subject, over all the
+    selected streams (stream 'All') and per stream, for the given
+    terms and exam_types. A student's score in a subject is the
+    average over exam_types, in each of the terms. The statistics
+    take two aggregate queries regardless of the number of students.
+    Returns a list of dicts sorted by subject then stream.
+    '''
+    bands = get_grade_bands()
+    scores = get_scores(terms, exam_types, forms, streams)
+    tet = len(exam_types) # total exam types requested
+    statistics = list(aggregate_scores(scores, tet, bands, by_stream=False))
+    statistics += aggregate_scores(scores, tet, bands, by_stream=True)
+
+    subjects = dict(Subject.objects.values_list('pk', 'name'))
+    stream_names = dict(Stream.objects.values_list('pk', 'name'))
+    for row in statistics:
+        row['subject'] = subjects[row.pop('subject_id')]
+        stream_id = row.pop('stream_id')
+        row['stream'] = stream_names[stream_id] if stream_id is not None else 'All'
+    # 'All' first, then the streams
+    statistics.sort(key=lambda row: (row['subject'], row['stream'] != 'All', row['stream']))
+    return statistics
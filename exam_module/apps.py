@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ExamModuleConfig(AppConfig):
     name = 'exam_module'
+
+    def ready(self):
+        from . import signals
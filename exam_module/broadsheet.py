@@ -0,0 +1,142 @@
+'''
+The broadsheet of a class: the average of every student in each
+subject of a term, with their total, mean, grade and position. Built
+from one aggregate query of the term results, pivoted in memory, and
+rendered as a pdf, csv or xlsx file.
+'''
+import csv
+import io
+
+from django.db.models import Count
+
+from fpdf import FPDF
+from openpyxl import Workbook
+
+from accounts.search import get_names
+
+from .models import Subject
+from .reference_data import reference_cache
+from .utils import get_term_results, get_grades, get_positions
+
+
+def get_broadsheet_report(students, exam_types, term):
+    '''
+    The broadsheet of the students queryset in the given term and
+    exam_types. Returns a dict with the 'subjects' of the columns, the
+    subjects with marks, and the 'rows' sorted by position, dicts with
+    the reg_no, name, 'marks' (the subject averages in the order of
+    the subjects, None where there are none), total, mean, grade,
+    position and 'missed', the exams of the subjects done by the
+    student that were not sat. Like get_class_positions the mean is
+    over the subjects done by the student.
+    '''
+    tet = len(exam_types) # total exam types
+    totals, exams_done = {}, {}
+    for row in get_term_results(term, exam_types).filter(student__in=students.values('reg_no')):
+        totals.setdefault(row['student'], {})[row['subject']] = float(row['total'])
+        exams_done[row['student']] = exams_done.get(row['student'], 0) + row['exams_done']
+
+    subjects = {subject.pk: subject for subject in reference_cache.get(Subject.objects.all())}
+    columns = [subjects[pk] for pk in sorted({pk for marks in totals.values() for pk in marks})]
+
+    rows = []
+    for reg_no, first_name, middle_name, last_name, subjects_done in students.annotate(
+        subjects_done=Count('subjectsdonebystudent'),
+    ).values_list('reg_no', 'user__first_name', 'user__middle_name', 'user__last_name', 'subjects_done'):
+        marks = totals.get(reg_no, {})
+        total = sum(marks.values())
+        rows.append({
+            'reg_no': reg_no,
+            'name': get_names(first_name, middle_name, last_name),
+            'marks': [round(marks[subject.pk] / tet, 2) if subject.pk in marks else None for subject in columns],
+            'total': round(total / tet, 2),
+            'mean': round(total / (tet * subjects_done), 2) if subjects_done else 0.0,
+            'missed': tet * subjects_done - exams_done.get(reg_no, 0),
+        })
+
+    positions = get_positions([(row['reg_no'], row['mean']) for row in rows])
+    for row, grade in zip(rows, get_grades([row['mean'] for row in rows])):
+        row['grade'] = grade
+        row['position'] = positions[row['reg_no']]
+    rows.sort(key=lambda row: (row['position'], row['reg_no']))
+    return {'subjects': columns, 'rows': rows}
+
+def get_broadsheet_table(broadsheet):
+    '''
+    The broadsheet as a list of rows of plain values, the first row
+    is the header.
+    '''
+    table = [['Position', 'Reg No.', 'Name'] + [subject.name for subject in broadsheet['subjects']] + ['Total', 'Mean', 'Grade', 'Missed']]
+    for row in broadsheet['rows']:
+        table.append(
+            [row['position'], row['reg_no'], row['name']]
+            + ['' if marks is None else marks for marks in row['marks']]
+            + [row['total'], row['mean'], row['grade'], row['missed']]
+        )
+    return table
+
+def render_broadsheet_csv(title, broadsheet):
+    f = io.StringIO()
+    csv.writer(f).writerows(get_broadsheet_table(broadsheet))
+    return f.getvalue().encode()
+
+def render_broadsheet_xlsx(title, broadsheet):
+    workbook = Workbook(write_only=True)
+    # sheet titles are at most 31 characters
+    sheet = workbook.create_sheet(title[:31])
+    for row in get_broadsheet_table(broadsheet):
+        sheet.append(row)
+    f = io.BytesIO()
+    workbook.save(f)
+    return f.getvalue()
+
+def render_broadsheet_pdf(title, broadsheet):
+    # landscape, there is a column per subject
+    pdf = FPDF('L')
+    pdf.add_page()
+
+    # Effective page width, or just epw
+    epw = pdf.w - 2*pdf.l_margin
+
+    pdf.set_font('Times', 'B', 16)
+    th = pdf.font_size # text height
+    pdf.cell(epw, th+1, title, align='C', ln=1)
+    pdf.ln(4)
+
+    # the subjects and the total, mean, grade, position and missed share 65% of epw
+    cw = epw * 0.65 / (len(broadsheet['subjects']) + 5)
+
+    # thead, subjects are abbreviated to fit
+    pdf.set_font('Times', 'B', 11); th = pdf.font_size + 1
+    pdf.cell(epw*0.05, th, 'No.', border=1, align='C')
+    pdf.cell(epw*0.08, th, 'Reg No.', border=1, align='C')
+    pdf.cell(epw*0.22, th, 'Name', border=1, align='C')
+    for subject in broadsheet['subjects']:
+        pdf.cell(cw, th, subject.name[:3].upper(), border=1, align='C')
+    for label in ('Total', 'Mean', 'Grade', 'Pos.', 'Missed'):
+        pdf.cell(cw, th, label, border=1, align='C')
+    pdf.ln(th)
+
+    # tbody
+    pdf.set_font('Times', '', 10); th = pdf.font_size + 1
+    for i, row in enumerate(broadsheet['rows']):
+        pdf.cell(epw*0.05, th, str(i+1), border=1)
+        pdf.cell(epw*0.08, th, row['reg_no'], border=1)
+        pdf.cell(epw*0.22, th, row['name'], border=1)
+        for marks in row['marks']:
+            pdf.cell(cw, th, '-' if marks is None else str(marks), border=1, align='C')
+        pdf.cell(cw, th, str(row['total']), border=1, align='C')
+        pdf.cell(cw, th, str(row['mean']), border=1, align='C')
+        pdf.cell(cw, th, row['grade'], border=1, align='C')
+        pdf.cell(cw, th, str(row['position']), border=1, align='C')
+        pdf.cell(cw, th, str(row['missed']), border=1, align='C')
+        pdf.ln(th)
+
+    return pdf.output(dest='S').encode('latin-1')
+
+# file type: renderer(title, broadsheet) returning the file content
+BROADSHEET_RENDERERS = {
+    'pdf': render_broadsheet_pdf,
+    'csv': render_broadsheet_csv,
+    'xlsx': render_broadsheet_xlsx,
+}
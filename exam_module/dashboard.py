@@ -0,0 +1,114 @@
+import datetime
+
+from django.db.models import F, Avg, Count
+from django.db.models.functions import ExtractYear
+
+from accounts.models import StudentProfile, FORMS
+from jobs_module.runner import submit_job
+
+from .models import Exam, SubjectsDoneByStudent
+from .report_cache import get_reports_cache, get_data_version, version_scope
+
+# the snapshot is kept in the reports cache with the data version it
+# was computed at
+DASHBOARD_STATISTICS_KEY = 'exam_module:dashboard_statistics'
+REFRESH_HANDLER = 'exam_module.dashboard.refresh_dashboard_statistics'
+
+# terms shown on the mean score trend
+TREND_LENGTH = 9
+
+def get_enrolment(year):
+    '''
+    Number of students per form and stream in the given year.
+    '''
+    rows = StudentProfile.objects.filter(
+        cohort_year__in=[year - form + 1 for form in FORMS],
+    ).values('cohort_year', 'stream__name').annotate(count=Count('pk')).order_by()
+    enrolment = {}
+    for row in rows:
+        form = year - row['cohort_year'] + 1
+        enrolment.setdefault(row['stream__name'], {})[form] = row['count']
+    return {
+        'forms': list(FORMS),
+        'streams': [
+            {'stream': stream, 'counts': [counts.get(form, 0) for form in FORMS]}
+            for stream, counts in sorted(enrolment.items())
+        ],
+    }
+
+def get_completeness(year):
+    '''
+    Marks entered against marks expected per subject in the current
+    term, the term of the latest exam done in year. Expected marks
+    are one per student doing the subject for each exam type sat in
+    the term so far.
+    '''
+    latest = Exam.objects.filter(date_done__year=year).order_by('-date_done').select_related('term').first()
+    if latest is None:
+        return {'term': None, 'subjects': []}
+
+    students = StudentProfile.objects.filter(cohort_year__in=[year - form + 1 for form in FORMS])
+    exams = Exam.objects.filter(term=latest.term, date_done__year=year)
+    exam_types = exams.values('exam_type').distinct().count()
+    expected = SubjectsDoneByStudent.objects.filter(student__in=students).values_list('subject__name').annotate(count=Count('pk')).order_by()
+    entered = dict(exams.filter(
+        student__in=students.values('reg_no'),
+        subject__subjectsdonebystudent__student__reg_no=F('student'),
+    ).values_list('subject__name').annotate(count=Count('pk')).order_by())
+
+    subjects = []
+    for name, count in sorted(expected):
+        subjects.append({
+            'subject': name,
+            'entered': entered.get(name, 0),
+            'expected': count * exam_types,
+            'percent': round(100.0 * entered.get(name, 0) / (count * exam_types), 2),
+        })
+    return {'term': latest.term.name, 'year': year, 'subjects': subjects}
+
+def get_trends():
+    '''
+    Mean marks of each of the latest TREND_LENGTH terms.
+    '''
+    rows = Exam.objects.annotate(
+        year=ExtractYear('date_done'),
+    ).values('year', 'term__name').annotate(mean=Avg('marks')).order_by('-year', '-term__name')[:TREND_LENGTH]
+    return [
+        {'year': row['year'], 'term': row['term__name'], 'mean': round(float(row['mean']), 2)}
+        for row in reversed(rows)
+    ]
+
+def compute_dashboard_statistics():
+    '''
+    A snapshot of the dashboard statistics, tagged with the data
+    version it was computed from.
+    '''
+    # the data read below is at least this recent
+    version = get_data_version()
+    now = datetime.datetime.now()
+    return {
+        'version': version,
+        'computed_at': now.isoformat(timespec='seconds'),
+        'enrolment': get_enrolment(now.year),
+        'completeness': get_completeness(now.year),
+        'trends': get_trends(),
+    }
+
+@version_scope()
+def refresh_dashboard_statistics(job=None):
+    '''
+    Compute the snapshot and keep it in the reports cache, the only
+    place it is kept. Run as a job, it makes no result file.
+    '''
+    get_reports_cache().set(DASHBOARD_STATISTICS_KEY, compute_dashboard_statistics(), None)
+
+def get_dashboard_statistics():
+    '''
+    The cached snapshot, or None if none was computed yet. A snapshot
+    older than the data is still returned, and a job is queued to
+    refresh it. Never computes the statistics itself.
+    '''
+    statistics = get_reports_cache().get(DASHBOARD_STATISTICS_KEY)
+    if statistics is None or statistics['version'] != get_data_version():
+        submit_job('Dashboard statistics', REFRESH_HANDLER, {}, unique=True)
+    return statistics
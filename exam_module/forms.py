@@ -12,18 +12,20 @@ from crispy_forms.layout import (
     HTML,
 )
 
+from accounts.identity_map import get_identity_map
 from accounts.models import (
     StudentProfile,
     Stream,
+    FORMS,
 )
 
 from .models import (
     Subject,
     ExamType,
     Term,
-    SubjectsDoneByStudent,
 )
 
+from .reference_data import ReferenceChoiceField, ReferenceMultipleChoiceField
 from .utils import get_objects_as_choices
 
 # use html5 type="date"
@@ -40,9 +42,9 @@ class CreateExamForm(forms.Form):
     and Correct data type.
     '''
     student_reg_no = forms.CharField(label="Student Registration Number", max_length=20)
-    subject_name = forms.ModelChoiceField(label="Subject", widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
-    exam_type_name = forms.ModelChoiceField(label="Exam Type", widget=forms.Select, queryset=ExamType.objects,  empty_label=None, to_field_name='name')
-    term_name = forms.ModelChoiceField(label="Term", widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    subject_name = ReferenceChoiceField(label="Subject", widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
+    exam_type_name = ReferenceChoiceField(label="Exam Type", widget=forms.Select, queryset=ExamType.objects,  empty_label=None, to_field_name='name')
+    term_name = ReferenceChoiceField(label="Term", widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
     date_done = forms.DateField(widget=DateInput, initial=datetime.date.today())
     marks = forms.DecimalField(max_digits=4, decimal_places=2)
 
@@ -76,12 +78,14 @@ class CreateExamForm(forms.Form):
             )
         )
     
-    # validations, all passed in values should exist in db
+    # validations, all passed in values should exist in db. The
+    # choice fields have fetched their objects already.
 
     def clean_student_reg_no(self):
         student_reg_no = self.cleaned_data.get('student_reg_no')
         try:
-            student_profile = StudentProfile.objects.get(reg_no=student_reg_no)
+            # kept for the view in the request's identity map
+            get_identity_map().get(StudentProfile, reg_no=student_reg_no)
         except StudentProfile.DoesNotExist:
             raise forms.ValidationError('A student with this registration number is not found.')
         return student_reg_no
@@ -90,30 +94,7 @@ class CreateExamForm(forms.Form):
         subject_name = self.cleaned_data.get('subject_name')
         if subject_name.name == 'All':
             raise forms.ValidationError('Select a single subject.')
-            
-        try:
-            subject = Subject.objects.get(name=subject_name)
-        except Subject.DoesNotExist:
-            raise forms.ValidationError('This subject is not found.')
         return subject_name
-    
-    def clean_exam_type_name(self):
-        exam_type_name = self.cleaned_data.get('exam_type_name')
-        try:
-            exam_type = ExamType.objects.get(name=exam_type_name)
-        except ExamType.DoesNotExist:
-            raise forms.ValidationError('This exam type is not found.')
-        return exam_type_name
-    
-    def clean_term_name(self):
-        term_name = self.cleaned_data.get('term_name')
-        try:
-            term = Term.objects.get(name=term_name)
-        except Term.DoesNotExist:
-            raise forms.ValidationError('This term is not found.')
-        return term_name
-        
-    
 
 class CreateManyExamsFilterForm(forms.Form):
     '''
@@ -121,10 +102,10 @@ class CreateManyExamsFilterForm(forms.Form):
     batch exam entry.
     '''
     form = forms.IntegerField()
-    stream = forms.ModelChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
-    subject_name = forms.ModelChoiceField(label='Subject', widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
-    exam_type_name = forms.ModelChoiceField(label='Exam Type', widget=forms.Select, queryset=ExamType.objects, empty_label=None, to_field_name='name')
-    term_name = forms.ModelChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    stream = ReferenceChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    subject_name = ReferenceChoiceField(label='Subject', widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
+    exam_type_name = ReferenceChoiceField(label='Exam Type', widget=forms.Select, queryset=ExamType.objects, empty_label=None, to_field_name='name')
+    term_name = ReferenceChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
     date_done = forms.DateField(label='Date Done', widget=DateInput, initial=datetime.date.today())
 
     def __init__(self, *args, **kwargs):
@@ -160,42 +141,6 @@ class CreateManyExamsFilterForm(forms.Form):
             ),
         )
 
-    def clean_subject_name(self):
-        '''
-        The given subject name should exist in db.
-        '''
-        subject_name = self.cleaned_data.get('subject_name')
-        try:
-            subject = Subject.objects.get(name=subject_name)
-        except Subject.DoesNotExist:
-            raise forms.ValidationError('This subject is not found.')
-    
-        return subject_name
-
-    def clean_exam_type_name(self):
-        '''
-        The given exam type name should exist in db.
-        '''
-        exam_type_name = self.cleaned_data.get('exam_type_name')
-        try:
-            exam_type = ExamType.objects.get(name=exam_type_name)
-        except ExamType.DoesNotExist:
-            raise forms.ValidationError('This exam type is not found.')
-    
-        return exam_type_name
-
-    def clean_term_name(self):
-        '''
-        The given term name should exist in db.
-        '''
-        term_name = self.cleaned_data.get('term_name')
-        try:
-            term = Term.objects.get(name=term_name)
-        except Term.DoesNotExist:
-            raise forms.ValidationError('This term is not found.')
-    
-        return term_name
-
     def clean(self, *args, **kwargs):
         '''
         There should be students in the given form, stream on that
@@ -209,9 +154,8 @@ class CreateManyExamsFilterForm(forms.Form):
             if 'form' in self.cleaned_data and 'stream' in self.cleaned_data:
                 form = self.cleaned_data.get('form')
                 stream = self.cleaned_data.get('stream')
-                query_set = StudentProfile.objects.filter(stream__name=stream)
-                students_list = [s for s in query_set if s.get_form(year_offset) == form]
-                if not students_list:
+                query_set = StudentProfile.objects.filter(stream__name=stream).in_form(form, year_offset)
+                if not query_set.exists():
                     raise forms.ValidationError(
                         'There are no students found in form %s %s in the year %s.' %(
                             form,
@@ -222,22 +166,79 @@ class CreateManyExamsFilterForm(forms.Form):
                 # if no students taking that subject also raise a validation error
                 subject_name = self.cleaned_data.get('subject_name', '')
                 if subject_name:
-                    students_list = [s for s in students_list if subject_name in [sd.subject for sd in SubjectsDoneByStudent.objects.filter(student=s)]]
-                    if not students_list:
+                    query_set = query_set.filter(subjectsdonebystudent__subject=subject_name)
+                    if not query_set.exists():
                         raise forms.ValidationError(
                             'No students in form %d %s taking %s.' % (form, stream, subject_name)
                         )
 
+class AutosaveMarksForm(forms.Form):
+    '''
+    The exam of the marks autosaved from the marks entry grid, named
+    like the hidden inputs of the grid.
+    '''
+    subject_name = ReferenceChoiceField(queryset=Subject.objects, to_field_name='name')
+    exam_type_name = ReferenceChoiceField(queryset=ExamType.objects, to_field_name='name')
+    term_name = ReferenceChoiceField(queryset=Term.objects, to_field_name='name')
+    date_done = forms.DateField()
+
+    def clean_subject_name(self):
+        subject_name = self.cleaned_data.get('subject_name')
+        if subject_name.name == 'All':
+            raise forms.ValidationError('Select a single subject.')
+        return subject_name
+
+class BroadsheetEntryFilterForm(forms.Form):
+    '''
+    Select the class, term, exam types and subjects of a broadsheet
+    entry. No subjects selected means all of them.
+    '''
+    form = forms.TypedChoiceField(choices=[(form, 'Form %d' % form) for form in FORMS], coerce=int)
+    stream = ReferenceChoiceField(widget=forms.Select, queryset=Stream.objects.exclude(name='All'), empty_label=None, to_field_name='name')
+    term_name = ReferenceChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    date_done = forms.DateField(label='Date Done', widget=DateInput, initial=datetime.date.today())
+    exam_types_names = ReferenceMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    subjects = ReferenceMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=Subject.objects.exclude(name='All'), to_field_name='name', required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_action = 'exam_module:broadsheet_entry'
+        self.helper.form_method = 'get'
+        self.helper.form_id = 'broadsheet-filter-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Filter Tags',
+                Div(
+                    Field('form', wrapper_class='col'),
+                    Field('stream', wrapper_class='col'),
+                    Field('term_name', wrapper_class='col'),
+                    Field('date_done', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Div(
+                    Field('exam_types_names', wrapper_class='col'),
+                    Field('subjects', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Submit('submit', 'Filter', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
+
+    def clean_subjects(self):
+        return self.cleaned_data.get('subjects') or self.fields['subjects'].get_objects()
+
 class ExamReportsFilterForm(forms.Form):
     '''
     Used to apply filters to get students, and specify exam types
     used to compute the student final grade.
     '''
     form = forms.IntegerField()
-    stream = forms.ModelChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
-    subject = forms.ModelChoiceField(widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
-    exam_types = forms.ModelMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
-    term = forms.ModelChoiceField(widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    stream = ReferenceChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    subject = ReferenceChoiceField(widget=forms.Select, queryset=Subject.objects, empty_label=None, to_field_name='name')
+    exam_types = ReferenceMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    term = ReferenceChoiceField(widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -284,8 +285,8 @@ class ExamReportsFilterForm(forms.Form):
                 query_set = StudentProfile.objects.all()
             else:
                 query_set = StudentProfile.objects.filter(stream__name=stream)
-            students_list = [s for s in query_set if s.get_form(year_offset) == form]
-            if not students_list:
+            query_set = query_set.in_form(form, year_offset)
+            if not query_set.exists():
                 raise forms.ValidationError(
                     'No students found in form %s %s.' %(
                         form,
@@ -296,19 +297,55 @@ class ExamReportsFilterForm(forms.Form):
             # if no students taking that subject also raise a validation error
             subject = self.cleaned_data.get('subject', '')
             if subject and subject.name != 'All':
-                students_list = [s for s in students_list if subject in [sd.subject for sd in SubjectsDoneByStudent.objects.filter(student=s)]]
-                if not students_list:
+                query_set = query_set.filter(subjectsdonebystudent__subject=subject)
+                if not query_set.exists():
                     raise forms.ValidationError(
                         'No students in form %d %s taking %s.' % (form, stream, subject.name)
                     )
 
+class BroadsheetReportFilterForm(forms.Form):
+    '''
+    Select the class, term and exam types of a broadsheet report and
+    the type of file to generate.
+    '''
+    form = forms.TypedChoiceField(choices=[(form, 'Form %d' % form) for form in FORMS], coerce=int)
+    stream = ReferenceChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    term = ReferenceChoiceField(widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    exam_types = ReferenceMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    file_type = forms.ChoiceField(label='Choose File Type', widget=forms.RadioSelect, choices=(('pdf', 'PDF'), ('csv', 'CSV'), ('xlsx', 'EXCEL')), initial='pdf')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_id = 'broadsheet-report-filter-form'
+        self.helper.form_method = 'get'
+        self.helper.form_action = 'exam_module:broadsheet_report'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Filter Tags',
+                Div(
+                    Field('form', wrapper_class='col'),
+                    Field('stream', wrapper_class='col'),
+                    Field('term', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Div(
+                    Field('exam_types', wrapper_class='col'),
+                    Field('file_type', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Submit('submit', 'Generate', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
+
 class GenerateResultsSlipPerStudentFilterForm(forms.Form):
     '''
     Specify the reg_no of the student.
     '''
     reg_no = forms.CharField(label='Registration Number')
-    exam_types_names = forms.ModelMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
-    term_name = forms.ModelChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    exam_types_names = ReferenceMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    term_name = ReferenceChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -338,7 +375,7 @@ class GenerateResultsSlipPerStudentFilterForm(forms.Form):
     def clean_reg_no(self):
         reg_no = self.cleaned_data.get('reg_no')
         try:
-            StudentProfile.objects.get(reg_no=reg_no)
+            get_identity_map().get(StudentProfile, reg_no=reg_no)
         except StudentProfile.DoesNotExist:
             raise forms.ValidationError('No student with this registration number is found.')
         return reg_no
@@ -349,9 +386,9 @@ class GenerateResultsSlipPerClassFilterForm(forms.Form):
     for several student.
     '''
     form = forms.IntegerField()
-    stream = forms.ModelChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
-    exam_types_names = forms.ModelMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
-    term_name = forms.ModelChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
+    stream = ReferenceChoiceField(widget=forms.Select, queryset=Stream.objects, empty_label=None, to_field_name='name')
+    exam_types_names = ReferenceMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    term_name = ReferenceChoiceField(label='Term', widget=forms.Select, queryset=Term.objects, empty_label=None, to_field_name='name')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -391,8 +428,77 @@ class GenerateResultsSlipPerClassFilterForm(forms.Form):
                 query_set = StudentProfile.objects.all()
             else:
                 query_set = StudentProfile.objects.filter(stream__name=stream_name)
-            students_list = [s for s in query_set if s.get_form() == form]
-            if not students_list:
+            if not query_set.in_form(form).exists():
                 raise forms.ValidationError(
                     'No students found in form %s %s.' % (form, stream_name)
-                )
\ No newline at end of file
+                )
+
+class ImportMarksForm(forms.Form):
+    '''
+    Upload a csv or xlsx file of marks to save.
+    '''
+    file = forms.FileField(label='CSV/ XLSX File', help_text='Columns: reg_no, subject, exam_type, term, marks and an optional date_done.')
+    date_done = forms.DateField(label='Date Done', widget=DateInput, initial=datetime.date.today(), help_text='Used for rows without a date_done.')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.form_action = 'exam_module:import_marks'
+        self.helper.form_id = 'import-marks-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Import Marks',
+                HTML(
+                    '''
+                    {% include '_messages.html' %}
+                    '''
+                ),
+                Field('file'),
+                Field('date_done'),
+                Submit('submit', 'Import', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
+
+    def clean_file(self):
+        f = self.cleaned_data.get('file')
+        if not f.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Upload a .csv or .xlsx file.')
+        return f
+
+class SubjectAnalyticsFilterForm(forms.Form):
+    '''
+    Select the exams and students whose subject statistics to
+    compute. No forms or streams selected means all of them.
+    '''
+    form = forms.TypedMultipleChoiceField(label='Forms', widget=forms.CheckboxSelectMultiple, choices=[(form, 'Form %d' % form) for form in FORMS], coerce=int, required=False)
+    streams = ReferenceMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=Stream.objects.exclude(name='All'), to_field_name='name', required=False)
+    exam_types = ReferenceMultipleChoiceField(label='Exam Types', widget=forms.CheckboxSelectMultiple, queryset=ExamType.objects, to_field_name='name')
+    terms = ReferenceMultipleChoiceField(widget=forms.CheckboxSelectMultiple, queryset=Term.objects, to_field_name='name')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_action = 'exam_module:subject_analytics'
+        self.helper.form_method = 'get'
+        self.helper.form_id = 'subject-analytics-filter-form'
+        self.helper.layout = Layout(
+            Fieldset(
+                'Filter Tags',
+                HTML(
+                    '''
+                    {% include '_messages.html' %}
+                    '''
+                ),
+                Div(
+                    Field('form', wrapper_class='col'),
+                    Field('streams', wrapper_class='col'),
+                    Field('terms', wrapper_class='col'),
+                    Field('exam_types', wrapper_class='col'),
+                    css_class='form-row',
+                ),
+                Submit('submit', 'Compute', css_class='btn btn-primary'),
+                css_class='p-3 border rounded',
+            )
+        )
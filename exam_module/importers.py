@@ -0,0 +1,124 @@
+import csv
+import datetime
+import io
+import itertools
+
+from django import forms
+
+from openpyxl import load_workbook
+
+from .models import (
+    Subject,
+    ExamType,
+    Term,
+)
+from .utils import validate_exam_entries, bulk_upsert_exams
+
+
+def read_rows(f, filename):
+    '''
+    Stream the rows of a csv or xlsx file as (row_number, dict) pairs,
+    the dicts keyed by the header row. Header names are lowered and spaces replaced by
+    underscores i.e. 'Exam Type' -> 'exam_type'. Rows are read one
+    at a time, the file is never loaded whole.
+    '''
+    if filename.lower().endswith('.xlsx'):
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        if isinstance(f.read(0), bytes):
+            f = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+        rows = csv.reader(f)
+
+    header = None
+    for row_number, row in enumerate(rows, start=1):
+        if header is None:
+            header = [str(h or '').strip().lower().replace(' ', '_') for h in row]
+            continue
+        if not any(v not in (None, '') for v in row): # skip empty rows
+            continue
+        yield row_number, dict(zip(header, [clean_cell(v) for v in row]))
+
+def clean_cell(value):
+    '''
+    Spreadsheets store numbers such as reg_nos as floats, 4.0 -> 4.
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def chunks(iterable, size):
+    '''
+    Split an iterable into lists of at most size items.
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def get_names_map(model):
+    '''
+    Map lowered names to objects, names are matched case insensitively.
+    '''
+    return {obj.name.lower(): obj for obj in model.objects.all()}
+
+MARKS_COLUMNS = ['reg_no', 'subject', 'exam_type', 'term', 'marks']
+
+def import_marks(rows, date_done=None, chunk_size=1000):
+    '''
+    Save marks from rows, (row_number, dict) pairs as from read_rows
+    with the keys in MARKS_COLUMNS and an optional date_done, in
+    chunks of chunk_size, one bulk upsert per chunk. Subjects, exam types and terms are looked up once.
+    Returns a dict with the number of rows 'inserted', 'updated',
+    'skipped' (marks unchanged) and a list of (row_number, reg_no,
+    message) 'errors'. Rows with errors are left out, the rest are
+    saved.
+    '''
+    date_done = date_done or datetime.date.today()
+    date_field = forms.DateField(required=False)
+    subjects = get_names_map(Subject)
+    exam_types = get_names_map(ExamType)
+    terms = get_names_map(Term)
+
+    report = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    for chunk in chunks(rows, chunk_size):
+        entries = []
+        for row_number, row in chunk:
+            missing = [c for c in MARKS_COLUMNS if str(row.get(c, '')).strip() == '']
+            if missing:
+                report['errors'].append((row_number, row.get('reg_no', ''), 'Missing %s.' % ', '.join(missing)))
+                continue
+
+            entry = {
+                'row_number': row_number,
+                'reg_no': str(row['reg_no']).strip(),
+                'subject': subjects.get(str(row['subject']).strip().lower()),
+                'exam_type': exam_types.get(str(row['exam_type']).strip().lower()),
+                'term': terms.get(str(row['term']).strip().lower()),
+                'marks': str(row['marks']).strip(),
+            }
+            unknown = [c for c in ('subject', 'exam_type', 'term') if entry[c] is None]
+            if unknown:
+                report['errors'].append((row_number, entry['reg_no'], 'Unknown %s.' % ', '.join(unknown)))
+                continue
+            try:
+                entry['date_done'] = date_field.clean(row.get('date_done')) or date_done
+            except forms.ValidationError as e:
+                report['errors'].append((row_number, entry['reg_no'], ' '.join(e.messages)))
+                continue
+            entries.append(entry)
+
+        entries, errors = validate_exam_entries(entries)
+        for entry, message in errors:
+            report['errors'].append((entry['row_number'], entry['reg_no'], message))
+        counts = bulk_upsert_exams(entries)
+        report['inserted'] += counts['inserted']
+        report['updated'] += counts['updated']
+        report['skipped'] += counts['skipped']
+
+    report['errors'].sort()
+    return report
@@ -0,0 +1,67 @@
+import datetime
+
+from django.conf import settings
+
+from accounts.models import StudentProfile, Stream
+
+from .models import (
+    ExamType,
+    Term,
+)
+from .utils import (
+    get_class_positions,
+    get_results_slips,
+)
+from .slips import render_slips
+from .report_cache import get_report_key, set_cached_report, version_scope
+
+# Background jobs, run by jobs_module. Each is called with the job
+# and the params it was submitted with and returns (filename, content).
+# Each runs in its own version scope, like a request.
+
+def get_results_slips_per_class_key(form, stream_name, term_name, exam_types_names):
+    '''
+    Reports cache key of generate_results_slips_per_class.
+    '''
+    return get_report_key('results_slips_per_class', {
+        'form': form,
+        'stream': stream_name,
+        'term': term_name,
+        'exam_types': sorted(exam_types_names),
+        'printed_on': datetime.date.today(),
+    })
+
+@version_scope()
+def generate_results_slips_per_class(job, form, stream_name, term_name, exam_types_names):
+    '''
+    Results slips of all students in the given form and stream
+    (or 'All' streams) in one pdf. The pdf is also kept in the
+    reports cache.
+    '''
+    # the data read below is at least this recent
+    key = get_results_slips_per_class_key(form, stream_name, term_name, exam_types_names)
+    f = form
+    stream = Stream.objects.get(name=stream_name)
+    term = Term.objects.get(name=term_name)
+    exam_types = ExamType.objects.filter(name__in=exam_types_names)
+
+    # get students
+    if stream.name == 'All':
+        query_set = StudentProfile.objects.all()
+    else:
+        query_set = StudentProfile.objects.filter(stream=stream)
+    students_list = query_set.in_form(f)
+
+    # rank the whole form once, every slip reads its position from here
+    positions = get_class_positions(StudentProfile.objects.in_form(f), exam_types, term)
+
+    slips = get_results_slips(students_list, exam_types, term, positions)
+
+    content = render_slips(
+        slips,
+        processes=settings.RESULTS_SLIPS_PROCESSES,
+        progress=lambda done: job.set_progress(done, len(slips)),
+    )
+    filename = 'Form {form} {stream_name} Results Slips.pdf'.format(form=f, stream_name=stream.name)
+    set_cached_report(key, filename, content)
+    return filename, content
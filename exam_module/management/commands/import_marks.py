@@ -0,0 +1,37 @@
+from django import forms
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_module.importers import read_rows, import_marks
+
+
+class Command(BaseCommand):
+    '''
+    Import the marks of an exam sitting from a csv or xlsx file.
+    '''
+    help = 'Import marks from a csv or xlsx file with the columns reg_no, subject, exam_type, term, marks and an optional date_done.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the csv or xlsx file.')
+        parser.add_argument('--date-done', help='Date (YYYY-MM-DD) for rows without a date_done, defaults to today.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of rows saved at a time.')
+
+    def handle(self, *args, **options):
+        date_done = None
+        if options['date_done']:
+            try:
+                date_done = forms.DateField().clean(options['date_done'])
+            except forms.ValidationError:
+                raise CommandError('Invalid --date-done %s.' % options['date_done'])
+
+        try:
+            with open(options['path'], 'rb') as f:
+                report = import_marks(read_rows(f, options['path']), date_done, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for row_number, reg_no, message in report['errors']:
+            self.stderr.write('Row %d (%s): %s' % (row_number, reg_no, message))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported marks: %d added, %d updated, %d unchanged, %d rows with errors.' % (
+                report['inserted'], report['updated'], report['skipped'], len(report['errors']))
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from exam_module.models import StudentTermResult
+from exam_module.utils import rebuild_student_term_results
+
+
+class Command(BaseCommand):
+    '''
+    Recompute the StudentTermResult table from the exam objects.
+    '''
+    help = 'Rebuild the per student, subject and term results from the exam objects.'
+
+    def handle(self, *args, **options):
+        rebuild_student_term_results()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d student term results.' % StudentTermResult.objects.count()
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from exam_module.dashboard import refresh_dashboard_statistics
+
+
+class Command(BaseCommand):
+    '''
+    Recompute the dashboard statistics snapshot, e.g. from cron.
+    '''
+    help = 'Recompute the statistics shown on the dashboard.'
+
+    def handle(self, *args, **options):
+        refresh_dashboard_statistics()
+        self.stdout.write(self.style.SUCCESS('Refreshed the dashboard statistics.'))
@@ -0,0 +1,51 @@
+# Generated by Django 3.0.7 on 2026-10-17 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_student_term_results(apps, schema_editor):
+    '''
+    Sum up the exam objects already in db.
+    '''
+    Exam = apps.get_model('exam_module', 'Exam')
+    StudentTermResult = apps.get_model('exam_module', 'StudentTermResult')
+    rows = Exam.objects.values('student', 'subject', 'term').annotate(
+        total=models.Sum('marks'),
+        exams_done=models.Count('pk'),
+    ).order_by()
+    StudentTermResult.objects.bulk_create([
+        StudentTermResult(
+            student_id=row['student'],
+            subject_id=row['subject'],
+            term_id=row['term'],
+            total=row['total'],
+            exams_done=row['exams_done'],
+        ) for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_auto_20200315_1545'),
+        ('exam_module', '0005_auto_20200315_1515'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentTermResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('exams_done', models.IntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.StudentProfile', to_field='reg_no')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='exam_module.Subject')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='exam_module.Term')),
+            ],
+            options={
+                'unique_together': {('student', 'subject', 'term')},
+            },
+        ),
+        migrations.RunPython(populate_student_term_results, migrations.RunPython.noop),
+    ]
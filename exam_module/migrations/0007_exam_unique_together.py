@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_exams(apps, schema_editor):
+    '''
+    Keep the latest exam object of each student, subject, exam type
+    and term, then recompute the totals of the rows affected.
+    '''
+    Exam = apps.get_model('exam_module', 'Exam')
+    StudentTermResult = apps.get_model('exam_module', 'StudentTermResult')
+    duplicates = Exam.objects.values('student', 'subject', 'exam_type', 'term').annotate(
+        latest=models.Max('pk'),
+        count=models.Count('pk'),
+    ).filter(count__gt=1).order_by()
+    for row in duplicates:
+        Exam.objects.filter(
+            student=row['student'],
+            subject=row['subject'],
+            exam_type=row['exam_type'],
+            term=row['term'],
+        ).exclude(pk=row['latest']).delete()
+
+        totals = Exam.objects.filter(
+            student=row['student'],
+            subject=row['subject'],
+            term=row['term'],
+        ).aggregate(total=models.Sum('marks'), exams_done=models.Count('pk'))
+        StudentTermResult.objects.filter(
+            student=row['student'],
+            subject=row['subject'],
+            term=row['term'],
+        ).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_module', '0006_studenttermresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_exams, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='exam',
+            unique_together={('student', 'subject', 'exam_type', 'term')},
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['term', 'exam_type'], name='exam_term_exam_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['student', 'term'], name='exam_student_term_idx'),
+        ),
+    ]
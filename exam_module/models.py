@@ -50,6 +50,16 @@ class Exam(models.Model):
     date_done = models.DateField()
     marks = models.DecimalField(max_digits=4, decimal_places=2)
 
+    class Meta:
+        # one exam object per student, subject, exam type and term.
+        # written with utils.upsert_exams.
+        unique_together = ('student', 'subject', 'exam_type', 'term')
+        indexes = [
+            # reports read a whole sitting or a student's term
+            models.Index(fields=['term', 'exam_type'], name='exam_term_exam_type_idx'),
+            models.Index(fields=['student', 'term'], name='exam_student_term_idx'),
+        ]
+
 class GradingSystem(models.Model):
     '''
     Maps a given decimal value to a grade.
@@ -62,4 +72,20 @@ class SubjectsDoneByStudent(models.Model):
     Allows for students to do selected subjects not all.
     '''
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE)
-    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
\ No newline at end of file
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+
+class StudentTermResult(models.Model):
+    '''
+    The total marks a student scored in a subject in a term,
+    summed over all the exam types. Kept up to date whenever
+    marks are written so that reports read one row per subject
+    instead of summing the exam objects.
+    '''
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, to_field='reg_no')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    term = models.ForeignKey(Term, on_delete=models.CASCADE)
+    total = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    exams_done = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('student', 'subject', 'term')
@@ -0,0 +1,115 @@
+from django import forms
+
+from .report_cache import get_version, bump_version
+
+# kept in the versions cache, shared by every process, next to the
+# data version
+REFERENCE_VERSION_KEY = 'exam_module:reference_version'
+
+def get_reference_version():
+    '''
+    A token that changes whenever subjects, exam types, terms or
+    streams are written (see settings_module.signals).
+    '''
+    return get_version(REFERENCE_VERSION_KEY)
+
+def bump_reference_version(**kwargs):
+    '''
+    Make every process reload the reference data. Accepts signal
+    kwargs.
+    '''
+    bump_version(REFERENCE_VERSION_KEY)
+
+class ReferenceCache:
+    '''
+    A process wide cache of the rows of reference data querysets,
+    e.g. Subject.objects.all(). The rows are kept with the reference
+    version they were read at and read again once it changes, so a
+    change made through any process is seen by the next request. The
+    version is read once per version scope, not per lookup.
+    The objects are shared, they must not be modified.
+    '''
+    def __init__(self):
+        self._rows = {}
+
+    def get(self, queryset):
+        '''
+        The list of objects of queryset.
+        '''
+        key = (queryset.model, str(queryset.query))
+        version = get_reference_version()
+        cached = self._rows.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, list(queryset))
+            self._rows[key] = cached
+        return cached[1]
+
+reference_cache = ReferenceCache()
+
+class ReferenceChoiceIterator:
+    '''
+    Choices of a reference field, read when the widget is rendered.
+    '''
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.get_objects():
+            yield (self.field.prepare_value(obj), self.field.label_from_instance(obj))
+
+    def __len__(self):
+        return len(self.field.get_objects()) + (self.field.empty_label is not None)
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    '''
+    A ModelChoiceField over reference data rendered and validated from
+    the reference cache instead of the database.
+    '''
+    iterator = ReferenceChoiceIterator
+
+    def get_objects(self):
+        return reference_cache.get(self.queryset)
+
+    def get_object(self, value):
+        key = self.to_field_name or 'pk'
+        for obj in self.get_objects():
+            if str(getattr(obj, key)) == str(value):
+                return obj
+        raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+    def _get_choices(self):
+        return self.iterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        return self.get_object(value)
+
+class ReferenceMultipleChoiceField(forms.ModelMultipleChoiceField):
+    '''
+    A ModelMultipleChoiceField over reference data, cleans to a list
+    of the selected objects.
+    '''
+    iterator = ReferenceChoiceIterator
+    get_objects = ReferenceChoiceField.get_objects
+    choices = ReferenceChoiceField.choices
+
+    def _check_values(self, value):
+        key = self.to_field_name or 'pk'
+        try:
+            selected = {str(v) for v in value}
+        except TypeError:
+            raise forms.ValidationError(self.error_messages['list'], code='list')
+        objects = [obj for obj in self.get_objects() if str(getattr(obj, key)) in selected]
+        found = {str(getattr(obj, key)) for obj in objects}
+        for v in selected - found:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': v},
+            )
+        return objects
@@ -0,0 +1,143 @@
+import contextlib
+import hashlib
+import json
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+# generated pdfs are kept in this cache, the version tokens in the
+# other (see CACHES in settings)
+REPORTS_CACHE = 'reports'
+VERSIONS_CACHE = 'versions'
+DATA_VERSION_KEY = 'exam_module:data_version'
+
+# content types of the reports by file extension, pdfs are shown
+# inline and the others downloaded
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def get_reports_cache():
+    return caches[REPORTS_CACHE]
+
+def get_versions_cache():
+    return caches[VERSIONS_CACHE]
+
+# the version tokens read in the current scope, see version_scope
+_local = threading.local()
+
+def get_version(key):
+    '''
+    The version token kept under key in the versions cache, made on
+    first use. Inside a version scope each token is read from the
+    cache once.
+    '''
+    versions = getattr(_local, 'versions', None)
+    if versions is not None and key in versions:
+        return versions[key]
+    version = get_versions_cache().get_or_set(key, lambda: uuid.uuid4().hex, None)
+    if versions is not None:
+        versions[key] = version
+    return version
+
+def bump_version(key):
+    '''
+    Change the version token kept under key, in the current scope too.
+    '''
+    version = uuid.uuid4().hex
+    get_versions_cache().set(key, version, None)
+    versions = getattr(_local, 'versions', None)
+    if versions is not None:
+        versions[key] = version
+
+@contextlib.contextmanager
+def version_scope():
+    '''
+    Read each version token at most once inside the block, e.g. a
+    request or a job. A change made by another process meanwhile is
+    seen by the next scope. Also usable as a decorator.
+    '''
+    versions = getattr(_local, 'versions', None)
+    if versions is not None: # nested, the outer scope reads them
+        yield
+        return
+    _local.versions = {}
+    try:
+        yield
+    finally:
+        _local.versions = None
+
+class VersionScopeMiddleware:
+    '''
+    Give each request its own version scope.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with version_scope():
+            return self.get_response(request)
+
+def get_data_version():
+    '''
+    A token that changes whenever data shown on reports is written,
+    i.e. exam objects, the grading system, students and the subjects
+    they do. Kept in the versions cache so that job workers in other
+    processes see the same token.
+    '''
+    return get_version(DATA_VERSION_KEY)
+
+def bump_data_version(**kwargs):
+    '''
+    Invalidate every cached report. Accepts signal kwargs.
+    '''
+    bump_version(DATA_VERSION_KEY)
+
+def get_report_key(name, params):
+    '''
+    Key of the report name generated with params (a json serializable
+    dict) from the current data. Also used as the report's ETag.
+    '''
+    key = json.dumps([name, params, get_data_version()], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def get_cached_report(key):
+    '''
+    Returns (filename, content) or None.
+    '''
+    return get_reports_cache().get(key)
+
+def set_cached_report(key, filename, content):
+    get_reports_cache().set(key, (filename, content))
+
+def report_response(request, key, build=None):
+    '''
+    Serve the report cached under key, calling build() to generate
+    (filename, content) on a miss. Conditional GET requests whose
+    If-None-Match matches the key get a 304.
+    '''
+    etag = '"%s"' % key
+    if request.method in ('GET', 'HEAD') and etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    report = get_cached_report(key)
+    if report is None:
+        report = build()
+        set_cached_report(key, *report)
+    filename, content = report
+    extension = filename.rsplit('.', 1)[-1].lower()
+
+    response = HttpResponse(content, content_type=CONTENT_TYPES.get(extension, 'application/pdf'))
+    response['Content-Disposition'] = '%s; filename="%s"' % ('inline' if extension == 'pdf' else 'attachment', filename)
+    response['ETag'] = etag
+    # revalidate every time, the data may have changed
+    response['Cache-Control'] = 'private, no-cache'
+    return response
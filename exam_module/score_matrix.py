@@ -0,0 +1,121 @@
+import numpy as np
+
+from .models import (
+    Subject,
+    Exam,
+    SubjectsDoneByStudent,
+)
+from .utils import grade_resolver
+
+
+class ScoreMatrix:
+    '''
+    The marks of one cohort in a given term held in a dense
+    students x subjects x exam types array, together with a
+    students x subjects mask of the subjects each student does.
+    Totals, averages, positions and grades are computed on the
+    whole cohort at once.
+    '''
+
+    def __init__(self, students, subjects, exam_types, marks, enrolled):
+        self.students = students
+        self.subjects = subjects
+        self.exam_types = exam_types
+        self.marks = marks
+        self.enrolled = enrolled
+
+    @classmethod
+    def load(cls, students, exam_types, term):
+        '''
+        Build the matrix for the given students (a list of StudentProfile),
+        exam_types and term. Marks are read in a single query, missing
+        marks are zero.
+        '''
+        students = list(students)
+        subjects = list(Subject.objects.order_by('pk'))
+        exam_types = list(exam_types)
+
+        student_index = {s.reg_no: i for i, s in enumerate(students)}
+        student_pk_index = {s.pk: i for i, s in enumerate(students)}
+        subject_index = {s.pk: i for i, s in enumerate(subjects)}
+        exam_type_index = {e.pk: i for i, e in enumerate(exam_types)}
+
+        marks = np.zeros((len(students), len(subjects), len(exam_types)))
+        rows = Exam.objects.filter(
+            student__in=list(student_index),
+            term=term,
+            exam_type__in=exam_types,
+        ).values_list('student', 'subject', 'exam_type', 'marks')
+        for reg_no, subject_id, exam_type_id, mark in rows.iterator():
+            marks[student_index[reg_no], subject_index[subject_id], exam_type_index[exam_type_id]] = mark
+
+        enrolled = np.zeros((len(students), len(subjects)), dtype=bool)
+        rows = SubjectsDoneByStudent.objects.filter(
+            student__in=list(student_pk_index),
+        ).values_list('student', 'subject')
+        for student_id, subject_id in rows:
+            enrolled[student_pk_index[student_id], subject_index[subject_id]] = True
+
+        return cls(students, subjects, exam_types, marks, enrolled)
+
+    def subject_averages(self):
+        '''
+        students x subjects average over the exam types, zero
+        for subjects not done by the student.
+        '''
+        if not self.exam_types:
+            return np.zeros(self.enrolled.shape)
+        return np.round(self.marks.sum(axis=2) / len(self.exam_types), 2) * self.enrolled
+
+    def totals(self):
+        '''
+        Total marks of each student over the subjects they do.
+        '''
+        return (self.marks.sum(axis=2) * self.enrolled).sum(axis=1)
+
+    def averages(self):
+        '''
+        Average score of each student, the total divided by the
+        number of exam types and subjects done.
+        '''
+        count = self.enrolled.sum(axis=1) * len(self.exam_types)
+        averages = np.divide(self.totals(), count, out=np.zeros(len(self.students)), where=count > 0)
+        return np.round(averages, 2)
+
+    def positions(self, averages=None):
+        '''
+        Position of each student by average, equal averages share
+        a position i.e. 1, 2, 2, 4.
+        '''
+        averages = self.averages() if averages is None else averages
+        ascending = np.sort(averages)
+        # one more than the number of students with a greater average
+        return len(averages) - np.searchsorted(ascending, averages, side='right') + 1
+
+    def grades(self, averages=None):
+        '''
+        Resolve the grade of each average against the grading system.
+        '''
+        averages = self.averages() if averages is None else averages
+        bounds, grades = grade_resolver.get_table()
+        grades = np.array(['**'] + grades, dtype=object)
+        return grades[np.searchsorted(bounds, averages, side='right')]
+
+    def ranking(self):
+        '''
+        Returns a list of dicts {'student', 'total', 'avg', 'position', 'grade'}
+        sorted by position.
+        '''
+        totals = self.totals()
+        averages = self.averages()
+        positions = self.positions(averages)
+        grades = self.grades(averages)
+        return [
+            {
+                'student': self.students[i],
+                'total': round(float(totals[i]), 2),
+                'avg': float(averages[i]),
+                'position': int(positions[i]),
+                'grade': grades[i],
+            } for i in np.argsort(positions, kind='stable')
+        ]
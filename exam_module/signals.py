@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import StudentProfile
+
+from .models import (
+    Exam,
+    GradingSystem,
+    SubjectsDoneByStudent,
+)
+from .report_cache import bump_data_version
+from .utils import schedule_term_results_rebuild
+
+
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+@receiver(post_save, sender=GradingSystem)
+@receiver(post_delete, sender=GradingSystem)
+@receiver(post_save, sender=SubjectsDoneByStudent)
+@receiver(post_delete, sender=SubjectsDoneByStudent)
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+def invalidate_reports(sender, **kwargs):
+    '''
+    Cached reports are keyed by the data version, a new version
+    makes them stale. Bumped again on commit so that no report built
+    from the uncommitted data is kept under the new version.
+    '''
+    bump_data_version()
+    transaction.on_commit(bump_data_version)
+
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+def rebuild_term_results(sender, instance, **kwargs):
+    '''
+    Keep the term results in step with exam objects saved or deleted
+    outside of upsert_exams, e.g. from the admin or by a cascade of
+    their exam type. Rebuilt once per transaction.
+    '''
+    schedule_term_results_rebuild(instance.student_id, instance.subject_id, instance.term_id)
@@ -0,0 +1,234 @@
+'''
+Rendering of results slips. This module only depends on fpdf so that
+pages can be rendered in worker processes that don't set up django.
+
+A slip is a plain dict:
+    {
+        'reg_no', 'name', 'form', 'stream', 'term', 'year',
+        'subjects': [(name, average, grade), ...] sorted by average,
+        'avg', 'grade', 'position', 'printed_on',
+    }
+
+The parts of a page that don't change between students are laid out
+once per process by SlipLayout, see exam_module.utils.get_results_slips
+for building the slips.
+'''
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf import FPDF
+
+# fonts are numbered in the order they are first used, every pdf
+# uses them in this order so that pages can be moved between pdfs.
+FONTS = [
+    ('Times', 'B', 16),
+    ('Times', '', 12),
+    ('Arial', '', 10),
+]
+
+# students rendered per task sent to a worker process
+CHUNK_SIZE = 25
+
+def new_pdf():
+    pdf = FPDF()
+    for family, style, size in FONTS:
+        pdf.set_font(family, style, size)
+    return pdf
+
+class SlipLayout:
+    '''
+    The parts of a results slip page that are the same for every
+    student: the header, the labels, the table head and the labels
+    of the overall grade. They are drawn once, into a scratch pdf,
+    and kept as content stream snippets together with the position
+    of every value. Pages are then made by pasting the snippets and
+    drawing only the values of a student.
+    '''
+
+    def __init__(self):
+        pdf = new_pdf()
+        pdf.add_page()
+
+        # Effective page width, or just epw
+        self.epw = epw = pdf.w - 2*pdf.l_margin
+
+        # Effective page height, or just eph
+        self.eph = pdf.h - 2*pdf.b_margin
+
+        # (x, y, w, h) of each value, by slip key
+        self.fields = {}
+
+        # header, labels and thead
+        start = self.begin(pdf)
+        title = 'High School'
+        subtitle = 'Results Slip'
+        pdf.set_font('Times', 'B', 16); th = pdf.font_size
+        pdf.cell(epw, th+2, title, align='C', ln=1)
+        pdf.set_font('Times', 'B', 14); th = pdf.font_size
+        pdf.cell(epw, th+2, subtitle, align='C', ln=1, border='B')
+        pdf.ln(4)
+
+        # table
+        # title
+        pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
+        pdf.cell(epw*0.25, th, 'Registration Number: ')
+        self.field(pdf, 'reg_no', epw*0.20, th)
+        pdf.cell(epw*0.20, th, 'Name: ')
+        self.field(pdf, 'name', epw*0.25, th, ln=1)
+        pdf.cell(epw*0.25, th, 'Form: ')
+        self.field(pdf, 'class', epw*0.20, th)
+        pdf.cell(epw*0.20, th, 'Term: ')
+        self.field(pdf, 'term', epw*0.25, th, ln=1)
+        pdf.ln(2)
+
+        # thead
+        pdf.set_font('Times', 'B', 12); th = pdf.font_size * 1.5
+        pdf.cell(epw*0.05, th, 'No.', align='C', border=1)
+        pdf.cell(epw*0.40, th, 'Subjects', align='C', border=1)
+        pdf.cell(epw*0.25, th, 'Average', align='C', border=1)
+        pdf.cell(epw*0.25, th, 'Grade', align='C', border=1)
+        pdf.ln()
+        self.head = self.end(pdf, start)
+        self.tbody_y = pdf.get_y()
+
+        # overall grade, drawn below the last subject of each slip.
+        # Laid out here as if there were no subjects, then moved down.
+        start = self.begin(pdf)
+        pdf.ln(2)
+        pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
+        pdf.cell(epw*0.25, th, 'Average: ')
+        self.field(pdf, 'avg', epw*0.75, th, ln=1)
+        pdf.cell(epw*0.25, th, 'Grade: ')
+        self.field(pdf, 'grade', epw*0.75, th, ln=1)
+        pdf.cell(epw*0.25, th, 'Position: ') # student's position
+        self.field(pdf, 'position', epw*0.75, th, ln=1)
+        self.summary = self.end(pdf, start)
+
+        # footer
+        pdf.set_font('Arial', '', 10); th = pdf.font_size
+        self.fields['printed_on'] = (pdf.l_margin, self.eph - th, epw, th)
+
+    def begin(self, pdf):
+        # make the snippet set its own fonts
+        pdf.font_family = ''
+        return len(pdf.pages[pdf.page])
+
+    def end(self, pdf, start):
+        return pdf.pages[pdf.page][start:]
+
+    def field(self, pdf, key, w, h, ln=0):
+        self.fields[key] = (pdf.get_x(), pdf.get_y(), w, h)
+        pdf.cell(w, h, '', ln=ln)
+
+    def paste(self, pdf, snippet, dy=0):
+        '''
+        Append snippet to the current page, moved dy down.
+        '''
+        if dy:
+            snippet = 'q 1 0 0 1 0 %.2f cm\n%sQ\n' % (-dy*pdf.k, snippet)
+        pdf.pages[pdf.page] += snippet
+        # fpdf doesn't know the font the snippet left set
+        pdf.font_family = ''
+
+    def value(self, pdf, key, text, dy=0, align=''):
+        x, y, w, h = self.fields[key]
+        pdf.set_xy(x, y + dy)
+        pdf.cell(w, h, text, align=align)
+
+    def render(self, pdf, slip):
+        '''
+        Add a page with the results slip of one student to pdf.
+        '''
+        epw = self.epw
+        pdf.add_page()
+        self.paste(pdf, self.head)
+
+        pdf.set_font('Times', '', 12)
+        self.value(pdf, 'reg_no', '%s' % slip['reg_no'])
+        self.value(pdf, 'name', '%s' % slip['name'])
+        self.value(pdf, 'class', '%s %s' % (slip['form'], slip['stream']))
+        self.value(pdf, 'term', '%s %s' % (slip['term'], slip['year']))
+
+        # tbody
+        pdf.set_xy(pdf.l_margin, self.tbody_y)
+        th = pdf.font_size * 1.5
+        for i, (name, avg, grade) in enumerate(slip['subjects']):
+            pdf.cell(epw*0.05, th, str(i+1), border=1)
+            pdf.cell(epw*0.40, th, name.capitalize(), border=1)
+            pdf.cell(epw*0.25, th, str(avg), border=1, align='C')
+            pdf.cell(epw*0.25, th, grade, border=1, align='C')
+            pdf.ln()
+
+        # overall grade
+        dy = pdf.get_y() - self.tbody_y
+        self.paste(pdf, self.summary, dy)
+        pdf.set_font('Times', '', 12)
+        self.value(pdf, 'avg', str(slip['avg']), dy)
+        self.value(pdf, 'position', slip['position'], dy)
+        pdf.set_font('Times', 'B', 12)
+        self.value(pdf, 'grade', slip['grade'], dy)
+
+        # footer
+        pdf.set_font('Arial', '', 10)
+        self.value(pdf, 'printed_on', 'Printed On: %s' % slip['printed_on'], align='C')
+
+@functools.lru_cache(maxsize=None)
+def get_slip_layout():
+    '''
+    The SlipLayout of this process, laid out on first use.
+    '''
+    return SlipLayout()
+
+def render_slip_page(pdf, slip):
+    '''
+    Add a page with the results slip of one student to pdf.
+    '''
+    get_slip_layout().render(pdf, slip)
+
+def render_slip_pages(slips):
+    '''
+    Render slips in a pdf of their own and return the content
+    stream of each page.
+    '''
+    pdf = new_pdf()
+    for slip in slips:
+        render_slip_page(pdf, slip)
+    return [pdf.pages[n] for n in range(1, pdf.page + 1)]
+
+def render_slips(slips, processes=None, chunk_size=CHUNK_SIZE, progress=None):
+    '''
+    Render the slips into one pdf, one page per slip in the given
+    order, and return it as bytes. Pages are rendered in chunks of
+    chunk_size across processes worker processes (defaults to the
+    number of cpus), then copied into the final pdf. Runs with one
+    chunk or one process are rendered here.
+    progress, if given, is called with the number of slips done.
+    '''
+    processes = processes or os.cpu_count() or 1
+    chunks = [slips[i:i + chunk_size] for i in range(0, len(slips), chunk_size)]
+
+    if processes == 1 or len(chunks) <= 1:
+        results = map(render_slip_pages, chunks)
+        executor = None
+    else:
+        # spawn, the workers don't need the state of this (threaded) process
+        executor = ProcessPoolExecutor(
+            max_workers=min(processes, len(chunks)),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        results = executor.map(render_slip_pages, chunks)
+
+    pdf = new_pdf()
+    try:
+        for pages in results: # in order
+            for page in pages:
+                pdf.add_page()
+                pdf.pages[pdf.page] = page
+            if progress:
+                progress(pdf.page)
+    finally:
+        if executor:
+            executor.shutdown()
+    return pdf.output(dest='S').encode('latin-1')
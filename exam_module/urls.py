@@ -8,9 +8,16 @@ urlpatterns = [
     path('create/one/', views.CreateOneExamView.as_view(), name='create_one_exam'),
     path('create/many/filter/', views.CreateManyExamsFilterView.as_view(), name='create_many_exams_filter'),
     path('create/many/', views.CreateManyExamsView.as_view(), name='create_many_exams'),
+    path('create/many/autosave/', views.AutosaveMarksView.as_view(), name='autosave_marks'),
+    path('create/broadsheet/', views.BroadsheetEntryView.as_view(), name='broadsheet_entry'),
+    path('import/marks/', views.ImportMarksView.as_view(), name='import_marks'),
     path('reports/', views.ExamReportsView.as_view(), name='exam_reports_home'),
     path('reports/generate/', views.GenerateExamReportsView.as_view(), name='generate_exam_reports'),
+    path('reports/broadsheet/', views.BroadsheetReportView.as_view(), name='broadsheet_report'),
     path('results_slip/per_student/', views.GenerateResultsSlipPerStudentView.as_view(), name='generate_results_slip_per_student'),
     path('results_slip/per_class/', views.GenerateResultsSlipPerClassView.as_view(), name='generate_results_slip_per_class'),
+    path('analytics/subjects/', views.SubjectAnalyticsView.as_view(), name='subject_analytics'),
+    path('analytics/subjects/json/', views.SubjectAnalyticsJSONView.as_view(), name='subject_analytics_json'),
+    path('dashboard/statistics/', views.DashboardStatisticsView.as_view(), name='dashboard_statistics'),
     
 ] 
\ No newline at end of file
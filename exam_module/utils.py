@@ -1,64 +1,527 @@
-from exam_module.models import GradingSystem, SubjectsDoneByStudent, Exam
+import bisect
+import datetime
+import threading
 
+from django import forms
+from django.db import transaction, connection
+from django.db.models import F, OuterRef, Subquery, Sum, Count, DecimalField, IntegerField
+
+from accounts.models import StudentProfile
+
+from exam_module.report_cache import bump_data_version, get_version, bump_version
+from exam_module.reference_data import reference_cache
+from exam_module.models import (
+    GradingSystem,
+    SubjectsDoneByStudent,
+    Exam,
+    ExamType,
+    StudentTermResult,
+)
+
+
+# kept in the versions cache, next to the data version
+GRADING_VERSION_KEY = 'exam_module:grading_version'
+
+class GradeResolver:
+    '''
+    A process wide lookup table of the grading system. The greatest
+    lower bounds are loaded once, sorted, and grades are resolved by
+    binary search. The table is kept with the grading version it was
+    read at, a token in the shared versions cache that settings_module
+    changes whenever the grading system changes, so every process
+    (e.g. job workers) reloads it. The token is read once per version
+    scope, i.e. per request or job, not per grade.
+    '''
+    def __init__(self):
+        self._table = None
+
+    def invalidate(self):
+        '''
+        Make every process reload the grading system.
+        '''
+        bump_version(GRADING_VERSION_KEY)
+
+    def get_table(self):
+        '''
+        Returns a tuple (bounds, grades) sorted by bounds ascending.
+        '''
+        version = get_version(GRADING_VERSION_KEY)
+        table = self._table
+        if table is None or table[0] != version:
+            rows = GradingSystem.objects.order_by('greatest_lower_bound').values_list('greatest_lower_bound', 'grade')
+            table = (
+                version,
+                [float(bound) for bound, grade in rows],
+                [grade for bound, grade in rows],
+            )
+            self._table = table
+        return table[1], table[2]
+
+    def get_grade(self, marks):
+        return self.get_grades([marks])[0]
+
+    def get_grades(self, marks_list):
+        bounds, grades = self.get_table()
+        result = []
+        for marks in marks_list:
+            i = bisect.bisect_right(bounds, float(marks))
+            result.append(grades[i-1] if i else '**')
+        return result
+
+grade_resolver = GradeResolver()
 
 def get_grade(marks):
     '''
     Resolve the grade from grading system based on marks.
     Otherwise return '**'.
     '''
-    grading_system = GradingSystem.objects.all().order_by('-greatest_lower_bound')
-    for item in grading_system:
-        if marks >= item.greatest_lower_bound:
-            return item.grade
-    return '**'
+    return grade_resolver.get_grade(marks)
+
+def get_grades(marks_list):
+    '''
+    Resolve the grades of a list of marks in one call.
+    '''
+    return grade_resolver.get_grades(marks_list)
+
+def get_term_results(term, exam_types, group_by=('student', 'subject')):
+    '''
+    Returns a values queryset of the given group_by fields annotated
+    with 'total', the marks scored in the given term and exam_types,
+    and 'exams_done', the number of exams sat. Only subjects done by
+    the student count. The precomputed StudentTermResult rows are read
+    when exam_types covers all the exam types, otherwise the exam
+    objects are summed.
+    '''
+    if len(exam_types) >= ExamType.objects.count():
+        query_set = StudentTermResult.objects.filter(term=term)
+        annotations = {'total': Sum('total'), 'exams_done': Sum('exams_done')}
+    else:
+        query_set = Exam.objects.filter(term=term, exam_type__in=exam_types)
+        annotations = {'total': Sum('marks'), 'exams_done': Count('pk')}
+    query_set = query_set.filter(subject__subjectsdonebystudent__student__reg_no=F('student'))
+    return query_set.values(*group_by).annotate(**annotations).order_by()
+
+def get_class_positions(students, exam_types, term):
+    '''
+    Based on the given term and exam_types, determine an average
+    score for every student in the students queryset using a single
+    aggregate query. Only marks of subjects done by a student count.
+    Returns a dict mapping each reg_no to {'avg': ..., 'position': ...}.
+    Students with equal averages share a position, the next student
+    skips the shared places i.e. 1, 2, 2, 4.
+    '''
+    totals = get_term_results(term, exam_types, group_by=('student',)).filter(
+        student=OuterRef('reg_no'),
+    ).values('total')
+    subjects_done = SubjectsDoneByStudent.objects.filter(
+        student=OuterRef('pk'),
+    ).values('student').annotate(count=Count('pk')).values('count')
+
+    rows = students.annotate(
+        total=Subquery(totals, output_field=DecimalField()),
+        subjects_done=Subquery(subjects_done, output_field=IntegerField()),
+    ).values_list('reg_no', 'total', 'subjects_done')
+
+    tet = len(exam_types) # total exam types
+    averages = []
+    for reg_no, total, subjects_done in rows:
+        avg = 0.0
+        if total is not None and subjects_done:
+            avg = round(float(total) / (tet * subjects_done), 2)
+        averages.append((reg_no, avg))
+
+    positions = get_positions(averages)
+    return {
+        reg_no: {'avg': avg, 'position': positions[reg_no]}
+        for reg_no, avg in averages
+    }
+
+def get_positions(averages):
+    '''
+    Rank a list of (reg_no, avg) pairs by avg, returns a dict mapping
+    each reg_no to its position. Equal averages share a position, the
+    next student skips the shared places i.e. 1, 2, 2, 4.
+    '''
+    positions = {}
+    position = 0
+    previous_avg = None
+    for i, (reg_no, avg) in enumerate(sorted(averages, key=lambda a: a[1], reverse=True)):
+        if avg != previous_avg: # a tie keeps the previous position
+            position = i + 1
+            previous_avg = avg
+        positions[reg_no] = position
+    return positions
+
+def get_results_slips(students, exam_types, term, positions):
+    '''
+    Pre-aggregated data of the results slips of the students queryset
+    in the given term and exam_types, as expected by
+    exam_module.slips. positions is get_class_positions of the class
+    the students are ranked in. Reads the subject totals and the
+    subjects done by all students in one query each.
+    '''
+    students = students.select_related('user', 'stream')
+    totals = {
+        (row['student'], row['subject']): float(row['total'])
+        for row in get_term_results(term, exam_types).filter(student__in=students.values('reg_no'))
+    }
+    subjects_done = {}
+    for sd in SubjectsDoneByStudent.objects.filter(student__in=students).select_related('student', 'subject'):
+        subjects_done.setdefault(sd.student.reg_no, []).append(sd.subject)
+
+    tet = len(exam_types) # total exam types requested
+    now = datetime.datetime.now()
+    slips = []
+    for student in students:
+        subjects = []
+        for subject in subjects_done.get(student.reg_no, []):
+            avg = round(totals.get((student.reg_no, subject.pk), 0.0) / tet, 2)
+            subjects.append((subject.name, avg, get_grade(avg)))
+        subjects.sort(key=lambda sd: sd[1], reverse=True)
+
+        # overall grade
+        avg = round(sum(sd[1] for sd in subjects) / len(subjects), 2) if subjects else 0.0
+        slips.append({
+            'reg_no': student.reg_no,
+            'name': '%s %s %s' % (student.user.first_name, student.user.middle_name, student.user.last_name),
+            'form': student.get_form(),
+            'stream': student.stream.name,
+            'term': term.name,
+            'year': now.year,
+            'subjects': subjects,
+            'avg': avg,
+            'grade': get_grade(avg),
+            'position': '%d Out of %d' % (positions[student.reg_no]['position'], len(positions)),
+            'printed_on': '%s/%s/%s' % (now.day, now.month, now.year),
+        })
+    return slips
+
+def rebuild_student_term_results(**filters):
+    '''
+    Recompute the StudentTermResult rows from the exam objects
+    matching filters i.e. student_id, subject, term. Rebuilds
+    everything if no filters are given.
+    '''
+    rows = Exam.objects.filter(**filters).values('student', 'subject', 'term').annotate(
+        total=Sum('marks'),
+        exams_done=Count('pk'),
+    ).order_by()
+    with transaction.atomic():
+        StudentTermResult.objects.filter(**filters).delete()
+        StudentTermResult.objects.bulk_create([
+            StudentTermResult(
+                student_id=row['student'],
+                subject_id=row['subject'],
+                term_id=row['term'],
+                total=row['total'],
+                exams_done=row['exams_done'],
+            ) for row in rows.iterator()
+        ], batch_size=500)
+
+# marks are validated like the marks field of CreateExamForm
+marks_field = forms.DecimalField(max_digits=4, decimal_places=2, min_value=0)
+
+# (student_id, subject_id, term_id) of the exam objects saved or
+# deleted in the current transaction, see schedule_term_results_rebuild
+_scheduled = threading.local()
+
+def schedule_term_results_rebuild(student_id, subject_id, term_id):
+    '''
+    Rebuild the term results of a student in a subject and term once
+    the current transaction commits (at once outside a transaction).
+    The keys of a whole transaction, e.g. all the exam objects deleted
+    by a cascade, are rebuilt together.
+    '''
+    # the callback is dropped by django if the transaction is rolled
+    # back, the keys scheduled with it are dropped too
+    connection = transaction.get_connection()
+    scheduled = any(func is rebuild_scheduled_term_results for sids, func in connection.run_on_commit)
+    if not scheduled:
+        _scheduled.keys = set()
+    _scheduled.keys.add((student_id, subject_id, term_id))
+    if not scheduled:
+        # outside a transaction this runs at once
+        transaction.on_commit(rebuild_scheduled_term_results)
+
+def rebuild_scheduled_term_results():
+    '''
+    Rebuild the scheduled term results, one rebuild per term of the
+    students and subjects scheduled in it.
+    '''
+    keys = getattr(_scheduled, 'keys', None) or set()
+    _scheduled.keys = set()
+    terms = {}
+    for student_id, subject_id, term_id in keys:
+        students, subjects = terms.setdefault(term_id, (set(), set()))
+        students.add(student_id)
+        subjects.add(subject_id)
+    for term_id, (students, subjects) in terms.items():
+        students = sorted(students)
+        for i in range(0, len(students), 500):
+            rebuild_student_term_results(student_id__in=students[i:i + 500], subject_id__in=subjects, term_id=term_id)
+
+def validate_exam_entries(entries):
+    '''
+    Validate a list of exam entries, dicts with the keys reg_no,
+    subject, exam_type, term, date_done and marks. The students are
+    looked up in a single query.
+    Returns a tuple (valid_entries, errors) where errors is a list of
+    (entry, message) tuples.
+    '''
+    reg_nos = set(StudentProfile.objects.filter(
+        reg_no__in=[entry['reg_no'] for entry in entries],
+    ).values_list('reg_no', flat=True))
+
+    valid_entries, errors = [], []
+    for entry in entries:
+        if entry['reg_no'] not in reg_nos:
+            errors.append((entry, 'A student with this registration number is not found.'))
+            continue
+        try:
+            marks = marks_field.clean(entry['marks'])
+        except forms.ValidationError as e:
+            errors.append((entry, ' '.join(e.messages)))
+            continue
+        valid_entries.append(dict(entry, marks=marks))
+    return valid_entries, errors
 
-def get_student_position(students_list, std, exam_types, term):
+def upsert_exams(rows, batch_size=500):
     '''
-    Based on the given term and exam_types, determine an average 
-    score for all the students in students_list. Returns the position of
-    the given student(std) based on average scores in desceding order.
+    Insert or update exam objects in a single statement per batch,
+    relying on the unique (student, subject, exam_type, term) index.
+    rows is a list of (reg_no, subject_id, exam_type_id, term_id,
+    date_done, marks) tuples, at most one per key. Existing rows get
+    the new date_done and marks.
+    Uses ON CONFLICT on sqlite and postgresql and ON DUPLICATE KEY
+    UPDATE on mysql, other databases fall back to orm_upsert_exams.
     '''
-    tmp = []
-    for student in students_list:
-        exam_objects = Exam.objects.filter(
-            student = student,
-            term = term,
+    fields = [Exam._meta.get_field(name) for name in ('student', 'subject', 'exam_type', 'term', 'date_done', 'marks')]
+    qn = connection.ops.quote_name
+    columns = [qn(field.column) for field in fields]
+
+    if connection.vendor in ('sqlite', 'postgresql'):
+        on_conflict = 'ON CONFLICT (%s) DO UPDATE SET %s' % (
+            ', '.join(columns[:4]),
+            ', '.join('%s = excluded.%s' % (c, c) for c in columns[4:]),
+        )
+    elif connection.vendor == 'mysql':
+        on_conflict = 'ON DUPLICATE KEY UPDATE %s' % (
+            ', '.join('%s = VALUES(%s)' % (c, c) for c in columns[4:]),
         )
-        # just an extra precaution.
-        # get the exam objects if their subjects belong to the
-        # subjects done by this student.
-        subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student)
-        exam_objects = [eo for eo in exam_objects if eo.subject.name in [sd.subject.name for sd in subjects_done_by_student]]
-        tmp_entry = {
-            'student': student,
-            'total': 0.0,
-            'avg': 0.0,
-        }
-        for exam_object in exam_objects:
-            if exam_object.exam_type in exam_types:
-                tmp_entry['total'] += float(exam_object.marks)
-
-        tet = exam_types.count() # total exam types names
-        no_of_subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student).count()
-        avg = round(tmp_entry['total'] / (tet * no_of_subjects_done_by_student), 2) # compute avegare
-        tmp_entry['avg'] = avg
-        tmp.append(tmp_entry)
-
-    # sort tmp based on avg 
-    tmp.sort(key=lambda t: t['avg'], reverse=True)
-
-    # get position in tmp
-    p = 1
-    for tmp_entry in tmp:
-        if tmp_entry['student'] ==  std:
-            return p
-        p += 1
-    return '**'
+    else:
+        return orm_upsert_exams(rows, batch_size)
+
+    # stay below the number of query parameters allowed i.e. sqlite's 999
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, rows) or batch_size)
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    # signals are not sent for raw inserts
+    bump_data_version()
+    transaction.on_commit(bump_data_version)
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s %s' % (
+                    qn(Exam._meta.db_table),
+                    ', '.join(columns),
+                    ', '.join([placeholder] * len(batch)),
+                    on_conflict,
+                ),
+                [
+                    field.get_db_prep_save(value, connection)
+                    for row in batch for field, value in zip(fields, row)
+                ],
+            )
+
+def orm_upsert_exams(rows, batch_size=500):
+    '''
+    upsert_exams for databases without an upsert statement. The
+    existing exam objects of each batch are locked and updated with
+    bulk_update, the others are inserted with bulk_create. Takes at
+    most three queries per batch.
+    '''
+    # signals are not sent for bulk writes
+    bump_data_version()
+    transaction.on_commit(bump_data_version)
+    with transaction.atomic():
+        for i in range(0, len(rows), batch_size):
+            batch = {row[:4]: row[4:] for row in rows[i:i + batch_size]}
+            existing = Exam.objects.select_for_update().filter(
+                student__in={key[0] for key in batch},
+                subject__in={key[1] for key in batch},
+                exam_type__in={key[2] for key in batch},
+                term__in={key[3] for key in batch},
+            )
+            updated = []
+            for exam in existing:
+                key = (exam.student_id, exam.subject_id, exam.exam_type_id, exam.term_id)
+                if key in batch:
+                    exam.date_done, exam.marks = batch.pop(key)
+                    updated.append(exam)
+            Exam.objects.bulk_update(updated, ['date_done', 'marks'])
+            Exam.objects.bulk_create([
+                Exam(
+                    student_id=reg_no,
+                    subject_id=subject_id,
+                    exam_type_id=exam_type_id,
+                    term_id=term_id,
+                    date_done=date_done,
+                    marks=marks,
+                )
+                for (reg_no, subject_id, exam_type_id, term_id), (date_done, marks) in batch.items()
+            ])
+
+def get_exam_rows(entries):
+    '''
+    The upsert_exams rows of the given (validated) entries by key, the
+    last entry for a key wins.
+    '''
+    return {
+        (e['reg_no'], e['subject'].pk, e['exam_type'].pk, e['term'].pk): (e['date_done'], e['marks'])
+        for e in entries
+    }
+
+def save_exam_rows(rows, batch_size=500):
+    '''
+    Upsert the exam rows (see get_exam_rows) and rebuild the affected
+    StudentTermResult rows, in one transaction.
+    '''
+    with transaction.atomic():
+        upsert_exams([key + value for key, value in rows.items()], batch_size)
+
+        # rebuild the totals of every subject and term written to
+        written = {}
+        for reg_no, subject_id, exam_type_id, term_id in rows:
+            written.setdefault((subject_id, term_id), set()).add(reg_no)
+        for (subject_id, term_id), reg_nos in written.items():
+            rebuild_student_term_results(student_id__in=reg_nos, subject_id=subject_id, term_id=term_id)
+
+def bulk_upsert_exams(entries, batch_size=500):
+    '''
+    Create or update the exam objects of the given (validated) entries
+    in one transaction with upsert_exams. Exam objects that already
+    have the entry's date_done and marks are not written. The affected
+    StudentTermResult rows are rebuilt.
+    Returns a dict with the number of exam objects 'inserted', 'updated'
+    and 'skipped' (unchanged).
+    '''
+    rows = get_exam_rows(entries)
+    if not rows:
+        return {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+    with transaction.atomic():
+        # the stored values of the existing exam objects
+        existing = Exam.objects.filter(
+            student__in={k[0] for k in rows},
+            subject__in={k[1] for k in rows},
+            exam_type__in={k[2] for k in rows},
+            term__in={k[3] for k in rows},
+        ).values_list('student', 'subject', 'exam_type', 'term', 'date_done', 'marks')
+        stored = {row[:4]: row[4:] for row in existing}
+        changed = {key: value for key, value in rows.items() if stored.get(key) != value}
+        updated = len(set(stored) & set(changed))
+        if changed:
+            save_exam_rows(changed, batch_size)
+
+    return {'inserted': len(changed) - updated, 'updated': updated, 'skipped': len(rows) - len(changed)}
+
+def get_marks_entry_rows(students, subject, exam_type, term):
+    '''
+    Rows of the marks entry grid of the students doing subject, dicts
+    with the reg_no, name and marks ('' if not entered yet) of each
+    student in the given exam_type and term. Takes two queries, one
+    for the students and their names and one for the marks.
+    '''
+    students = students.filter(subjectsdonebystudent__subject=subject)
+    marks = dict(Exam.objects.filter(
+        student__in=students.values('reg_no'),
+        subject=subject,
+        exam_type=exam_type,
+        term=term,
+    ).values_list('student_id', 'marks'))
+    return [
+        {
+            'reg_no': reg_no,
+            'name': '%s %s %s' % (first_name, middle_name, last_name),
+            'marks': marks.get(reg_no, ''),
+        } for reg_no, first_name, middle_name, last_name in students.values_list(
+            'reg_no', 'user__first_name', 'user__middle_name', 'user__last_name',
+        )
+    ]
+
+def get_broadsheet_cell_name(reg_no, subject_id, exam_type_id):
+    # the reg_no is last, it may contain '-'
+    return 'm-%d-%d-%s' % (subject_id, exam_type_id, reg_no)
+
+def parse_broadsheet_cell_name(name):
+    '''
+    The (reg_no, subject_id, exam_type_id) of a cell name, None if
+    name is not one.
+    '''
+    parts = name.split('-', 3)
+    if len(parts) != 4 or parts[0] != 'm' or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return parts[3], int(parts[1]), int(parts[2])
+
+def get_broadsheet(students, subjects, exam_types, term):
+    '''
+    The marks entry broadsheet of students, a row per student and a
+    cell per (subject, exam type) for the subjects each student does
+    in subjects. Read in a single query of the subjects done, joined
+    with the student names, and the marks of the term in a subquery
+    per exam type. Students doing none of subjects are left out.
+    Returns a dict with the 'subjects' and 'exam_types' of the columns
+    and the 'rows', dicts with the reg_no, name and 'cells', None where
+    the student does not do the subject or a dict with the input
+    'name' and the 'marks' ('' if not entered yet), kept as the
+    'original' too.
+    '''
+    marks = {
+        'marks_%d' % exam_type.pk: Subquery(Exam.objects.filter(
+            student=OuterRef('student__reg_no'),
+            subject=OuterRef('subject'),
+            exam_type=exam_type,
+            term=term,
+        ).values('marks')[:1])
+        for exam_type in exam_types
+    }
+    enrolments = SubjectsDoneByStudent.objects.filter(
+        student__in=students,
+        subject__in=subjects,
+    ).annotate(**marks).values_list(
+        'student__reg_no', 'student__user__first_name', 'student__user__middle_name', 'student__user__last_name',
+        'subject', *marks,
+    ).order_by('student', 'subject')
+
+    rows = {}
+    for reg_no, first_name, middle_name, last_name, subject_id, *values in enrolments:
+        row = rows.setdefault(reg_no, {
+            'reg_no': reg_no,
+            'name': '%s %s %s' % (first_name, middle_name, last_name),
+            'marks': {},
+        })
+        for exam_type, value in zip(exam_types, values):
+            row['marks'][(subject_id, exam_type.pk)] = '' if value is None else value
+
+    for row in rows.values():
+        row['cells'] = []
+        for subject in subjects:
+            for exam_type in exam_types:
+                value = row['marks'].get((subject.pk, exam_type.pk))
+                name = get_broadsheet_cell_name(row['reg_no'], subject.pk, exam_type.pk)
+                row['cells'].append(None if value is None else {
+                    'name': name,
+                    # the loaded marks, to tell the edited cells
+                    'original_name': 'o' + name[1:],
+                    'original': value,
+                    'marks': value,
+                })
+    return {'subjects': subjects, 'exam_types': exam_types, 'rows': list(rows.values())}
 
 def get_objects_as_choices(model):
     '''
     Returns a list of tuples (model.object.name, model.object.name.capitalize())
     for use in widget choices.
     '''
-    CHOICES = [(obj.name, obj.name.capitalize()) for obj in model.objects.all()]
+    CHOICES = [(obj.name, obj.name.capitalize()) for obj in reference_cache.get(model.objects.all())]
     return CHOICES
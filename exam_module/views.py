@@ -1,39 +1,55 @@
 import decimal, datetime
+import json
 
-from django import forms
 from django.shortcuts import render, redirect, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib import messages
-
-from crispy_forms.helper import FormHelper
-from crispy_forms.layout import (
-    Layout,
-    HTML,
-    Field,
-    Submit,
-)
+from django.db import transaction
 
 from fpdf import FPDF
 
+from accounts.identity_map import get_identity_map
 from accounts.models import StudentProfile
+from jobs_module.runner import submit_job
 
 from .forms import (
     CreateExamForm,
     CreateManyExamsFilterForm,
+    AutosaveMarksForm,
+    BroadsheetEntryFilterForm,
+    BroadsheetReportFilterForm,
     ExamReportsFilterForm,
     GenerateResultsSlipPerStudentFilterForm,
     GenerateResultsSlipPerClassFilterForm,
+    ImportMarksForm,
+    SubjectAnalyticsFilterForm,
 )
-from .models import (
-    Subject,
-    ExamType,
-    Term,
-    Exam,
-    SubjectsDoneByStudent,
+from .models import Exam
+from .utils import (
+    get_grade,
+    get_class_positions,
+    get_results_slips,
+    rebuild_student_term_results,
+    upsert_exams,
+    validate_exam_entries,
+    bulk_upsert_exams,
+    get_marks_entry_rows,
+    get_exam_rows,
+    save_exam_rows,
+    get_broadsheet,
+    parse_broadsheet_cell_name,
+    get_term_results,
 )
-from .utils import get_grade, get_student_position
+from .score_matrix import ScoreMatrix
+from .slips import render_slips
+from .report_cache import get_report_key, get_cached_report, report_response
+from .jobs import get_results_slips_per_class_key
+from .importers import read_rows, import_marks
+from .analytics import get_grade_bands, get_subject_statistics
+from .dashboard import get_dashboard_statistics
+from .broadsheet import get_broadsheet_report, BROADSHEET_RENDERERS
 
 
 class HomeView(LoginRequiredMixin, View):
@@ -65,19 +81,44 @@ class CreateOneExamView(LoginRequiredMixin, View):
             date_done = exam_form.cleaned_data.get('date_done')
             marks = exam_form.cleaned_data.get('marks')
 
-            # create instances
-            student_profile = StudentProfile.objects.get(reg_no=student_reg_no)
-            subject = Subject.objects.get(name=subject_name)
-            exam_type = ExamType.objects.get(name=exam_type_name)
-            term = Term.objects.get(name=term_name)
-            
+            # the choice fields clean to the objects, the student was
+            # looked up by the form
+            student_profile = get_identity_map().get(StudentProfile, reg_no=student_reg_no)
+
             # create the exam object and redirect
-            create_exam_object(student_profile.reg_no, subject, exam_type, term, date_done, marks)
+            create_exam_object(student_profile.reg_no, subject_name, exam_type_name, term_name, date_done, marks)
             messages.success(request, 'Data has been saved successfully.')
             return redirect(reverse('exam_module:create_one_exam'))
 
         return render(request, self.template_name, {'exam_form': exam_form})
 
+class ImportMarksView(LoginRequiredMixin, View):
+    '''
+    Save the marks of a whole exam sitting from an uploaded
+    csv or xlsx file.
+    '''
+    form_class = ImportMarksForm
+    template_name = 'exam_module/import_marks.html'
+
+    def get(self, request, *args, **kwargs):
+        import_marks_form = self.form_class()
+        return render(request, self.template_name, {'import_marks_form': import_marks_form})
+
+    def post(self, request, *args, **kwargs):
+        import_marks_form = self.form_class(request.POST, request.FILES)
+        if import_marks_form.is_valid():
+            f = import_marks_form.cleaned_data.get('file')
+            date_done = import_marks_form.cleaned_data.get('date_done')
+
+            report = import_marks(read_rows(f, f.name), date_done)
+            if report['inserted'] or report['updated'] or report['skipped']:
+                messages.success(request, 'Data has been saved successfully. %d added, %d updated, %d unchanged.' % (report['inserted'], report['updated'], report['skipped']))
+            if report['errors']:
+                messages.error(request, '%d rows have errors and were not saved.' % len(report['errors']))
+            return render(request, self.template_name, {'import_marks_form': self.form_class(), 'report': report})
+
+        return render(request, self.template_name, {'import_marks_form': import_marks_form})
+
 class CreateManyExamsFilterView(LoginRequiredMixin, View):
     '''
     Apply filters to generate a list of students for a batch exam
@@ -104,100 +145,24 @@ class CreateManyExamsFilterView(LoginRequiredMixin, View):
             # get students in the given form and stream.
             # form is determined using date_done.year 
             year_since_registration = date_done.year
-            query_set = StudentProfile.objects.filter(stream__name=stream)
-            student_list = [s for s in query_set if s.get_form(year_since_registration) == form]
-
-            # filter those students who do this particular subject
-            student_list = [s for s in student_list if subject_name.name in [sd.subject.name for sd in SubjectsDoneByStudent.objects.filter(student=s)]]
-            
-            # Create a runtime students-exams-entry-form.
-            # Embed the subject_name, exam_type_name, term_name and date_done
-            # from filter view as hidden inputs. This will be needed to create
-            # the exam object later
-            
-            # students_exams_entry_form as f
-            f = forms.Form()
-            f.fields['form'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': form}))
-            f.fields['stream'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': stream}))
-            f.fields['subject_name'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': subject_name}))
-            f.fields['exam_type_name'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': exam_type_name}))
-            f.fields['term_name'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': term_name}))
-            f.fields['date_done'] = forms.CharField(widget=forms.HiddenInput(attrs={'value': date_done}))
-
-            # instantiate crispy_forms helper
-            f.helper = FormHelper()
-            f.helper.form_method = 'post'
-            f.helper.form_action = 'exam_module:create_many_exams'
-            f.helper.form_id = 'students-exams-entry-form'
-            layout_components = [] #  Pack all layouts items here
-
-            for student in student_list:
-                # read the corresponding exam object if it exists.
-                exam_object = get_object_or_none(
-                    Exam,
-                    student__reg_no=student.reg_no,
-                    subject__name=subject_name,
-                    exam_type__name=exam_type_name,
-                    term__name=term_name,
-                )
-                # Add a number field, 'reg_no'_marks for each student. Populated with existing
-                # value or 0 otherwise
-                f.fields['%s_marks' %(student.reg_no)] = forms.CharField(widget=forms.NumberInput(attrs={
-                    'id': 'id_%s_marks' %(student.reg_no),
-                    'value': exam_object.marks if exam_object else 0,
-                    'min': 0,
-                    'max': 99.99,
-                    'step': 0.01,
-                    'class': 'marks'
-                }), label='')
-
-                # create a layout component
-                layout_components.extend([
-                    HTML(
-                        '''
-                        <tr>
-                            <td>%s</td>
-                            <td>%s %s %s</td>
-                            <td>
-                        '''%(student.reg_no,student.user.first_name,student.user.middle_name,student.user.last_name),
-                    ),
-                    Field(
-                        '%s_marks'%(student.reg_no),
-                    ),
-                    HTML(
-                        '''
-                            </td>
-                        </tr>
-                        '''
-                    )
-                ])
-            
-            # create the final layout
-            f.helper.layout = Layout(
-                # include the hidden fields
-                'form', 'stream', 'subject_name', 'exam_type_name', 'term_name', 'date_done',
-                # unpack the above components
-                *layout_components,
-                # submit button inside a <tr>
-                HTML(
-                    '''
-                    <tr>
-                        <td colspan="3">
-                    '''
-                ),
-                Submit('submit', 'Save Changes', css_class='btn btn-primary'),
-                HTML(
-                    '''
-                        </td>
-                    </tr>
-                    '''
-                )
-            )
-                
+            query_set = StudentProfile.objects.filter(stream=stream).in_form(form, year_since_registration)
+
+            # the marks entry grid, rendered by the template. The filters
+            # are embedded as hidden inputs, they are needed to create
+            # the exam objects later.
+            students_exams_entry_form = {
+                'form': form,
+                'stream': stream.name,
+                'subject_name': subject_name.name,
+                'exam_type_name': exam_type_name.name,
+                'term_name': term_name.name,
+                'date_done': date_done,
+                'rows': get_marks_entry_rows(query_set, subject_name, exam_type_name, term_name),
+            }
 
             return render(request, self.template_name, {
                 'create_many_exams_filter_form': create_many_exams_filter_form,
-                'students_exams_entry_form': f,
+                'students_exams_entry_form': students_exams_entry_form,
             })
         return render(request, self.template_name, {
             'create_many_exams_filter_form': create_many_exams_filter_form,
@@ -224,42 +189,44 @@ class CreateManyExamsView(LoginRequiredMixin, View):
         create_many_exams_filter_form = CreateManyExamsFilterForm(request.POST)
         student_reg_nos = [s[:-6] for s in request.POST.keys() if s.endswith('_marks')] # 'reg_no_marks'
 
-        errors = [] # list of all students whose marks have issues
         if create_many_exams_filter_form.is_valid():
-            subject_name = request.POST['subject_name']
-            exam_type_name = request.POST['exam_type_name']
-            term_name = request.POST['term_name']
-            date_done = request.POST['date_done']
-
-            # form is valid, we can read them
-            subject = Subject.objects.get(name=subject_name)
-            exam_type = ExamType.objects.get(name=exam_type_name)
-            term = Term.objects.get(name=term_name)
-            
-            # save marks to corresponding student
-            for reg_no in student_reg_nos:
-                try:
-                    student = StudentProfile.objects.get(reg_no=reg_no)
-                    marks=decimal.Decimal(request.POST['%s_marks' % reg_no])
-                    exam_object = create_exam_object(
-                        student.reg_no,
-                        subject,
-                        exam_type,
-                        term,
-                        date_done,
-                        marks=marks,
-                    )
-                except Exception: # catch all
-                    errors.append(reg_no)
+            subject = create_many_exams_filter_form.cleaned_data.get('subject_name')
+            exam_type = create_many_exams_filter_form.cleaned_data.get('exam_type_name')
+            term = create_many_exams_filter_form.cleaned_data.get('term_name')
+            date_done = create_many_exams_filter_form.cleaned_data.get('date_done')
+
+            # cells left as loaded are not written, they may have been
+            # changed since e.g. by autosave. A cell left blank is not
+            # written either, a cleared cell is an error as marks are
+            # not deleted from the grid.
+            edited = [
+                reg_no for reg_no in student_reg_nos
+                if not is_unchanged(request.POST['%s_marks' % reg_no], request.POST.get('%s_original' % reg_no) or '')
+            ]
+
+            # validate all the marks first, save them only if all are valid
+            entries, errors = validate_exam_entries([{
+                'reg_no': reg_no,
+                'subject': subject,
+                'exam_type': exam_type,
+                'term': term,
+                'date_done': date_done,
+                'marks': request.POST['%s_marks' % reg_no],
+            } for reg_no in edited])
 
             # show messages              
             if errors:
                 messages.error(
                     request,
-                    'Marks for registration numbers (%s) have errors.' %(', '.join(errors)) # reg_nos with errors
+                    'Marks for registration numbers (%s) have errors.' %(', '.join(entry['reg_no'] for entry, message in errors)) # reg_nos with errors
                 )
             else:
-                messages.success(request, 'Data has been saved successfully.')
+                report = bulk_upsert_exams(entries)
+                messages.success(request, 'Data has been saved successfully. %d added, %d updated, %d unchanged.' % (
+                    report['inserted'],
+                    report['updated'],
+                    report['skipped'] + len(student_reg_nos) - len(edited),
+                ))
                 r = CreateManyExamsFilterView() # workaround a redirect
                 return r.post(request)
         
@@ -268,34 +235,134 @@ class CreateManyExamsView(LoginRequiredMixin, View):
             'students_list_with_marks': None,
         })
 
+class BroadsheetEntryView(LoginRequiredMixin, View):
+    '''
+    Enter the marks of a class in several subjects and exam types of
+    a term at once, on a broadsheet of the subjects each student does.
+    The filters are in the query string, the marks are posted to the
+    same url and saved with one bulk upsert.
+    '''
+    form_class = BroadsheetEntryFilterForm
+    template_name = 'exam_module/broadsheet_entry.html'
+
+    def get_broadsheet(self, form):
+        cleaned_data = form.cleaned_data
+        students = StudentProfile.objects.filter(stream=cleaned_data['stream']).in_form(cleaned_data['form'], cleaned_data['date_done'].year)
+        return get_broadsheet(students, cleaned_data['subjects'], cleaned_data['exam_types_names'], cleaned_data['term_name'])
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET or None)
+        broadsheet = self.get_broadsheet(form) if form.is_valid() else None
+        return render(request, self.template_name, {'form': form, 'broadsheet': broadsheet})
+
+    def post(self, request, *args, **kwargs):
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return redirect(reverse('exam_module:broadsheet_entry'))
+        broadsheet = self.get_broadsheet(form)
+
+        # the edited cells of the broadsheet, cells it does not have
+        # (e.g. of subjects not done) are ignored
+        cells = {cell['name']: cell for row in broadsheet['rows'] for cell in row['cells'] if cell}
+        subjects = {subject.pk: subject for subject in form.cleaned_data['subjects']}
+        exam_types = {exam_type.pk: exam_type for exam_type in form.cleaned_data['exam_types_names']}
+        entries = []
+        for name, cell in cells.items():
+            marks = request.POST.get(name, '').strip()
+            if not marks or is_unchanged(marks, request.POST.get(cell['original_name'])):
+                continue
+            reg_no, subject_id, exam_type_id = parse_broadsheet_cell_name(name)
+            entries.append({
+                'reg_no': reg_no,
+                'subject': subjects[subject_id],
+                'exam_type': exam_types[exam_type_id],
+                'term': form.cleaned_data['term_name'],
+                'date_done': form.cleaned_data['date_done'],
+                'marks': marks,
+            })
+            # shown again if there are errors
+            cell['marks'] = marks
+
+        # validate all the marks first, save them only if all are valid
+        entries, errors = validate_exam_entries(entries)
+        if errors:
+            messages.error(
+                request,
+                'Marks for registration numbers (%s) have errors.' % ', '.join(sorted({entry['reg_no'] for entry, message in errors}))
+            )
+            return render(request, self.template_name, {'form': form, 'broadsheet': broadsheet})
+
+        report = bulk_upsert_exams(entries)
+        messages.success(request, 'Data has been saved successfully. %d added, %d updated, %d unchanged.' % (
+            report['inserted'],
+            report['updated'],
+            report['skipped'] + len(cells) - len(entries),
+        ))
+        return redirect(request.get_full_path())
+
+class AutosaveMarksView(LoginRequiredMixin, View):
+    '''
+    Save the marks changed in the marks entry grid, sent as json:
+    the subject_name, exam_type_name, term_name and date_done of the
+    grid and 'marks', a {reg_no: marks} object of the changed cells.
+    Valid marks are saved even if others have errors, the errors are
+    returned by reg_no.
+    '''
+    form_class = AutosaveMarksForm
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not isinstance(data.get('marks'), dict):
+            return JsonResponse({'errors': {'marks': ['Expected an object of marks by registration number.']}}, status=400)
+
+        form = self.form_class(data)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        entries, errors = validate_exam_entries([{
+            'reg_no': str(reg_no),
+            'subject': form.cleaned_data['subject_name'],
+            'exam_type': form.cleaned_data['exam_type_name'],
+            'term': form.cleaned_data['term_name'],
+            'date_done': form.cleaned_data['date_done'],
+            'marks': marks,
+        } for reg_no, marks in data['marks'].items()])
+        if entries:
+            save_exam_rows(get_exam_rows(entries))
+        return JsonResponse({
+            'saved': [entry['reg_no'] for entry in entries],
+            'errors': {entry['reg_no']: message for entry, message in errors},
+        })
+
 # helper functions
 
 # create and exam object
 def create_exam_object(reg_no, subject, exam_type, term, date_done, marks):
-    student_profile = StudentProfile.objects.get(reg_no=reg_no)
-    # don't duplicate the exam object.
+    '''
+    Create the exam object or update the marks and date_done of
+    an existing one with a single upsert.
+    '''
+    with transaction.atomic():
+        upsert_exams([(reg_no, subject.pk, exam_type.pk, term.pk, date_done, marks)])
+        rebuild_student_term_results(student_id=reg_no, subject=subject, term=term)
+
+def is_unchanged(marks, original):
+    '''
+    Whether the submitted marks of a grid cell equal the marks the
+    grid was loaded with. Cells without an original are changed, a
+    blank original (no marks yet) only equals blank marks.
+    '''
+    if original is None:
+        return False
+    if not marks.strip() or not original.strip():
+        return marks.strip() == original.strip()
     try:
-        exam_object = Exam.objects.get( # get to update
-            student=student_profile,
-            subject=subject,
-            exam_type=exam_type,
-            term=term,
-        )
-    except Exam.DoesNotExist: # then
-        exam_object = Exam.objects.create( # create new
-            student = student_profile,
-            subject = subject,
-            exam_type = exam_type,
-            term = term,
-            date_done = date_done,
-            marks = marks
-        )
-    else: # update the existing
-        exam_object.date_done = date_done
-        exam_object.marks = marks
-        exam_object.save()
-    
-    return exam_object
+        return decimal.Decimal(marks) == decimal.Decimal(original)
+    except decimal.InvalidOperation:
+        return False
 
 def get_object_or_none(model, **kwargs):
     '''
@@ -340,147 +407,132 @@ class GenerateExamReportsView(LoginRequiredMixin, View):
             exam_types = form.cleaned_data.get('exam_types')
             term = form.cleaned_data.get('term')
 
-            # get students
             year_offset = datetime.datetime.now().year
-            if stream.name == 'All':
-                query_set = StudentProfile.objects.all()
-            else:
-                query_set = StudentProfile.objects.filter(stream=stream)
-            students_list = [s for s in query_set if s.get_form(year_offset) == f]
-
-            # pdf
-            pdf = FPDF()
-            pdf.add_page()
-
-            # Effective page width, or just epw
-            epw = pdf.w - 2*pdf.l_margin
-
-            # table title
-            title = 'Form %d %s Exam Report' % (f, stream.name if stream.name != 'All' else '')
-            subtitle1 = 'Term %s: (%s)' % (term.name, ', '.join([exam_type.name for exam_type in exam_types]))
-            subtitle2 = 'Subjects: %s' % (subject)
-            pdf.set_font('Times', 'B', 16)
-            th = pdf.font_size # text height
-            pdf.cell(epw, th+1, title, align='C', ln=1)
-            pdf.set_font('Times', 'B', 12)
-            th = pdf.font_size
-            pdf.cell(epw, th+0.5, subtitle1, align='C', ln=1)
-            pdf.cell(epw, th+0.5, subtitle2, align='C', ln=1)
-            pdf.ln(4)
-
-            # table body
-            tmp = []
-            if subject.name == 'All': # report for all subjects
-                for student in students_list:
-                    exam_objects = Exam.objects.filter(
-                        student = student,
-                        term = term,
-                    )
-                    # just an extra precaution.
-                    # get the exam objects if their subjects belong to the
-                    # subjects done by this student.
-                    subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student)
-                    exam_objects = [eo for eo in exam_objects if eo.subject.name in [sd.subject.name for sd in subjects_done_by_student]]
-                    tmp_entry = {
-                        'student': student,
-                        'total': 0.0,
-                        'avg': 0.0,
-                    }
-                    for exam_object in exam_objects:
-                        if exam_object.exam_type.name in [exam_type.name for exam_type in exam_types]:
-                            tmp_entry['total'] += float(exam_object.marks)
-
-                    tet = exam_types.count() # total exam types names
-                    no_of_subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student).count()
-                    avg = round(tmp_entry['total'] / (tet * no_of_subjects_done_by_student), 2) # compute avegare
-                    tmp_entry['avg'] = avg
-                    tmp.append(tmp_entry)
-
-                # sort tmp based on avg 
-                tmp.sort(key=lambda t: t['avg'], reverse=True)
-
-                # output tmp
-                # thead
-                pdf.set_font('Times', 'B', 13); th = pdf.font_size # text height
-                pdf.cell(epw*0.05, th, 'No.', border=1, align='C') # 0.5% of epw
-                pdf.cell(epw*0.15, th, 'Reg No.', border=1, align='C')
-                pdf.cell(epw*0.40, th, 'Name', border=1, align='C')
-                pdf.cell(epw*0.20, th, 'Average', border=1, align='C')
-                pdf.cell(epw*0.20, th, 'Grade', border=1, align='C')
-                pdf.ln(th)
-
-                # tbody
-                for i,v in enumerate(tmp):
-                    pdf.set_font('Times', '', 12); th = pdf.font_size
-                    pdf.cell(epw*0.05, th, str(i+1), border=1) # 0.5% of epw
-                    pdf.cell(epw*0.15, th, v['student'].reg_no, border=1)
-
-                    u = v['student'].user
-                    pdf.cell(epw*0.40, th, '%s %s %s' %(u.first_name, u.middle_name, u.last_name), border=1)
-                    pdf.cell(epw*0.20, th, str(v['avg']), border=1, align='C')
-                    
-                    pdf.cell(epw*0.20, th, get_grade(v['avg']), border=1, align='C') # use get_grade utility
+
+            # repeat requests are served from the reports cache
+            key = get_report_key('exam_report', {
+                'form': f,
+                'stream': stream.name,
+                'subject': subject.name,
+                'term': term.name,
+                'year': year_offset,
+                'exam_types': sorted(exam_type.name for exam_type in exam_types),
+            })
+
+            def build():
+                # get students
+                if stream.name == 'All':
+                    query_set = StudentProfile.objects.all()
+                else:
+                    query_set = StudentProfile.objects.filter(stream=stream)
+                students_list = query_set.in_form(f, year_offset).select_related('user')
+
+                # pdf
+                pdf = FPDF()
+                pdf.add_page()
+
+                # Effective page width, or just epw
+                epw = pdf.w - 2*pdf.l_margin
+
+                # table title
+                title = 'Form %d %s Exam Report' % (f, stream.name if stream.name != 'All' else '')
+                subtitle1 = 'Term %s: (%s)' % (term.name, ', '.join([exam_type.name for exam_type in exam_types]))
+                subtitle2 = 'Subjects: %s' % (subject)
+                pdf.set_font('Times', 'B', 16)
+                th = pdf.font_size # text height
+                pdf.cell(epw, th+1, title, align='C', ln=1)
+                pdf.set_font('Times', 'B', 12)
+                th = pdf.font_size
+                pdf.cell(epw, th+0.5, subtitle1, align='C', ln=1)
+                pdf.cell(epw, th+0.5, subtitle2, align='C', ln=1)
+                pdf.ln(4)
+
+                # table body
+                tmp = []
+                if subject.name == 'All': # report for all subjects
+                    # averages, positions and grades of the whole class at once
+                    tmp = ScoreMatrix.load(students_list, exam_types, term).ranking()
+
+                    # output tmp
+                    # thead
+                    pdf.set_font('Times', 'B', 13); th = pdf.font_size # text height
+                    pdf.cell(epw*0.05, th, 'No.', border=1, align='C') # 0.5% of epw
+                    pdf.cell(epw*0.15, th, 'Reg No.', border=1, align='C')
+                    pdf.cell(epw*0.40, th, 'Name', border=1, align='C')
+                    pdf.cell(epw*0.20, th, 'Average', border=1, align='C')
+                    pdf.cell(epw*0.20, th, 'Grade', border=1, align='C')
                     pdf.ln(th)
 
-            else: # report for a particular subject
-                # get students who do that subject
-                students_list = [s for s in students_list if subject.name in [sd.subject.name for sd in SubjectsDoneByStudent.objects.filter(student=s)]]
-                for student in students_list:
-                    exam_objects = Exam.objects.filter(
-                        student=student,
+                    # tbody
+                    for i,v in enumerate(tmp):
+                        pdf.set_font('Times', '', 12); th = pdf.font_size
+                        pdf.cell(epw*0.05, th, str(i+1), border=1) # 0.5% of epw
+                        pdf.cell(epw*0.15, th, v['student'].reg_no, border=1)
+
+                        u = v['student'].user
+                        pdf.cell(epw*0.40, th, '%s %s %s' %(u.first_name, u.middle_name, u.last_name), border=1)
+                        pdf.cell(epw*0.20, th, str(v['avg']), border=1, align='C')
+
+                        pdf.cell(epw*0.20, th, v['grade'], border=1, align='C')
+                        pdf.ln(th)
+
+                else: # report for a particular subject
+                    # get students who do that subject
+                    students_list = students_list.filter(subjectsdonebystudent__subject=subject)
+                    reg_nos = students_list.values('reg_no')
+                    # totals from the term results, the marks of each exam type in one more query
+                    totals = dict(get_term_results(term, exam_types, group_by=('student',)).filter(
                         subject=subject,
-                        term=term,
-                    )
-                    tmp_entry = { 
-                        'student': student,
-                        'exam_objects': [],
-                        'total': 0.0,
+                        student__in=reg_nos,
+                    ).values_list('student', 'total'))
+                    marks = {
+                        (reg_no, exam_type_id): mark for reg_no, exam_type_id, mark in Exam.objects.filter(
+                            student__in=reg_nos,
+                            subject=subject,
+                            term=term,
+                            exam_type__in=exam_types,
+                        ).values_list('student', 'exam_type', 'marks')
                     }
-                    for exam_object in exam_objects:
-                        if exam_object.exam_type.name in [exam_type.name for exam_type in exam_types]:
-                            tmp_entry['exam_objects'].append(exam_object)
-                            tmp_entry['total'] += float(exam_object.marks)
-                    tmp.append(tmp_entry)
-                # sort tmp
-                tmp.sort(key=lambda t: t['total'], reverse=True)
-
-                # output tmp
-                # thead
-                tet = exam_types.count() # total exam types names
-                pdf.set_font('Times', 'B', 13); th = pdf.font_size # text height
-                pdf.cell(epw*0.05, th, 'No.', border=1, align='C') # 0.5% of epw
-                pdf.cell(epw*0.10, th, 'Reg No.', border=1, align='C')
-                pdf.cell(epw*0.30, th, 'Name', border=1, align='C')
-                for exam_type in exam_types:
-                    pdf.cell(epw*(0.40/tet), th, exam_type.name, border=1, align='C')
-                pdf.cell(epw*(0.15/2), th, 'Avg.', border=1, align='C')
-                pdf.cell(epw*(0.15/2), th, 'Grade', border=1, align='C')
-                pdf.ln(th)
-
-                # tbody
-                for i,v in enumerate(tmp):
-                    pdf.set_font('Times', '', 12); th = pdf.font_size
-                    pdf.cell(epw*0.05, th, str(i+1), border=1) # 0.5% of epw
-                    pdf.cell(epw*0.10, th, v['student'].reg_no, border=1)
-                    u = v['student'].user
-                    pdf.cell(epw*0.30, th, '%s %s %s' %(u.first_name, u.middle_name, u.last_name), border=1)
+                    for student in students_list:
+                        tmp.append({
+                            'student': student,
+                            'total': float(totals.get(student.reg_no) or 0),
+                        })
+                    # sort tmp
+                    tmp.sort(key=lambda t: t['total'], reverse=True)
+
+                    # output tmp
+                    # thead
+                    tet = len(exam_types) # total exam types names
+                    pdf.set_font('Times', 'B', 13); th = pdf.font_size # text height
+                    pdf.cell(epw*0.05, th, 'No.', border=1, align='C') # 0.5% of epw
+                    pdf.cell(epw*0.10, th, 'Reg No.', border=1, align='C')
+                    pdf.cell(epw*0.30, th, 'Name', border=1, align='C')
                     for exam_type in exam_types:
-                        marks = 0.0 # get marks
-                        for exam_object in v['exam_objects']:
-                            if exam_object.exam_type.name == exam_type.name:
-                                marks = exam_object.marks
-                                break
-                        pdf.cell(epw*(0.40/tet), th, str(marks), border=1, align='C')
-                    avg = round(v['total'] / tet, 2) # compute avegare
-                    pdf.cell(epw*(0.15/2), th, str(avg), border=1, align='C')
-                    pdf.cell(epw*(0.15/2), th, get_grade(avg), border=1, align='C') # use get_grade utility
+                        pdf.cell(epw*(0.40/tet), th, exam_type.name, border=1, align='C')
+                    pdf.cell(epw*(0.15/2), th, 'Avg.', border=1, align='C')
+                    pdf.cell(epw*(0.15/2), th, 'Grade', border=1, align='C')
                     pdf.ln(th)
 
-
-            response = HttpResponse(pdf.output(dest='S').encode('latin-1'))
-            response['Content-Type'] = 'application/pdf'
-            response['Content-Disposition'] = 'inline; filename="%s.pdf"' %(title)
-
+                    # tbody
+                    for i,v in enumerate(tmp):
+                        pdf.set_font('Times', '', 12); th = pdf.font_size
+                        pdf.cell(epw*0.05, th, str(i+1), border=1) # 0.5% of epw
+                        pdf.cell(epw*0.10, th, v['student'].reg_no, border=1)
+                        u = v['student'].user
+                        pdf.cell(epw*0.30, th, '%s %s %s' %(u.first_name, u.middle_name, u.last_name), border=1)
+                        for exam_type in exam_types:
+                            # '-' if the exam was not sat
+                            mark = marks.get((v['student'].reg_no, exam_type.pk))
+                            pdf.cell(epw*(0.40/tet), th, '-' if mark is None else str(mark), border=1, align='C')
+                        avg = round(v['total'] / tet, 2) # compute avegare
+                        pdf.cell(epw*(0.15/2), th, str(avg), border=1, align='C')
+                        pdf.cell(epw*(0.15/2), th, get_grade(avg), border=1, align='C') # use get_grade utility
+                        pdf.ln(th)
+
+                return '%s.pdf' % title, pdf.output(dest='S').encode('latin-1')
+
+            response = report_response(request, key, build)
             messages.success(request, 'Exam report has been generated.')
             return response
 
@@ -488,6 +540,48 @@ class GenerateExamReportsView(LoginRequiredMixin, View):
             'exam_reports_filter_form': form
         })
     
+class BroadsheetReportView(LoginRequiredMixin, View):
+    '''
+    The broadsheet of a class in a term as a pdf, csv or xlsx file:
+    the students' average in every subject with their total, mean,
+    grade and position.
+    '''
+    form_class = BroadsheetReportFilterForm
+    template_name = 'exam_module/broadsheet_report.html'
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET or None)
+        if not form.is_valid():
+            return render(request, self.template_name, {'broadsheet_report_filter_form': form})
+
+        f = form.cleaned_data.get('form')
+        stream = form.cleaned_data.get('stream')
+        term = form.cleaned_data.get('term')
+        exam_types = form.cleaned_data.get('exam_types')
+        file_type = form.cleaned_data.get('file_type')
+        year = datetime.datetime.now().year
+
+        # repeat requests are served from the reports cache
+        key = get_report_key('broadsheet', {
+            'form': f,
+            'stream': stream.name,
+            'term': term.name,
+            'year': year,
+            'exam_types': sorted(exam_type.name for exam_type in exam_types),
+            'file_type': file_type,
+        })
+
+        def build():
+            students = StudentProfile.objects.in_form(f, year)
+            if stream.name != 'All':
+                students = students.filter(stream=stream)
+            title = 'Form %d %s Broadsheet Term %s %d' % (f, stream.name if stream.name != 'All' else '', term.name, year)
+            title = ' '.join(title.split())
+            broadsheet = get_broadsheet_report(students, exam_types, term)
+            return '%s.%s' % (title, file_type), BROADSHEET_RENDERERS[file_type](title, broadsheet)
+
+        return report_response(request, key, build)
+
 class GenerateResultsSlipPerStudentView(LoginRequiredMixin, View):
     '''
     renders a form to get a student by reg_no, constructs a pdf
@@ -504,118 +598,23 @@ class GenerateResultsSlipPerStudentView(LoginRequiredMixin, View):
             exam_types = form.cleaned_data.get('exam_types_names')
             term_name = form.cleaned_data.get('term_name')
 
-            student = StudentProfile.objects.get(reg_no=reg_no)
+            student = get_identity_map().get(StudentProfile, reg_no=reg_no)
             full_name = '%s %s %s' % (student.user.first_name, student.user.middle_name, student.user.last_name)
 
-            # pdf
-            pdf = FPDF()
-            pdf.add_page()
-
-            # Effective page width, or just epw
-            epw = pdf.w - 2*pdf.l_margin
-
-            # Effective page height, or just eph
-            eph = pdf.h - 2*pdf.b_margin
-
-            # result slip 
-            # header
-            title = 'High School'
-            subtitle = 'Results Slip'
-            pdf.set_font('Times', 'B', 16); th = pdf.font_size
-            pdf.cell(epw, th+2, title, align='C', ln=1)
-            pdf.set_font('Times', 'B', 14); th = pdf.font_size
-            pdf.cell(epw, th+2, subtitle, align='C', ln=1, border='B')
-            pdf.ln(4)
-
-            # table
-            # title
-            pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
-            pdf.cell(epw*0.25, th, 'Registration Number: ')
-            pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.20, th, '%s' % (student.reg_no))
-            pdf.set_font('Times', 'B', 12)
-            pdf.cell(epw*0.20, th, 'Name: ')
-            pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.25, th, '%s' % (full_name), ln=1)
-            pdf.set_font('Times', 'B', 12)
-            pdf.cell(epw*0.25, th, 'Form: ')
-            pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.20, th, '%s %s' % (student.get_form(), student.stream.name))
-            pdf.set_font('Times', 'B', 12)
-            pdf.cell(epw*0.20, th, 'Term: ')
-            pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.25, th, '%s %s' % (term_name, datetime.datetime.now().year), ln=1)
-            pdf.ln(2)
-
-            # thead
-            pdf.set_font('Times', 'B', 12); th = pdf.font_size * 1.5
-            pdf.cell(epw*0.05, th, 'No.', align='C', border=1)
-            pdf.cell(epw*0.40, th, 'Subjects', align='C', border=1)
-            pdf.cell(epw*0.25, th, 'Average', align='C', border=1)
-            pdf.cell(epw*0.25, th, 'Grade', align='C', border=1)
-            pdf.ln()
-
-            # tbody
-            subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student)
-            exam_objects = Exam.objects.filter(student=student, term__name=term_name)
-            tet = exam_types.count() # total exam types requested
-            tmp = []
-            for sd in subjects_done_by_student:
-                tmp_entry = {
-                    'subject': sd,
-                    'total': 0.0,
-                    'avg': 0.0,
-                }
-                for exam_object in exam_objects: # is a subject done by student and has been requested in exam types names
-                    if (exam_object.subject.name == sd.subject.name) and (exam_object.exam_type in exam_types):
-                        tmp_entry['total'] += float(exam_object.marks)
-                tmp_entry['avg'] = round(tmp_entry['total'] / tet, 2)
-                tmp.append(tmp_entry)
-
-            # sort tmp
-            tmp.sort(key=lambda sd: sd['avg'], reverse=True)
-
-            # output tmp
-            pdf.set_font('Times', '', 12); th = pdf.font_size * 1.5
-            for i,v in enumerate(tmp):
-                pdf.cell(epw*0.05, th, str(i+1), border=1)
-                pdf.cell(epw*0.40, th, v['subject'].subject.name.capitalize(), border=1)
-                pdf.cell(epw*0.25, th, str(v['avg']), border=1, align='C')
-                pdf.cell(epw*0.25, th, get_grade(v['avg']), border=1, align='C')
-                pdf.ln()
-
-            # overall grade
-            total = 0.0
-            for tmp_entry in tmp:
-                total += float(tmp_entry['avg'])
-            avg = round(total / len(subjects_done_by_student), 2)
-
-            # output overal grade
-            pdf.ln(2)
-            pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
-            pdf.cell(epw*0.25, th, 'Average: ')
-            pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.75, th, str(avg), ln=1)
-            pdf.set_font('Times', 'B', 12)
-            pdf.cell(epw*0.25, th, 'Grade: ')
-            # pdf.set_font('Times', '', 12)
-            pdf.cell(epw*0.75, th, get_grade(avg), ln=1)
-            pdf.cell(epw*0.25, th, 'Position: ') # student's position
-            pdf.set_font('Times', '', 12)
-            students_list = StudentProfile.objects.filter(form=student.get_form()) # all students in same form
-            position = '%d Out of %d' % (get_student_position(students_list, student, exam_types, term_name), len(students_list))
-            pdf.cell(epw*0.75, th, position, ln=1)
-            
-            # footer
-            pdf.set_font('Arial', '', 10); th = pdf.font_size
-            pdf.set_y(eph - th)
-            now = datetime.datetime.now()
-            pdf.cell(epw, th, 'Printed On: %s/%s/%s' % (now.day, now.month, now.year), align='C')
+            key = get_report_key('results_slip_per_student', {
+                'reg_no': reg_no,
+                'term': term_name.name,
+                'exam_types': sorted(exam_type.name for exam_type in exam_types),
+                'printed_on': datetime.date.today(),
+            })
 
-            response = HttpResponse(pdf.output(dest='S').encode('latin-1'))
-            response['Content-Type'] = 'application/pdf'
-            response['Content-Disposition'] = 'inline; filename="%s.pdf"' %(full_name)
+            def build():
+                # rank among all students in the same form
+                positions = get_class_positions(StudentProfile.objects.in_form(student.get_form()), exam_types, term_name)
+                slips = get_results_slips(StudentProfile.objects.filter(pk=student.pk), exam_types, term_name, positions)
+                return '%s.pdf' % full_name, render_slips(slips, processes=1)
 
+            response = report_response(request, key, build)
             messages.success(request, 'Results slip has been generated.')
             return response
         return render(request, self.template_name, {'form': form})
@@ -636,127 +635,76 @@ class GenerateResultsSlipPerClassView(LoginRequiredMixin, View):
             term = form.cleaned_data.get('term_name')
             exam_types = form.cleaned_data.get('exam_types_names')
 
-            # get students
-            if stream.name == 'All':
-                query_set = StudentProfile.objects.all()
-            else:
-                query_set = StudentProfile.objects.filter(stream=stream)
-            students_list = [s for s in query_set if s.get_form() == f]
+            params = {
+                'form': f,
+                'stream_name': stream.name,
+                'term_name': term.name,
+                'exam_types_names': sorted(exam_type.name for exam_type in exam_types),
+            }
+            key = get_results_slips_per_class_key(**params)
+            if get_cached_report(key) is not None:
+                return report_response(request, key)
+
+            # building the slips of a whole class takes long, run it as a job
+            job = submit_job(
+                'Form %s %s Results Slips' % (f, stream.name),
+                'exam_module.jobs.generate_results_slips_per_class',
+                params,
+                user=request.user,
+                unique=True,
+            )
+            messages.success(request, 'Results slips are being generated.')
+            return redirect(reverse('jobs_module:job_detail', args=[job.pk]))
 
-            # pdf
-            pdf = FPDF()
+        return render(request, self.template_name, {'form': form})
 
-            # Effective page width, or just epw
-            epw = pdf.w - 2*pdf.l_margin
+class SubjectAnalyticsView(LoginRequiredMixin, View):
+    '''
+    Statistics of the marks per subject and stream for the selected
+    forms, streams, terms and exam types.
+    '''
+    form_class = SubjectAnalyticsFilterForm
+    template_name = 'exam_module/subject_analytics.html'
 
-            # Effective page height, or just eph
-            eph = pdf.h - 2*pdf.b_margin
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET or None)
+        context = {'subject_analytics_filter_form': form}
+        if form.is_valid():
+            context['statistics'] = get_subject_statistics(
+                form.cleaned_data.get('terms'),
+                form.cleaned_data.get('exam_types'),
+                form.cleaned_data.get('form'),
+                form.cleaned_data.get('streams'),
+            )
+            context['grades'] = [grade for grade, lower, upper in get_grade_bands()]
+        return render(request, self.template_name, context)
 
-            for student in students_list: # generate results slip for all students found
-                pdf.add_page()
-                
-                # result slip 
-                # header
-                title = 'High School'
-                subtitle = 'Results Slip'
-                pdf.set_font('Times', 'B', 16); th = pdf.font_size
-                pdf.cell(epw, th+2, title, align='C', ln=1)
-                pdf.set_font('Times', 'B', 14); th = pdf.font_size
-                pdf.cell(epw, th+2, subtitle, align='C', ln=1, border='B')
-                pdf.ln(4)
+class SubjectAnalyticsJSONView(LoginRequiredMixin, View):
+    '''
+    The statistics of SubjectAnalyticsView as json, takes the same
+    query parameters.
+    '''
+    form_class = SubjectAnalyticsFilterForm
 
-                # table
-                # title
-                pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
-                pdf.cell(epw*0.25, th, 'Registration Number: ')
-                pdf.set_font('Times', '', 12)
-                pdf.cell(epw*0.20, th, '%s' % (student.reg_no))
-                pdf.set_font('Times', 'B', 12)
-                pdf.cell(epw*0.20, th, 'Name: ')
-                pdf.set_font('Times', '', 12)
-                full_name = '%s %s %s' % (student.user.first_name, student.user.middle_name, student.user.last_name)
-                pdf.cell(epw*0.25, th, '%s' % (full_name), ln=1)
-                pdf.set_font('Times', 'B', 12)
-                pdf.cell(epw*0.25, th, 'Form: ')
-                pdf.set_font('Times', '', 12)
-                pdf.cell(epw*0.20, th, '%s %s' % (student.get_form(), student.stream.name))
-                pdf.set_font('Times', 'B', 12)
-                pdf.cell(epw*0.20, th, 'Term: ')
-                pdf.set_font('Times', '', 12)
-                pdf.cell(epw*0.25, th, '%s %s' % (term.name, datetime.datetime.now().year), ln=1)
-                pdf.ln(2)
-
-                # thead
-                pdf.set_font('Times', 'B', 12); th = pdf.font_size * 1.5
-                pdf.cell(epw*0.05, th, 'No.', align='C', border=1)
-                pdf.cell(epw*0.40, th, 'Subjects', align='C', border=1)
-                pdf.cell(epw*0.25, th, 'Average', align='C', border=1)
-                pdf.cell(epw*0.25, th, 'Grade', align='C', border=1)
-                pdf.ln()
-
-                # tbody
-                subjects_done_by_student = SubjectsDoneByStudent.objects.filter(student=student)
-                exam_objects = Exam.objects.filter(student=student, term=term)
-                tet = exam_types.count() # total exam types requested
-                tmp = []
-                for sd in subjects_done_by_student:
-                    tmp_entry = {
-                        'subject': sd,
-                        'total': 0.0,
-                        'avg': 0.0,
-                    }
-                    for exam_object in exam_objects: # is a subject done by student and has been requested in exam types names
-                        if (exam_object.subject.name == sd.subject.name) and (exam_object.exam_type in exam_types):
-                            tmp_entry['total'] += float(exam_object.marks)
-                    tmp_entry['avg'] = round(tmp_entry['total'] / tet, 2)
-                    tmp.append(tmp_entry)
-
-                # sort tmp
-                tmp.sort(key=lambda sd: sd['avg'], reverse=True)
-
-                # output tmp
-                pdf.set_font('Times', '', 12); th = pdf.font_size * 1.5
-                for i,v in enumerate(tmp):
-                    pdf.cell(epw*0.05, th, str(i+1), border=1)
-                    pdf.cell(epw*0.40, th, v['subject'].subject.name.capitalize(), border=1)
-                    pdf.cell(epw*0.25, th, str(v['avg']), border=1, align='C')
-                    pdf.cell(epw*0.25, th, get_grade(v['avg']), border=1, align='C')
-                    pdf.ln()
-
-                # overall grade
-                total = 0.0
-                for tmp_entry in tmp:
-                    total += float(tmp_entry['avg'])
-                avg = round(total / len(subjects_done_by_student), 2)
-
-                # output overal grade
-                pdf.ln(2)
-                pdf.set_font('Times', 'B', 12); th = pdf.font_size + 1
-                pdf.cell(epw*0.25, th, 'Average: ')
-                pdf.set_font('Times', '', 12)
-                pdf.cell(epw*0.75, th, str(avg), ln=1)
-                pdf.set_font('Times', 'B', 12)
-                pdf.cell(epw*0.25, th, 'Grade: ')
-                # pdf.set_font('Times', '', 12)
-                pdf.cell(epw*0.75, th, get_grade(avg), ln=1)
-                pdf.cell(epw*0.25, th, 'Position: ') # student's position
-                pdf.set_font('Times', '', 12)
-                students_list = StudentProfile.objects.filter(form=student.get_form()) # all students in same form
-                position = '%d Out of %d' % (get_student_position(students_list, student, exam_types, term), len(students_list))
-                pdf.cell(epw*0.75, th, position, ln=1)
-                
-                # footer
-                pdf.set_font('Arial', '', 10); th = pdf.font_size
-                pdf.set_y(eph - th)
-                now = datetime.datetime.now()
-                pdf.cell(epw, th, 'Printed On: %s/%s/%s' % (now.day, now.month, now.year), align='C')
-
-            response = HttpResponse(pdf.output(dest='S').encode('latin-1'))
-            response['Content-Type'] = 'application/pdf'
-            filename = 'Form {form} {stream_name} Results Slips'.format(form=f, stream_name=stream.name)
-            response['Content-Disposition'] = 'inline; filename="%s.pdf"' %(filename)
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        statistics = get_subject_statistics(
+            form.cleaned_data.get('terms'),
+            form.cleaned_data.get('exam_types'),
+            form.cleaned_data.get('form'),
+            form.cleaned_data.get('streams'),
+        )
+        for row in statistics:
+            row['grades'] = dict(row['grades'])
+        return JsonResponse({'statistics': statistics})
 
-            messages.success(request, 'Results slip has been generated.')
-            return response
+class DashboardStatisticsView(LoginRequiredMixin, View):
+    '''
+    The dashboard statistics snapshot as json, null until the first
+    one is computed in the background.
+    '''
 
-        return render(request, self.template_name, {'form': form})
\ No newline at end of file
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'statistics': get_dashboard_statistics()})
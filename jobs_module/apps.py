@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+
+class JobsModuleConfig(AppConfig):
+    name = 'jobs_module'
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs_module.runner import run_pending_jobs, get_worker_name
+
+
+class Command(BaseCommand):
+    '''
+    A worker process for the jobs queue.
+    '''
+    help = 'Run queued jobs. Keeps polling for new jobs unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to wait between polls of an empty queue.')
+
+    def handle(self, *args, **options):
+        worker = get_worker_name()
+        while True:
+            count = run_pending_jobs(worker)
+            if count:
+                self.stdout.write('Ran %d jobs.' % count)
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['poll_interval'])
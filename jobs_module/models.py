@@ -0,0 +1,64 @@
+import json
+
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+
+
+class Job(models.Model):
+    '''
+    A unit of background work, i.e. generating results slips for a
+    whole class. Jobs are queued in this table and picked up by a
+    worker (see runner.py). handler is the dotted path of a function
+    called as handler(job, **params) and returning a tuple
+    (filename, content) that is saved in result, or None if the
+    job makes no file. Finished jobs are deleted after a while
+    (see runner.delete_expired_jobs).
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    handler = models.CharField(max_length=200)
+    params = models.TextField(default='{}')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    # percent done
+    progress = models.IntegerField(default=0)
+    message = models.TextField(blank=True)
+    result = models.FileField(upload_to='jobs/', blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # last sign of life of the worker running the job, see
+    # runner.fail_stale_jobs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return '%s (%s)' % (self.name, self.status)
+
+    def get_params(self):
+        return json.loads(self.params)
+
+    def set_progress(self, done, total):
+        '''
+        Record the progress of a running job, done out of total steps.
+        Written straight to db so that status requests see it, also
+        counts as a heartbeat of the worker.
+        '''
+        self.progress = int(done * 100 / total) if total else 100
+        self.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, heartbeat_at=self.heartbeat_at)
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
@@ -0,0 +1,189 @@
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+def submit_job(name, handler, params, user=None, unique=False):
+    '''
+    Queue a job. handler is the dotted path of the function to run,
+    params a json serializable dict of its keyword arguments. Local
+    workers, if started, are woken once the job is committed.
+    If unique, an unfinished job of the user with the same handler
+    and params is returned instead of queueing another one.
+    '''
+    params = json.dumps(params, sort_keys=True)
+    if unique:
+        # a dead job must not stand in for the new one
+        fail_stale_jobs()
+        job = Job.objects.filter(
+            handler=handler,
+            params=params,
+            created_by=user,
+            status__in=[Job.QUEUED, Job.RUNNING],
+        ).first()
+        if job is not None:
+            return job
+
+    job = Job.objects.create(
+        name=name,
+        handler=handler,
+        params=params,
+        created_by=user,
+    )
+    transaction.on_commit(local_workers.wake)
+    return job
+
+def fail_stale_jobs():
+    '''
+    Fail the running jobs whose worker has given no heartbeat for
+    JOBS_HEARTBEAT_TIMEOUT seconds, i.e. the worker process died or
+    the server stopped while running them. They are not queued again
+    in case the job itself killed the worker. Returns the number of
+    jobs failed.
+    '''
+    now = timezone.now()
+    deadline = now - datetime.timedelta(seconds=settings.JOBS_HEARTBEAT_TIMEOUT)
+    return Job.objects.filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline),
+        status=Job.RUNNING,
+    ).update(
+        status=Job.FAILED,
+        message='The worker running the job stopped.',
+        finished_at=now,
+    )
+
+def claim_job(worker):
+    '''
+    Take the oldest queued job for worker. A job is claimed with a
+    conditional update so that two workers never run the same job.
+    Returns the job or None if the queue is empty.
+    '''
+    while True:
+        job = Job.objects.filter(status=Job.QUEUED).order_by('pk').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            worker=worker,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # taken by another worker, try the next one
+
+def run_job(job):
+    '''
+    Call the handler of a claimed job and store its result. A failing
+    handler marks the job failed with the error as the message.
+    '''
+    try:
+        handler = import_string(job.handler)
+        result = handler(job, **job.get_params())
+        if result is not None:
+            filename, content = result
+            job.result.save(filename, ContentFile(content), save=False)
+    except Exception as e:
+        logger.exception('Job %s failed.', job.pk)
+        job.status = Job.FAILED
+        job.message = str(e) or e.__class__.__name__
+    else:
+        job.status = Job.DONE
+        job.progress = 100
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'progress', 'result', 'finished_at'])
+    return job
+
+def delete_expired_jobs():
+    '''
+    Delete the jobs finished more than JOBS_RETENTION_DAYS ago and
+    their result files. Returns the number of jobs deleted.
+    '''
+    deadline = timezone.now() - datetime.timedelta(days=settings.JOBS_RETENTION_DAYS)
+    jobs = list(Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=deadline))
+    for job in jobs:
+        if job.result:
+            job.result.delete(save=False)
+    Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+    return len(jobs)
+
+def run_pending_jobs(worker=None):
+    '''
+    Run queued jobs until the queue is empty. Returns the number of
+    jobs run.
+    '''
+    worker = worker or get_worker_name()
+    fail_stale_jobs()
+    delete_expired_jobs()
+    count = 0
+    while True:
+        job = claim_job(worker)
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
+
+def get_worker_name():
+    return '%s:%s:%s' % (socket.gethostname(), os.getpid(), threading.current_thread().name)
+
+class LocalWorkers:
+    '''
+    A pool of threads inside the web server process, for the desktop
+    deployment (server.pyw) where no separate worker is run. Threads
+    sleep until woken by submit_job or poll_interval elapses.
+    '''
+
+    def __init__(self):
+        self.threads = []
+        self.event = threading.Event()
+        self.stopping = False
+
+    def start(self, count=None, poll_interval=5):
+        count = settings.JOBS_LOCAL_WORKERS if count is None else count
+        for i in range(count - len(self.threads)):
+            thread = threading.Thread(
+                target=self.work,
+                args=(poll_interval,),
+                name='jobs-worker-%d' % (len(self.threads) + 1),
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+        self.wake() # pick up jobs queued while the server was down
+
+    def stop(self):
+        self.stopping = True
+        self.wake()
+
+    def wake(self):
+        if self.threads:
+            self.event.set()
+
+    def work(self, poll_interval):
+        while not self.stopping:
+            self.event.wait(poll_interval)
+            self.event.clear()
+            try:
+                run_pending_jobs()
+            except Exception:
+                logger.exception('Local jobs worker error.')
+            finally:
+                # each thread has its own connection
+                close_old_connections()
+
+local_workers = LocalWorkers()
@@ -0,0 +1,143 @@
+import datetime
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from django_webtest import WebTest
+
+from accounts.tests import create_user
+
+from .models import Job
+from .runner import submit_job, claim_job, run_job, run_pending_jobs, delete_expired_jobs
+
+
+def echo(job, text):
+    job.set_progress(1, 2)
+    return 'echo.txt', text.encode()
+
+def fail(job):
+    raise ValueError('Something went wrong.')
+
+
+class JobRunnerTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_claim_job(self):
+        '''
+        Jobs are claimed oldest first and only once.
+        '''
+        first = submit_job('first', 'jobs_module.tests.echo', {'text': '1'})
+        second = submit_job('second', 'jobs_module.tests.echo', {'text': '2'})
+        self.assertEqual(claim_job('worker-1'), first)
+        job = claim_job('worker-2')
+        self.assertEqual(job, second)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.worker, 'worker-2')
+        self.assertIsNone(claim_job('worker-1'))
+
+    def test_submit_unique_job(self):
+        '''
+        An unfinished job with the same params is reused.
+        '''
+        first = submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True)
+        self.assertEqual(submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True), first)
+        self.assertNotEqual(submit_job('echo', 'jobs_module.tests.echo', {'text': '2'}, unique=True), first)
+        run_pending_jobs()
+        self.assertNotEqual(submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True), first)
+
+    def test_stale_job_is_failed(self):
+        '''
+        A running job whose worker stopped giving heartbeats is failed
+        and no longer stands in for a new unique job.
+        '''
+        first = submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True)
+        claim_job('worker')
+        self.assertEqual(submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True), first)
+        Job.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(hours=1))
+        second = submit_job('echo', 'jobs_module.tests.echo', {'text': '1'}, unique=True)
+        self.assertNotEqual(second, first)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.FAILED)
+        self.assertEqual(first.message, 'The worker running the job stopped.')
+        self.assertEqual(run_pending_jobs(), 1)
+
+    def test_run_job(self):
+        submit_job('echo', 'jobs_module.tests.echo', {'text': 'hello'})
+        job = run_job(claim_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertIsNotNone(job.finished_at)
+        with job.result.open('rb') as f:
+            self.assertEqual(f.read(), b'hello')
+
+    def test_expired_jobs_deleted(self):
+        '''
+        Jobs finished JOBS_RETENTION_DAYS ago are deleted with their
+        result files, the others are kept.
+        '''
+        submit_job('old', 'jobs_module.tests.echo', {'text': 'old'})
+        submit_job('new', 'jobs_module.tests.echo', {'text': 'new'})
+        run_pending_jobs()
+        old = Job.objects.get(name='old')
+        path = old.result.path
+        Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - datetime.timedelta(days=8))
+        self.assertEqual(delete_expired_jobs(), 1)
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['new'])
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_job(self):
+        submit_job('fail', 'jobs_module.tests.fail', {})
+        submit_job('echo', 'jobs_module.tests.echo', {'text': 'hello'})
+        with self.assertLogs('jobs_module.runner', 'ERROR'):
+            self.assertEqual(run_pending_jobs(), 2)
+        failed = Job.objects.get(name='fail')
+        self.assertEqual(failed.status, Job.FAILED)
+        self.assertEqual(failed.message, 'Something went wrong.')
+        self.assertEqual(Job.objects.get(name='echo').status, Job.DONE)
+
+class JobViewsTests(WebTest):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = create_user('teacher', 'pass')
+        self.job = submit_job('echo', 'jobs_module.tests.echo', {'text': 'hello'}, user=self.user)
+
+    def test_status(self):
+        response = self.app.get(reverse('jobs_module:job_status', args=[self.job.pk]), user='teacher')
+        self.assertEqual(response.json['status'], Job.QUEUED)
+        self.assertIsNone(response.json['download_url'])
+
+        run_pending_jobs()
+        response = self.app.get(reverse('jobs_module:job_status', args=[self.job.pk]), user='teacher')
+        self.assertEqual(response.json['status'], Job.DONE)
+        self.assertEqual(response.json['progress'], 100)
+
+        page = self.app.get(response.json['download_url'], user='teacher')
+        self.assertEqual(page.body, b'hello')
+
+    def test_detail(self):
+        page = self.app.get(reverse('jobs_module:job_detail', args=[self.job.pk]), user='teacher')
+        self.assertContains(page, 'echo')
+        self.assertContains(page, reverse('jobs_module:job_status', args=[self.job.pk]))
+
+    def test_download_before_done(self):
+        self.app.get(reverse('jobs_module:job_download', args=[self.job.pk]), user='teacher', status=404)
+
+    def test_other_users_jobs_not_found(self):
+        create_user('other', 'pass')
+        self.app.get(reverse('jobs_module:job_status', args=[self.job.pk]), user='other', status=404)
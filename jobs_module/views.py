@@ -0,0 +1,55 @@
+import os
+
+from django.shortcuts import render, get_object_or_404, reverse
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views import View
+from django.http import JsonResponse, FileResponse, Http404
+
+from .models import Job
+
+
+def get_job_or_404(request, job_id):
+    '''
+    Jobs are only visible to the user who submitted them and staff.
+    '''
+    job = get_object_or_404(Job, pk=job_id)
+    if job.created_by_id != request.user.pk and not request.user.is_staff:
+        raise Http404
+    return job
+
+class JobDetailView(LoginRequiredMixin, View):
+    '''
+    Show the progress of a job and a download link once it is done.
+    '''
+    template_name = 'jobs_module/job_detail.html'
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_job_or_404(request, job_id)
+        return render(request, self.template_name, {'job': job})
+
+class JobStatusView(LoginRequiredMixin, View):
+    '''
+    The status and progress of a job as json, polled by job_detail.html.
+    '''
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_job_or_404(request, job_id)
+        return JsonResponse({
+            'id': job.pk,
+            'name': job.name,
+            'status': job.status,
+            'progress': job.progress,
+            'message': job.message,
+            'download_url': reverse('jobs_module:job_download', args=[job.pk]) if job.status == Job.DONE and job.result else None,
+        })
+
+class JobDownloadView(LoginRequiredMixin, View):
+    '''
+    Serve the result of a finished job.
+    '''
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_job_or_404(request, job_id)
+        if job.status != Job.DONE or not job.result:
+            raise Http404
+        return FileResponse(job.result.open('rb'), filename=os.path.basename(job.result.name))
@@ -12,6 +12,8 @@ import django; django.setup()
 from django.conf import settings
 from django.core.handlers.wsgi import WSGIHandler
 
+from jobs_module.runner import local_workers
+
 
 class DjangoApplication(object):
     HOST = "127.0.0.1"
@@ -46,6 +48,10 @@ class DjangoApplication(object):
         cherrypy.tree.graft(WSGIHandler())
         cherrypy.engine.start()
 
+        # run background jobs i.e. results slips in this process
+        local_workers.start(settings.JOBS_LOCAL_WORKERS)
+        cherrypy.engine.subscribe('stop', local_workers.stop)
+
         self.open_browser()
 
         cherrypy.engine.block()
@@ -0,0 +1 @@
+default_app_config = 'settings_module.apps.SettingsModuleConfig'
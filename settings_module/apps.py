@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SettingsModuleConfig(AppConfig):
     name = 'settings_module'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import Stream
+from exam_module.models import GradingSystem, Subject, ExamType, Term
+from exam_module.utils import grade_resolver
+from exam_module.reference_data import bump_reference_version
+
+
+@receiver(post_save, sender=GradingSystem)
+@receiver(post_delete, sender=GradingSystem)
+def invalidate_grade_resolver(sender, **kwargs):
+    '''
+    Make every process reload the grading system, again on commit
+    so that no process caches the uncommitted bounds.
+    '''
+    grade_resolver.invalidate()
+    transaction.on_commit(grade_resolver.invalidate)
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=ExamType)
+@receiver(post_delete, sender=ExamType)
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+@receiver(post_save, sender=Stream)
+@receiver(post_delete, sender=Stream)
+def invalidate_reference_data(sender, **kwargs):
+    '''
+    Make every process reload the choices of the forms, again on
+    commit so that no process caches the uncommitted rows.
+    '''
+    bump_reference_version()
+    transaction.on_commit(bump_reference_version)
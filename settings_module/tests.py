@@ -1,3 +1,5 @@
+import decimal
+
 from django.test import TestCase
 from django.urls import reverse
 
@@ -8,6 +10,18 @@ from .forms import (
     AddGradingSystemForm,
 )
 
+from django import forms
+
+from exam_module.models import GradingSystem, Subject, Term
+from exam_module.utils import GRADING_VERSION_KEY, GradeResolver, grade_resolver, get_grade, get_grades
+from exam_module.report_cache import get_versions_cache, version_scope
+from exam_module.reference_data import (
+    ReferenceChoiceField,
+    ReferenceMultipleChoiceField,
+    REFERENCE_VERSION_KEY,
+    bump_reference_version,
+)
+
 
 class HomeViewTests(WebTest):
 
@@ -192,3 +206,113 @@ class AddGradingSystemViewTests(WebTest):
         self.assertContains(page, 'C-')
         self.assertContains(page, '45')
         # self.assertContains(page, reverse('settings_module:delete_grading_system', args=(1,)))
+
+class GradeResolverTests(TestCase):
+    '''
+    The grading system is cached in process and reloaded by every
+    process when it changes.
+    '''
+    def setUp(self):
+        grade_resolver.invalidate()
+        GradingSystem.objects.create(grade='A', greatest_lower_bound=80)
+        GradingSystem.objects.create(grade='B', greatest_lower_bound=60)
+        GradingSystem.objects.create(grade='C', greatest_lower_bound=40)
+
+    def test_get_grade(self):
+        self.assertEqual(get_grade(80), 'A')
+        self.assertEqual(get_grade(79.99), 'B')
+        self.assertEqual(get_grade(decimal.Decimal('40.00')), 'C')
+        self.assertEqual(get_grade(39.99), '**')
+
+    def test_get_grades(self):
+        self.assertEqual(get_grades([95, 60, 10]), ['A', 'B', '**'])
+
+    def test_grading_system_loaded_once(self):
+        get_grade(50)
+        with self.assertNumQueries(0):
+            get_grades([50, 70, 90])
+
+    def test_invalidated_on_save_and_delete(self):
+        self.assertEqual(get_grade(30), '**')
+        d = GradingSystem.objects.create(grade='D', greatest_lower_bound=30)
+        self.assertEqual(get_grade(30), 'D')
+        d.delete()
+        self.assertEqual(get_grade(30), '**')
+
+    def test_invalidated_in_other_processes(self):
+        # the resolver of e.g. a job worker, loaded before the change
+        other = GradeResolver()
+        self.assertEqual(other.get_grade(30), '**')
+        GradingSystem.objects.create(grade='D', greatest_lower_bound=30)
+        self.assertEqual(other.get_grade(30), 'D')
+
+    def test_version_read_once_per_scope(self):
+        with version_scope():
+            self.assertEqual(get_grade(30), '**')
+            # changed by another process, seen by the next scope only
+            get_versions_cache().set(GRADING_VERSION_KEY, 'other', None)
+            GradingSystem.objects.bulk_create([GradingSystem(grade='D', greatest_lower_bound=30)])
+            with self.assertNumQueries(0):
+                self.assertEqual(get_grades([30, 90]), ['**', 'A'])
+        with version_scope():
+            self.assertEqual(get_grade(30), 'D')
+
+    def test_invalidated_in_the_same_scope(self):
+        with version_scope():
+            self.assertEqual(get_grade(30), '**')
+            GradingSystem.objects.create(grade='D', greatest_lower_bound=30)
+            self.assertEqual(get_grade(30), 'D')
+
+class ReferenceDataTests(WebTest):
+    '''
+    The choices of subjects, exam types, terms and streams are
+    cached in process until the reference version is bumped.
+    '''
+    fixtures = ['subjects', 'terms']
+
+    def setUp(self):
+        bump_reference_version()
+        self.field = ReferenceChoiceField(queryset=Subject.objects, to_field_name='name', empty_label=None)
+
+    def get_choices(self):
+        return [value for value, label in ReferenceChoiceField(queryset=Subject.objects, to_field_name='name', empty_label=None).choices]
+
+    def test_served_from_memory(self):
+        self.assertIn('Biology', self.get_choices())
+        with self.assertNumQueries(0):
+            self.assertIn('Biology', self.get_choices())
+            self.assertEqual(self.field.clean('Biology').name, 'Biology')
+        with self.assertRaises(forms.ValidationError):
+            self.field.clean('Astronomy')
+
+    def test_multiple_choice(self):
+        field = ReferenceMultipleChoiceField(queryset=Term.objects, to_field_name='name')
+        self.assertEqual([term.name for term in field.clean(['1', '3'])], ['1', '3'])
+        with self.assertRaises(forms.ValidationError):
+            field.clean(['1', '9'])
+
+    def test_reloaded_after_a_change(self):
+        self.get_choices()
+        page = self.app.get(reverse('settings_module:add_subject'), user='staff')
+        page.form['name'] = 'astronomy'
+        page.form.submit()
+        self.assertIn('Astronomy', self.get_choices())
+        Subject.objects.get(name='Astronomy').delete()
+        self.assertNotIn('Astronomy', self.get_choices())
+
+    def test_reloaded_after_a_bump_by_another_process(self):
+        self.get_choices()
+        # e.g. another worker, the reference version is shared
+        bump_reference_version()
+        with self.assertNumQueries(1):
+            self.get_choices()
+
+    def test_version_read_once_per_scope(self):
+        with version_scope():
+            self.get_choices()
+            # changed by another process, seen by the next scope only
+            get_versions_cache().set(REFERENCE_VERSION_KEY, 'other', None)
+            with self.assertNumQueries(0):
+                self.get_choices()
+        with version_scope(), self.assertNumQueries(1):
+            self.get_choices()
@@ -0,0 +1,84 @@
+/* Autosave of the marks entry grid. Changed cells are sent to the
+   autosave endpoint in debounced batches. */
+
+(function () {
+    'use strict'
+
+    var form = document.getElementById('students-exams-entry-form')
+    if (!form || !form.dataset.autosaveUrl) {
+      return
+    }
+    var status = $('#autosave-status')
+    var changed = {} // reg_no => marks, waiting to be sent
+    var timer = null
+    var saving = false
+
+    function field(name) {
+      return form.elements[name].value
+    }
+
+    function regNo(input) {
+      return input.name.slice(0, -'_marks'.length)
+    }
+
+    function save() {
+      var marks = changed
+      if (saving || $.isEmptyObject(marks)) {
+        return
+      }
+      changed = {}
+      saving = true
+      status.text('Saving...')
+      $.ajax({
+        url: form.dataset.autosaveUrl,
+        method: 'POST',
+        contentType: 'application/json',
+        headers: { 'X-CSRFToken': field('csrfmiddlewaretoken') },
+        data: JSON.stringify({
+          subject_name: field('subject_name'),
+          exam_type_name: field('exam_type_name'),
+          term_name: field('term_name'),
+          date_done: field('date_done'),
+          marks: marks
+        })
+      }).done(function (data) {
+        data.saved.forEach(function (reg_no) {
+          $(form.elements[reg_no + '_marks']).removeClass('is-invalid').attr('title', '')
+        })
+        $.each(data.errors, function (reg_no, message) {
+          $(form.elements[reg_no + '_marks']).addClass('is-invalid').attr('title', message)
+        })
+        status.text($.isEmptyObject(data.errors) ? 'All changes saved.' : 'Some marks have errors.')
+        saving = false
+        schedule(800)
+      }).fail(function () {
+        // send them again with the next batch, a while later
+        changed = $.extend(marks, changed)
+        status.text('Changes could not be saved, retrying.')
+        saving = false
+        schedule(5000)
+      })
+    }
+
+    function schedule(delay) {
+      clearTimeout(timer)
+      if (!$.isEmptyObject(changed)) {
+        timer = setTimeout(save, delay)
+      }
+    }
+
+    $(form).on('input', '.marks', function () {
+      // blank cells have no marks to save, cleared marks are not
+      // deleted but reported when the form is submitted
+      if (this.value === '') {
+        delete changed[regNo(this)]
+        if (form.elements[regNo(this) + '_original'].value !== '') {
+          $(this).addClass('is-invalid').attr('title', 'Marks cannot be cleared.')
+        }
+        return
+      }
+      changed[regNo(this)] = this.value
+      status.text('Unsaved changes.')
+      schedule(800)
+    })
+  }())
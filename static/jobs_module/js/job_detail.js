@@ -0,0 +1,30 @@
+/* Poll the status of a job until it is done or failed. */
+
+(function () {
+    'use strict'
+
+    var job = document.getElementById('job')
+    if (!job) {
+        return
+    }
+
+    function poll() {
+        $.getJSON(job.dataset.statusUrl, function (data) {
+            $('#job-status').text(data.status.charAt(0).toUpperCase() + data.status.slice(1))
+            $('#job-progress')
+                .css('width', data.progress + '%')
+                .attr('aria-valuenow', data.progress)
+                .text(data.progress + '%')
+
+            if (data.status === 'done') {
+                $('#job-download').attr('href', data.download_url).removeClass('d-none')
+            } else if (data.status === 'failed') {
+                $('#job-message').text(data.message)
+            } else {
+                setTimeout(poll, 2000)
+            }
+        })
+    }
+
+    poll()
+}())
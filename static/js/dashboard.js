@@ -5,49 +5,106 @@
   
     feather.replace()
   
-    // Graphs
-    var ctx = document.getElementById('myChart')
-    // eslint-disable-next-line no-unused-vars
-    var myChart = new Chart(ctx, {
-      type: 'line',
-      data: {
-        labels: [
-          'Sunday',
-          'Monday',
-          'Tuesday',
-          'Wednesday',
-          'Thursday',
-          'Friday',
-          'Saturday'
-        ],
-        datasets: [{
-          data: [
-            15339,
-            21345,
-            18483,
-            24003,
-            23489,
-            24092,
-            12034
-          ],
-          lineTension: 0,
-          backgroundColor: 'transparent',
-          borderColor: '#007bff',
-          borderWidth: 4,
-          pointBackgroundColor: '#007bff'
-        }]
-      },
-      options: {
-        scales: {
-          yAxes: [{
-            ticks: {
-              beginAtZero: false
+    // Graphs, only on the dashboard home
+    var statistics = document.getElementById('dashboard-statistics')
+    if (!statistics) {
+      return
+    }
+
+    var colors = ['#007bff', '#28a745', '#ffc107', '#dc3545', '#17a2b8', '#6c757d']
+
+    function drawEnrolment(enrolment) {
+      // eslint-disable-next-line no-unused-vars
+      var enrolmentChart = new Chart(document.getElementById('enrolment-chart'), {
+        type: 'bar',
+        data: {
+          labels: enrolment.forms.map(function (form) { return 'Form ' + form }),
+          datasets: enrolment.streams.map(function (stream, i) {
+            return {
+              label: stream.stream.charAt(0).toUpperCase() + stream.stream.slice(1),
+              data: stream.counts,
+              backgroundColor: colors[i % colors.length]
             }
-          }]
+          })
         },
-        legend: {
-          display: false
+        options: {
+          scales: {
+            xAxes: [{ stacked: true }],
+            yAxes: [{ stacked: true, ticks: { beginAtZero: true, precision: 0 } }]
+          }
         }
+      })
+    }
+
+    function drawCompleteness(completeness) {
+      if (completeness.term) {
+        $('#completeness-term').text('Term ' + completeness.term + ', ' + completeness.year)
       }
-    })
+      // eslint-disable-next-line no-unused-vars
+      var completenessChart = new Chart(document.getElementById('completeness-chart'), {
+        type: 'horizontalBar',
+        data: {
+          labels: completeness.subjects.map(function (subject) { return subject.subject }),
+          datasets: [{
+            data: completeness.subjects.map(function (subject) { return subject.percent }),
+            backgroundColor: '#007bff'
+          }]
+        },
+        options: {
+          scales: {
+            xAxes: [{ ticks: { beginAtZero: true, max: 100 } }]
+          },
+          legend: {
+            display: false
+          }
+        }
+      })
+    }
+
+    function drawTrends(trends) {
+      // eslint-disable-next-line no-unused-vars
+      var trendsChart = new Chart(document.getElementById('trends-chart'), {
+        type: 'line',
+        data: {
+          labels: trends.map(function (trend) { return trend.year + ' T' + trend.term }),
+          datasets: [{
+            data: trends.map(function (trend) { return trend.mean }),
+            lineTension: 0,
+            backgroundColor: 'transparent',
+            borderColor: '#007bff',
+            borderWidth: 4,
+            pointBackgroundColor: '#007bff'
+          }]
+        },
+        options: {
+          scales: {
+            yAxes: [{
+              ticks: {
+                beginAtZero: false
+              }
+            }]
+          },
+          legend: {
+            display: false
+          }
+        }
+      })
+    }
+
+    // the snapshot is computed in the background, wait for the first one
+    function load() {
+      $.getJSON(statistics.dataset.url, function (data) {
+        if (!data.statistics) {
+          $('#dashboard-statistics-status').text('Statistics are being computed.')
+          setTimeout(load, 5000)
+          return
+        }
+        $('#dashboard-statistics-status').text('Updated ' + data.statistics.computed_at.replace('T', ' '))
+        drawEnrolment(data.statistics.enrolment)
+        drawCompleteness(data.statistics.completeness)
+        drawTrends(data.statistics.trends)
+      })
+    }
+
+    load()
   }())
\ No newline at end of file
@@ -0,0 +1,41 @@
+(function () {
+    'use strict'
+
+    var input = document.getElementById('student-search')
+    if (!input) {
+      return
+    }
+    var results = $('#student-search-results')
+    var timer = null
+    var request = null
+
+    function showResults(students) {
+      results.empty()
+      students.forEach(function (student) {
+        $('<a class="list-group-item list-group-item-action"></a>')
+          .attr('href', student.url)
+          .text(student.reg_no + ' - ' + student.name + ' (Form ' + student.form + ' ' + student.stream + ')')
+          .appendTo(results)
+      })
+    }
+
+    function search() {
+      var q = input.value.trim()
+      if (request) {
+        request.abort()
+      }
+      if (!q) {
+        results.empty()
+        return
+      }
+      request = $.getJSON(input.dataset.url, { q: q }, function (data) {
+        showResults(data.results)
+      })
+    }
+
+    // wait for a pause in typing before searching
+    input.addEventListener('input', function () {
+      clearTimeout(timer)
+      timer = setTimeout(search, 150)
+    })
+  }())